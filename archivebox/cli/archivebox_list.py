@@ -120,7 +120,7 @@ def main(args: Optional[List[str]]=None, stdin: Optional[IO]=None, pwd: Optional
         )
         raise SystemExit(2)
 
-    matching_folders = list_all(
+    num_matching_folders = list_all(
         filter_patterns=command.filter_patterns,
         filter_type=command.filter_type,
         status=command.status,
@@ -133,7 +133,7 @@ def main(args: Optional[List[str]]=None, stdin: Optional[IO]=None, pwd: Optional
         with_headers=command.with_headers,
         out_dir=pwd or OUTPUT_DIR,
     )
-    raise SystemExit(not matching_folders)
+    raise SystemExit(not num_matching_folders)
 
 if __name__ == '__main__':
     main(args=sys.argv[1:], stdin=sys.stdin)
@@ -10,7 +10,7 @@ from typing import Optional, List, IO
 
 from ..main import server
 from ..util import docstring
-from ..config import OUTPUT_DIR, BIND_ADDR
+from ..config import OUTPUT_DIR, BIND_ADDR, SERVER_WORKERS, SERVER_THREADS, SERVER_MAX_REQUESTS
 from ..logging_util import SmartFormatter, reject_stdin
 
 @docstring(server.__doc__)
@@ -43,6 +43,24 @@ def main(args: Optional[List[str]]=None, stdin: Optional[IO]=None, pwd: Optional
         action='store_true',
         help='Force runserver to run in single-threaded mode',
     )
+    parser.add_argument(
+        '--workers', '-w',
+        type=int,
+        default=SERVER_WORKERS,
+        help='Run a production prefork server (gunicorn) with this many worker processes instead of runserver',
+    )
+    parser.add_argument(
+        '--threads',
+        type=int,
+        default=SERVER_THREADS,
+        help='Number of threads per worker process (only with --workers)',
+    )
+    parser.add_argument(
+        '--max-requests',
+        type=int,
+        default=SERVER_MAX_REQUESTS,
+        help='Restart each worker after it has handled this many requests, 0 to never restart (only with --workers)',
+    )
     parser.add_argument(
         '--init',
         action='store_true',
@@ -68,6 +86,9 @@ def main(args: Optional[List[str]]=None, stdin: Optional[IO]=None, pwd: Optional
         init=command.init,
         quick_init=command.quick_init,
         createsuperuser=command.createsuperuser,
+        workers=command.workers,
+        threads=command.threads,
+        max_requests=command.max_requests,
         out_dir=pwd or OUTPUT_DIR,
     )
 
@@ -22,10 +22,18 @@ def main(args: Optional[List[str]]=None, stdin: Optional[IO]=None, pwd: Optional
         add_help=True,
         formatter_class=SmartFormatter,
     )
-    parser.parse_args(args or ())
+    parser.add_argument(
+        '--recount',
+        action='store_true',
+        help='Re-measure the size of every snapshot dir and archive method output (in parallel) instead of using the stored totals',
+    )
+    command = parser.parse_args(args or ())
     reject_stdin(__command__, stdin)
 
-    status(out_dir=pwd or OUTPUT_DIR)
+    status(
+        recount=command.recount,
+        out_dir=pwd or OUTPUT_DIR,
+    )
 
 
 if __name__ == '__main__':
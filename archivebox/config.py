@@ -79,6 +79,8 @@ CONFIG_SCHEMA: Dict[str, ConfigDefaultDict] = {
         'URL_BLACKLIST':            {'type': str,   'default': r'\.(css|js|otf|ttf|woff|woff2|gstatic\.com|googleapis\.com/css)(\?.*)?$'},  # to avoid downloading code assets as their own pages
         'URL_WHITELIST':            {'type': str,   'default': None},
         'ENFORCE_ATOMIC_WRITES':    {'type': bool,  'default': True},
+        'ENFORCE_TYPES':            {'type': bool,  'default': True},               # set to False in production to skip runtime arg typechecking
+        'SAVE_SNAPSHOT_HTML_INDEX': {'type': bool,  'default': True},               # also write archive/<timestamp>/index.html for browsing the archive without the server
     },
 
     'SERVER_CONFIG': {
@@ -93,6 +95,12 @@ CONFIG_SCHEMA: Dict[str, ConfigDefaultDict] = {
         'SNAPSHOTS_PER_PAGE':       {'type': int,   'default': 40},
         'CUSTOM_TEMPLATES_DIR':     {'type': str,   'default': None},
         'TIME_ZONE':                {'type': str,   'default': 'UTC'},
+        'SENDFILE_HEADER':          {'type': str,   'default': None},                   # X-Accel-Redirect (nginx) or X-Sendfile (apache/lighttpd) to let a fronting proxy send archive files
+        'SENDFILE_URL_PREFIX':      {'type': str,   'default': '/_archivebox_data/'},   # internal nginx location that maps to OUTPUT_DIR, only used for X-Accel-Redirect
+        'SERVER_WORKERS':           {'type': int,   'default': 0},                      # >0 to run a prefork gunicorn server with this many worker processes instead of runserver
+        'SERVER_THREADS':           {'type': int,   'default': 4},                      # threads per worker process
+        'SERVER_MAX_REQUESTS':      {'type': int,   'default': 1000},                   # recycle each worker after this many requests (0 to never recycle)
+        'SERVER_TIMEOUT':           {'type': int,   'default': 60},                     # seconds before a stuck worker is killed and replaced
     },
 
     'ARCHIVE_METHOD_TOGGLES': {
@@ -166,7 +174,7 @@ CONFIG_SCHEMA: Dict[str, ConfigDefaultDict] = {
     'SEARCH_BACKEND_CONFIG' : {
         'USE_INDEXING_BACKEND':     {'type': bool,  'default': True},
         'USE_SEARCHING_BACKEND':    {'type': bool,  'default': True},
-        'SEARCH_BACKEND_ENGINE':    {'type': str,   'default': 'ripgrep'},
+        'SEARCH_BACKEND_ENGINE':    {'type': str,   'default': 'ripgrep'},    # ripgrep, sqlite_fts, or sonic
         'SEARCH_BACKEND_HOST_NAME': {'type': str,   'default': 'localhost'},
         'SEARCH_BACKEND_PORT':      {'type': int,   'default': 1491},
         'SEARCH_BACKEND_PASSWORD':  {'type': str,   'default': 'SecretPassword'},
@@ -174,6 +182,7 @@ CONFIG_SCHEMA: Dict[str, ConfigDefaultDict] = {
         'SONIC_COLLECTION':         {'type': str,   'default': 'archivebox'},
         'SONIC_BUCKET':             {'type': str,   'default': 'snapshots'},
         'SEARCH_BACKEND_TIMEOUT':   {'type': int,   'default': 90},
+        'SEARCH_BACKEND_THREADS':   {'type': int,   'default': 4},        # snapshots indexed in parallel by update --index-only, and sonic connections kept open
     },
 
     'DEPENDENCY_CONFIG': {
@@ -232,6 +241,8 @@ ARCHIVE_DIR_NAME = 'archive'
 SOURCES_DIR_NAME = 'sources'
 LOGS_DIR_NAME = 'logs'
 SQL_INDEX_FILENAME = 'index.sqlite3'
+CACHE_DB_FILENAME = 'cache.sqlite3'
+SEARCH_INDEX_FILENAME = 'search.sqlite3'
 JSON_INDEX_FILENAME = 'index.json'
 HTML_INDEX_FILENAME = 'index.html'
 ROBOTS_TXT_FILENAME = 'robots.txt'
@@ -309,6 +320,12 @@ ALLOWED_IN_OUTPUT_DIR = {
     SQL_INDEX_FILENAME,
     f'{SQL_INDEX_FILENAME}-wal',
     f'{SQL_INDEX_FILENAME}-shm',
+    CACHE_DB_FILENAME,
+    f'{CACHE_DB_FILENAME}-wal',
+    f'{CACHE_DB_FILENAME}-shm',
+    SEARCH_INDEX_FILENAME,
+    f'{SEARCH_INDEX_FILENAME}-wal',
+    f'{SEARCH_INDEX_FILENAME}-shm',
     JSON_INDEX_FILENAME,
     HTML_INDEX_FILENAME,
     ROBOTS_TXT_FILENAME,
@@ -1171,7 +1188,8 @@ def setup_django(out_dir: Path=None, check_db=False, config: ConfigDict=CONFIG,
                 if current_mode != 'wal':
                     cursor.execute("PRAGMA journal_mode=wal;")
 
-            # Create cache table in DB if needed
+            # Create the cache db/table if needed (SQLiteCache creates its file on first use,
+            # the createcachetable fallback is for anyone who switches CACHE_BACKEND to the DatabaseCache)
             try:
                 from django.core.cache import cache
                 cache.get('test', None)
@@ -1,10 +1,5 @@
 __package__ = 'archivebox.core'
 
-from io import StringIO
-from pathlib import Path
-from contextlib import redirect_stdout
-from datetime import datetime, timezone
-
 from django.contrib import admin
 from django.urls import path
 from django.utils.html import format_html
@@ -12,19 +7,22 @@ from django.utils.safestring import mark_safe
 from django.shortcuts import render, redirect
 from django.contrib.auth import get_user_model
 from django import forms
+from django.db.models import Count
 
-from ..util import htmldecode, urldecode, ansi_to_html
+from ..util import htmldecode, urldecode
+from ..index.sql import add_tag_ids_to_snapshots, remove_tag_ids_from_snapshots, touch_snapshots, sql_writer
 
-from core.models import Snapshot, ArchiveResult, Tag
+from core.models import Snapshot, ArchiveResult, Tag, Task, APIToken
 from core.forms import AddLinkForm
 
 from core.mixins import SearchResultsAdminMixin
+from core.paginators import KeysetPaginator, KeysetChangeList
+from core.tasks import enqueue_task
 
 from index.html import snapshot_icons
 from logging_util import printable_filesize
-from main import add, remove
+from main import remove
 from config import OUTPUT_DIR, SNAPSHOTS_PER_PAGE
-from extractors import archive_links
 
 # Admin URLs
 # /admin/
@@ -80,7 +78,7 @@ class SnapshotActionForm(ActionForm):
 
 class SnapshotAdmin(SearchResultsAdminMixin, admin.ModelAdmin):
     list_display = ('added', 'title_str', 'files', 'size', 'url_str')
-    sort_fields = ('title_str', 'url_str', 'added', 'files')
+    sort_fields = ('title_str', 'url_str', 'added', 'files', 'size')
     readonly_fields = ('info', 'bookmarked', 'added', 'updated')
     search_fields = ('id', 'url', 'timestamp', 'title', 'tags__name')
     fields = ('timestamp', 'url', 'title', 'tags', *readonly_fields)
@@ -90,9 +88,23 @@ class SnapshotAdmin(SearchResultsAdminMixin, admin.ModelAdmin):
     autocomplete_fields = ['tags']
     inlines = [ArchiveResultInline]
     list_per_page = SNAPSHOTS_PER_PAGE
+    show_full_result_count = False     # avoid a second COUNT(*) over the whole table on every page
 
     action_form = SnapshotActionForm
 
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        return KeysetPaginator(
+            queryset,
+            per_page,
+            orphans=orphans,
+            allow_empty_first_page=allow_empty_first_page,
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )
+
     def get_urls(self):
         urls = super().get_urls()
         custom_urls = [
@@ -102,7 +114,8 @@ class SnapshotAdmin(SearchResultsAdminMixin, admin.ModelAdmin):
 
     def get_queryset(self, request):
         self.request = request
-        return super().get_queryset(request).prefetch_related('tags')
+        # load the tags and ArchiveResults for a whole page of snapshots in two queries instead of a few per row
+        return super().get_queryset(request).prefetch_related('tags', 'archiveresult_set')
 
     def tag_list(self, obj):
         return ', '.join(obj.tags.values_list('name', flat=True))
@@ -161,7 +174,6 @@ class SnapshotAdmin(SearchResultsAdminMixin, admin.ModelAdmin):
         )
 
     def title_str(self, obj):
-        canon = obj.as_link().canonical_outputs()
         tags = ''.join(
             format_html('<a href="/admin/core/snapshot/?tags__id__exact={}"><span class="tag">{}</span></a> ', tag.id, tag)
             for tag in obj.tags.all()
@@ -175,20 +187,23 @@ class SnapshotAdmin(SearchResultsAdminMixin, admin.ModelAdmin):
                 '<b class="status-{}">{}</b>'
             '</a>',
             obj.archive_path,
-            obj.archive_path, canon['favicon_path'],
+            obj.archive_path, 'favicon.ico',
             obj.archive_path,
             'fetched' if obj.latest_title or obj.title else 'pending',
             urldecode(htmldecode(obj.latest_title or obj.title or ''))[:128] or 'Pending...'
-        ) + mark_safe(f' <span class="tags">{tags}</span>')
+        ) + mark_safe(f' <span class="tags">{tags}</span>') + (
+            format_html('<br/><small class="search-snippet">{}</small>', obj.search_snippet)
+            if getattr(obj, 'search_snippet', None) else mark_safe('')
+        )
 
     def files(self, obj):
         return snapshot_icons(obj)
 
-    files.admin_order_field = 'updated'
+    files.admin_order_field = 'num_outputs'
     files.short_description = 'Files Saved'
 
     def size(self, obj):
-        archive_size = (Path(obj.link_dir) / 'index.html').exists() and obj.archive_size
+        archive_size = obj.archive_size
         if archive_size:
             size_txt = printable_filesize(archive_size)
             if archive_size > 52428800:
@@ -201,7 +216,7 @@ class SnapshotAdmin(SearchResultsAdminMixin, admin.ModelAdmin):
             size_txt,
         )
 
-    size.admin_order_field = 'archiveresult__count'
+    size.admin_order_field = 'archive_size'
 
     def url_str(self, obj):
         return format_html(
@@ -240,51 +255,43 @@ class SnapshotAdmin(SearchResultsAdminMixin, admin.ModelAdmin):
     #     return super().changelist_view(request, extra_context=None)
 
     def update_snapshots(self, request, queryset):
-        archive_links([
-            snapshot.as_link()
-            for snapshot in queryset
-        ], out_dir=OUTPUT_DIR)
+        return self.enqueue_task(request, queryset, 'update')
     update_snapshots.short_description = "Pull"
 
     def update_titles(self, request, queryset):
-        archive_links([
-            snapshot.as_link()
-            for snapshot in queryset
-        ], overwrite=True, methods=('title','favicon'), out_dir=OUTPUT_DIR)
+        return self.enqueue_task(request, queryset, 'update_titles')
     update_titles.short_description = "⬇️ Title"
 
     def resnapshot_snapshot(self, request, queryset):
-        for snapshot in queryset:
-            timestamp = datetime.now(timezone.utc).isoformat('T', 'seconds')
-            new_url = snapshot.url.split('#')[0] + f'#{timestamp}'
-            add(new_url, tag=snapshot.tags_str())
+        return self.enqueue_task(request, queryset, 'resnapshot')
     resnapshot_snapshot.short_description = "Re-Snapshot"
 
     def overwrite_snapshots(self, request, queryset):
-        archive_links([
-            snapshot.as_link()
-            for snapshot in queryset
-        ], overwrite=True, out_dir=OUTPUT_DIR)
+        return self.enqueue_task(request, queryset, 'overwrite')
     overwrite_snapshots.short_description = "Reset"
 
+    def enqueue_task(self, request, queryset, kind):
+        # archiving can take hours, run it in the background and go to its progress page
+        snapshot_ids = [str(pk) for pk in queryset.values_list('pk', flat=True)]
+        task = enqueue_task(kind, created_by=request.user, num_total=len(snapshot_ids), snapshot_ids=snapshot_ids)
+        return redirect(task)
+
     def delete_snapshots(self, request, queryset):
         remove(snapshots=queryset, yes=True, delete=True, out_dir=OUTPUT_DIR)
 
     delete_snapshots.short_description = "Delete"
 
     def add_tags(self, request, queryset):
-        tags = request.POST.getlist('tags')
-        print('[+] Adding tags', tags, 'to Snapshots', queryset)
-        for obj in queryset:
-            obj.tags.add(*tags)
+        tag_ids = request.POST.getlist('tags')
+        print('[+] Adding tags', tag_ids, 'to Snapshots', queryset)
+        sql_writer.write(add_tag_ids_to_snapshots, list(queryset.values_list('pk', flat=True)), tag_ids)
 
     add_tags.short_description = "+"
 
     def remove_tags(self, request, queryset):
-        tags = request.POST.getlist('tags')
-        print('[-] Removing tags', tags, 'to Snapshots', queryset)
-        for obj in queryset:
-            obj.tags.remove(*tags)
+        tag_ids = request.POST.getlist('tags')
+        print('[-] Removing tags', tag_ids, 'to Snapshots', queryset)
+        sql_writer.write(remove_tag_ids_from_snapshots, list(queryset.values_list('pk', flat=True)), tag_ids)
 
     remove_tags.short_description = "–"
 
@@ -307,15 +314,21 @@ class TagAdmin(admin.ModelAdmin):
     actions = ['delete_selected']
     ordering = ['-id']
 
+    def get_queryset(self, request):
+        # count the snapshots of a whole page of tags in the same query instead of one COUNT(*) per row
+        return super().get_queryset(request).annotate(snapshot_count=Count('snapshot'))
+
     def num_snapshots(self, obj):
         return format_html(
             '<a href="/admin/core/snapshot/?tags__id__exact={}">{} total</a>',
             obj.id,
-            obj.snapshot_set.count(),
+            obj.snapshot_count,
         )
 
+    num_snapshots.admin_order_field = 'snapshot_count'
+
     def snapshots(self, obj):
-        total_count = obj.snapshot_set.count()
+        total_count = obj.snapshot_count
         return mark_safe('<br/>'.join(
             format_html(
                 '{} <code><a href="/admin/core/snapshot/{}/change"><b>[{}]</b></a> {}</code>',
@@ -325,7 +338,7 @@ class TagAdmin(admin.ModelAdmin):
                 snap.url,
             )
             for snap in obj.snapshot_set.order_by('-updated')[:10]
-        ) + (f'<br/><a href="/admin/core/snapshot/?tags__id__exact={obj.id}">and {total_count-10} more...<a>' if obj.snapshot_set.count() > 10 else ''))
+        ) + (f'<br/><a href="/admin/core/snapshot/?tags__id__exact={obj.id}">and {total_count-10} more...<a>' if total_count > 10 else ''))
 
 
 class ArchiveResultAdmin(admin.ModelAdmin):
@@ -340,6 +353,15 @@ class ArchiveResultAdmin(admin.ModelAdmin):
     ordering = ['-start_ts']
     list_per_page = SNAPSHOTS_PER_PAGE
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('snapshot')
+
+    def delete_queryset(self, request, queryset):
+        # bulk deletes don't go through ArchiveResult.delete(), touch the snapshots here instead
+        snapshot_ids = list(queryset.values_list('snapshot_id', flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        touch_snapshots(snapshot_ids)
+
     def snapshot_str(self, obj):
         return format_html(
             '<a href="/archive/{}/index.html"><b><code>[{}]</code></b></a><br/>'
@@ -369,6 +391,33 @@ class ArchiveResultAdmin(admin.ModelAdmin):
     tags_str.short_description = 'tags'
     snapshot_str.short_description = 'snapshot'
 
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('created', 'kind', 'status', 'progress_str', 'created_by', 'started', 'finished')
+    readonly_fields = ('id', 'kind', 'kwargs', 'status', 'created', 'created_by', 'started', 'finished', 'pid', 'num_done', 'num_total')
+    fields = readonly_fields
+    list_filter = ('status', 'kind', 'created')
+    ordering = ['-created']
+    list_per_page = SNAPSHOTS_PER_PAGE
+
+    def progress_str(self, obj):
+        return format_html(
+            '<a href="{}">{}</a>',
+            obj.get_absolute_url(),
+            f'{obj.num_done}/{obj.num_total}' if obj.num_total else 'view',
+        )
+    progress_str.short_description = 'Progress'
+
+    def has_add_permission(self, request):
+        return False
+
+
+class APITokenAdmin(admin.ModelAdmin):
+    list_display = ('user', 'description', 'created', 'last_used')
+    readonly_fields = ('token', 'created', 'last_used')
+    fields = ('user', 'description', *readonly_fields)
+    ordering = ['-created']
+
+
 class ArchiveBoxAdmin(admin.AdminSite):
     site_header = 'ArchiveBox'
     index_title = 'Links'
@@ -398,21 +447,8 @@ class ArchiveBoxAdmin(admin.AdminSite):
                 url = form.cleaned_data["url"]
                 print(f'[+] Adding URL: {url}')
                 depth = 0 if form.cleaned_data["depth"] == "0" else 1
-                input_kwargs = {
-                    "urls": url,
-                    "depth": depth,
-                    "update_all": False,
-                    "out_dir": OUTPUT_DIR,
-                }
-                add_stdout = StringIO()
-                with redirect_stdout(add_stdout):
-                   add(**input_kwargs)
-                print(add_stdout.getvalue())
-
-                context.update({
-                    "stdout": ansi_to_html(add_stdout.getvalue().strip()),
-                    "form": AddLinkForm()
-                })
+                task = enqueue_task('add', created_by=request.user, urls=url, depth=depth, update_all=False)
+                return redirect(task)
             else:
                 context["form"] = form
 
@@ -423,4 +459,6 @@ admin.site.register(get_user_model())
 admin.site.register(Snapshot, SnapshotAdmin)
 admin.site.register(Tag, TagAdmin)
 admin.site.register(ArchiveResult, ArchiveResultAdmin)
+admin.site.register(Task, TaskAdmin)
+admin.site.register(APIToken, APITokenAdmin)
 admin.site.disable_action('delete_selected')
@@ -0,0 +1,297 @@
+__package__ = 'archivebox.core'
+
+import json
+
+from functools import wraps
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Tuple, List
+
+from django.http import JsonResponse
+from django.db.models import Count
+from django.core.exceptions import ValidationError
+from django.views.decorators.csrf import csrf_exempt
+
+from core.models import Snapshot, ArchiveResult, Tag, Task, APIToken
+from core.paginators import KEYSET_ORDERING, q_older_than_cursor
+from core.tasks import enqueue_task, get_task_progress
+
+from ..index.sql import (
+    q_snapshot_search,
+    snapshot_fts_available,
+    update_snapshot_tags,
+    sql_writer,
+)
+
+
+# JSON API, authenticated with `Authorization: Bearer <token>` (tokens are managed in the admin)
+# GET  /api/v1/core/snapshot/?fields=id,url,tags&limit=100&after=<cursor>&tag=&domain=&q=
+# POST /api/v1/core/snapshot/             {"urls": [...], "tags": [...], "depth": 0}, queued as a background Task
+# GET  /api/v1/core/snapshot/<id>/?fields=...
+# GET  /api/v1/core/archiveresult/?fields=...&limit=&after=<cursor>&snapshot_id=&extractor=&status=
+# GET  /api/v1/core/tag/
+# POST /api/v1/core/tag/                  {"snapshot_ids": [...], "add": [...], "remove": [...]}
+# GET  /api/v1/core/task/<id>/
+
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+
+# only record a token's last use once per this interval, so that every request isn't a write
+TOKEN_LAST_USED_RESOLUTION = timedelta(minutes=1)
+
+SNAPSHOT_API_FIELDS = (
+    'id', 'url', 'timestamp', 'title', 'tags', 'added', 'updated', 'domain', 'base_url',
+    'is_archived', 'num_outputs', 'archive_size', 'status_code', 'thumbnail_url',
+)
+ARCHIVERESULT_API_FIELDS = (
+    'id', 'snapshot_id', 'extractor', 'status', 'output', 'output_size',
+    'start_ts', 'end_ts', 'cmd', 'cmd_version', 'pwd',
+)
+TAG_API_FIELDS = ('id', 'name', 'slug', 'num_snapshots')
+
+
+class APIError(Exception):
+    def __init__(self, message: str, status: int=400):
+        super().__init__(message)
+        self.status = status
+
+
+def authenticate_token(request):
+    """get the active User whose APIToken is in the Authorization header, or None"""
+    scheme, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    if scheme.lower() not in ('bearer', 'token') or not token.strip():
+        return None
+
+    api_token = APIToken.objects.select_related('user').filter(token=token.strip()).first()
+    if api_token is None or not api_token.user.is_active:
+        return None
+
+    now = datetime.now(timezone.utc)
+    if api_token.last_used is None or api_token.last_used < now - TOKEN_LAST_USED_RESOLUTION:
+        APIToken.objects.filter(pk=api_token.pk).update(last_used=now)
+    return api_token.user
+
+
+def api_view(*methods: str):
+    """turn a function returning a dict into a token-authenticated JSON API view"""
+    def decorator(view_func):
+        @csrf_exempt
+        @wraps(view_func)
+        def wrapped(request, *args, **kwargs):
+            if request.method not in methods:
+                response = JsonResponse({'error': f'Method {request.method} not allowed'}, status=405)
+                response['Allow'] = ', '.join(methods)
+                return response
+
+            user = authenticate_token(request)
+            if user is None:
+                return JsonResponse({'error': 'Missing or invalid API token'}, status=401)
+            request.user = user
+
+            try:
+                result = view_func(request, *args, **kwargs)
+            except APIError as err:
+                return JsonResponse({'error': str(err)}, status=err.status)
+            except ValidationError as err:
+                return JsonResponse({'error': ' '.join(err.messages)}, status=400)
+
+            status = 200
+            if isinstance(result, tuple):
+                result, status = result
+            return JsonResponse(result, status=status)
+        return wrapped
+    return decorator
+
+
+def parse_json_body(request) -> dict:
+    try:
+        body = json.loads(request.body or b'{}')
+    except ValueError as err:
+        raise APIError(f'Request body is not valid JSON: {err}')
+    if not isinstance(body, dict):
+        raise APIError('Request body must be a JSON object')
+    return body
+
+
+def parse_str_list(value, name: str) -> List[str]:
+    """accept either a JSON list of strings or a comma-separated string"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise APIError(f'{name} must be a list of strings')
+    return [item.strip() for item in value if item.strip()]
+
+
+def get_fields(request, allowed: Tuple[str, ...]) -> Tuple[str, ...]:
+    fields = parse_str_list(request.GET.get('fields'), 'fields')
+    if not fields:
+        return allowed
+    unknown = set(fields) - set(allowed)
+    if unknown:
+        raise APIError(f'Unknown fields: {", ".join(sorted(unknown))} (available: {", ".join(allowed)})')
+    return tuple(dict.fromkeys(fields))
+
+
+def get_limit(request) -> int:
+    try:
+        limit = int(request.GET.get('limit', API_PAGE_SIZE))
+    except ValueError:
+        raise APIError('limit must be a number')
+    if not 1 <= limit <= API_MAX_PAGE_SIZE:
+        raise APIError(f'limit must be between 1 and {API_MAX_PAGE_SIZE}')
+    return limit
+
+
+def get_snapshot_rows(queryset, fields: Tuple[str, ...], limit: Optional[int]=None) -> List[dict]:
+    db_fields = [field if field != 'tags' else 'tag_names' for field in fields if field != 'id']
+    queryset = queryset.values('id', *db_fields)
+    rows = list(queryset[:limit] if limit else queryset)
+    for row in rows:
+        if 'tags' in fields:
+            tag_names = row.pop('tag_names')
+            row['tags'] = tag_names.split(',') if tag_names else []
+        if 'id' not in fields:
+            del row['id']
+    return rows
+
+
+@api_view('GET', 'POST')
+def snapshots(request):
+    if request.method == 'POST':
+        return bulk_add(request)
+
+    fields = get_fields(request, SNAPSHOT_API_FIELDS)
+    limit = get_limit(request)
+
+    queryset = Snapshot.objects.order_by(*KEYSET_ORDERING)
+    if request.GET.get('tag'):
+        queryset = queryset.filter(tags__name=request.GET['tag'])
+    if request.GET.get('domain'):
+        queryset = queryset.filter(domain=request.GET['domain'])
+    if request.GET.get('q'):
+        queryset = queryset.filter(q_snapshot_search(request.GET['q']))
+        if not snapshot_fts_available():
+            queryset = queryset.distinct()
+
+    if request.GET.get('after'):
+        cursor = Snapshot.objects.filter(pk=request.GET['after']).values('pk', 'added').first()
+        if cursor is None:
+            raise APIError('Unknown cursor, it must be the "next" value of the previous page')
+        queryset = queryset.filter(q_older_than_cursor(cursor))
+
+    # fetch one extra row to know if there's another page, and always the id to use as the cursor
+    rows = get_snapshot_rows(queryset, (*fields, 'id'), limit=limit + 1)
+    next_cursor = str(rows[limit - 1]['id']) if len(rows) > limit else None
+    rows = rows[:limit]
+    if 'id' not in fields:
+        for row in rows:
+            del row['id']
+
+    return {'results': rows, 'next': next_cursor}
+
+
+def bulk_add(request):
+    body = parse_json_body(request)
+    urls = body.get('urls')
+    if isinstance(urls, str):
+        urls = [urls]
+    if not urls or not isinstance(urls, list) or not all(isinstance(url, str) and url.strip() for url in urls):
+        raise APIError('urls must be a non-empty list of URLs')
+
+    depth = body.get('depth', 0)
+    if depth not in (0, 1):
+        raise APIError('depth must be 0 or 1')
+
+    add_kwargs = {
+        'urls': [url.strip() for url in urls],
+        'tag': ','.join(parse_str_list(body.get('tags'), 'tags')),
+        'depth': depth,
+        'update_all': False,
+    }
+    extractors = parse_str_list(body.get('extractors'), 'extractors')
+    if extractors:
+        add_kwargs['extractors'] = ','.join(extractors)
+    if body.get('parser'):
+        add_kwargs['parser'] = str(body['parser'])
+
+    task = enqueue_task('add', created_by=request.user, **add_kwargs)
+    return {'task': get_task_info(task)}, 202
+
+
+@api_view('GET')
+def snapshot(request, snapshot_id):
+    fields = get_fields(request, SNAPSHOT_API_FIELDS)
+    rows = get_snapshot_rows(Snapshot.objects.filter(pk=snapshot_id), fields)
+    if not rows:
+        raise APIError('Snapshot not found', status=404)
+    return rows[0]
+
+
+@api_view('GET')
+def archiveresults(request):
+    fields = get_fields(request, ARCHIVERESULT_API_FIELDS)
+    limit = get_limit(request)
+
+    queryset = ArchiveResult.objects.order_by('-id')
+    for filter_field in ('snapshot_id', 'extractor', 'status'):
+        if request.GET.get(filter_field):
+            queryset = queryset.filter(**{filter_field: request.GET[filter_field]})
+    if request.GET.get('after'):
+        try:
+            queryset = queryset.filter(id__lt=int(request.GET['after']))
+        except ValueError:
+            raise APIError('Invalid cursor, it must be the "next" value of the previous page')
+
+    rows = list(queryset.values('id', *(field for field in fields if field != 'id'))[:limit + 1])
+    next_cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+    rows = rows[:limit]
+    if 'id' not in fields:
+        for row in rows:
+            del row['id']
+
+    return {'results': rows, 'next': next_cursor}
+
+
+@api_view('GET', 'POST')
+def tags(request):
+    if request.method == 'POST':
+        return update_tags(request)
+
+    fields = get_fields(request, TAG_API_FIELDS)
+    queryset = Tag.objects.order_by('name')
+    if 'num_snapshots' in fields:
+        queryset = queryset.annotate(num_snapshots=Count('snapshot'))
+    return {'results': list(queryset.values(*fields))}
+
+
+def update_tags(request):
+    body = parse_json_body(request)
+    snapshot_ids = parse_str_list(body.get('snapshot_ids'), 'snapshot_ids')
+    if not snapshot_ids:
+        raise APIError('snapshot_ids must be a non-empty list of Snapshot ids')
+    to_add = parse_str_list(body.get('add'), 'add')
+    to_remove = parse_str_list(body.get('remove'), 'remove')
+    if not (to_add or to_remove):
+        raise APIError('Give a list of tag names to add and/or remove')
+
+    # validate the ids up front instead of failing halfway through the writes
+    for snapshot_id in snapshot_ids:
+        Snapshot._meta.pk.to_python(snapshot_id)
+
+    num_added, num_removed = sql_writer.write(update_snapshot_tags, snapshot_ids, add=to_add, remove=to_remove)
+    return {'added': num_added, 'removed': num_removed}
+
+
+def get_task_info(task: Task) -> dict:
+    info = get_task_progress(task)
+    info.pop('output')
+    return info
+
+
+@api_view('GET')
+def task(request, task_id):
+    task = Task.objects.filter(pk=task_id).first()
+    if task is None:
+        raise APIError('Task not found', status=404)
+    return get_task_info(task)
@@ -0,0 +1,150 @@
+__package__ = 'archivebox.core'
+
+import time
+import pickle
+import sqlite3
+import threading
+
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+
+class SQLiteCache(BaseCache):
+    """
+    Persistent cache stored in its own sqlite3 file (separate from the main index so that
+    cache writes never hold up the index's write lock), shared by every server worker and
+    CLI process working on the same collection, and kept across restarts.
+
+    Entries are evicted least-recently-used first once the values take up more than
+    OPTIONS['MAX_SIZE'] bytes. Reads only bump an entry's last access time if it's more
+    than ACCESS_RESOLUTION seconds old, so a page full of cache hits doesn't turn into a
+    page full of writes.
+    """
+
+    ACCESS_RESOLUTION = 60       # seconds
+    CULL_EVERY = 100             # check the total size once every this many writes
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = str(location)
+        self._max_size = int(options.get('MAX_SIZE', 64 * 1024 * 1024))
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self._path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=wal')
+            connection.execute('PRAGMA synchronous=normal')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                '    key TEXT PRIMARY KEY,'
+                '    value BLOB NOT NULL,'
+                '    size INTEGER NOT NULL,'
+                '    expires REAL,'
+                '    accessed REAL NOT NULL'
+                ')'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+            self._local.connection = connection
+        return connection
+
+    def _key(self, key, version=None) -> str:
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version=version)
+        now = time.time()
+        row = self._connection().execute('SELECT value, expires, accessed FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return default
+
+        value, expires, accessed = row
+        if expires is not None and expires <= now:
+            self._connection().execute('DELETE FROM cache WHERE key = ? AND expires <= ?', (key, now))
+            return default
+
+        if accessed < now - self.ACCESS_RESOLUTION:
+            self._connection().execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+        return pickle.loads(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._set(self._key(key, version=version), value, timeout, only_if_missing=False)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._set(self._key(key, version=version), value, timeout, only_if_missing=True)
+
+    def _set(self, key, value, timeout, only_if_missing: bool) -> bool:
+        connection = self._connection()
+        if timeout == 0:
+            # same as the other backends: a zero timeout means expire immediately
+            if not only_if_missing:
+                connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+            return False
+
+        now = time.time()
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires = self.get_backend_timeout(timeout)
+        if only_if_missing:
+            # an expired entry doesn't count as present
+            connection.execute('DELETE FROM cache WHERE key = ? AND expires <= ?', (key, now))
+            cursor = connection.execute(
+                'INSERT OR IGNORE INTO cache (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)',
+                (key, pickled, len(pickled), expires, now),
+            )
+        else:
+            cursor = connection.execute(
+                'INSERT OR REPLACE INTO cache (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)',
+                (key, pickled, len(pickled), expires, now),
+            )
+
+        self._writes += 1
+        if self._writes % self.CULL_EVERY == 0:
+            self._cull()
+        return cursor.rowcount > 0
+
+    def _cull(self) -> None:
+        """drop expired entries, then the least recently used ones until we're back under 90% of MAX_SIZE"""
+        connection = self._connection()
+        connection.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        total_size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+        if total_size <= self._max_size:
+            return
+
+        to_free = total_size - int(self._max_size * 0.9)
+        freed = 0
+        stale_keys = []
+        for key, size in connection.execute('SELECT key, size FROM cache ORDER BY accessed'):
+            stale_keys.append((key,))
+            freed += size
+            if freed >= to_free:
+                break
+        connection.executemany('DELETE FROM cache WHERE key = ?', stale_keys)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version=version)
+        cursor = self._connection().execute(
+            'UPDATE cache SET expires = ?, accessed = ? WHERE key = ?',
+            (self.get_backend_timeout(timeout), time.time(), key),
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, key, version=None):
+        key = self._key(key, version=version)
+        cursor = self._connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+        return cursor.rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version=version)
+        row = self._connection().execute('SELECT expires FROM cache WHERE key = ?', (key,)).fetchone()
+        return row is not None and (row[0] is None or row[0] > time.time())
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # keep the per-thread connection open between requests, it's cheap and sqlite3 has no server to time out
+        pass
@@ -0,0 +1,13 @@
+__package__ = 'archivebox'
+
+from django.core.management.base import BaseCommand
+
+
+from .core.tasks import run_queued_tasks
+
+
+class Command(BaseCommand):
+    help = 'Run the queued background Tasks submitted from the web UI (started automatically by the server)'
+
+    def handle(self, *args, **kwargs):
+        run_queued_tasks()
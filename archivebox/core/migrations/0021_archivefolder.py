@@ -0,0 +1,27 @@
+# Generated by Django 3.1.8 on 2021-04-20 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_auto_20210410_1031'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveFolder',
+            fields=[
+                ('name', models.CharField(max_length=256, primary_key=True, serialize=False)),
+                ('dir_mtime', models.FloatField()),
+                ('index_mtime', models.FloatField(default=None, null=True)),
+                ('index_size', models.BigIntegerField(default=None, null=True)),
+                ('url', models.TextField(default=None, null=True)),
+                ('timestamp', models.CharField(default=None, max_length=32, null=True)),
+                ('is_parseable', models.BooleanField(default=False)),
+                ('needs_repair', models.BooleanField(default=False)),
+                ('entries', models.TextField(blank=True, default='')),
+            ],
+        ),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 3.1.8 on 2021-04-20 12:30
+
+import os
+import json
+from pathlib import Path
+
+from django.db import migrations, models
+
+try:
+    JSONField = models.JSONField
+except AttributeError:
+    import jsonfield
+    JSONField = jsonfield.JSONField
+
+
+# frozen copy of what core.models.calc_snapshot_summary did when these columns were added,
+# so that later changes to it don't change what this migration does
+ARCHIVED_OUTPUT_PATHS = ('output.pdf', 'screenshot.png', 'output.html', 'media', 'singlefile.html')
+
+def get_dir_size(path) -> int:
+    num_bytes = 0
+    for entry in os.scandir(path):
+        if entry.is_dir(follow_symlinks=False):
+            num_bytes += get_dir_size(entry.path)
+        else:
+            num_bytes += entry.stat(follow_symlinks=False).st_size
+    return num_bytes
+
+def calc_snapshot_summary(snapshot, archive_dir: Path) -> dict:
+    from util import domain
+
+    link_dir = archive_dir / snapshot.timestamp
+    succeeded = snapshot.archiveresult_set.filter(status='succeeded')
+    screenshot = succeeded.filter(extractor='screenshot').only('output').order_by('start_ts').last()
+
+    try:
+        archive_size = get_dir_size(link_dir)
+    except Exception:
+        archive_size = 0
+
+    try:
+        headers = json.loads((link_dir / 'headers.json').read_text(encoding='utf-8').strip())
+    except Exception:
+        headers = None
+
+    try:
+        status_code = int(headers['Status-Code'])
+    except Exception:
+        status_code = None
+
+    return {
+        'num_outputs': succeeded.count(),
+        'is_archived': any((link_dir / path).exists() for path in (domain(snapshot.url), *ARCHIVED_OUTPUT_PATHS)),
+        'archive_size': archive_size,
+        'thumbnail_url': screenshot and f'/archive/{snapshot.timestamp}/{screenshot.output}',
+        'headers': headers,
+        'status_code': status_code,
+    }
+
+def backfill_snapshot_summaries(apps, schema_editor):
+    from config import ARCHIVE_DIR
+
+    Snapshot = apps.get_model("core", "Snapshot")
+
+    for snapshot in Snapshot.objects.all().iterator():
+        for key, val in calc_snapshot_summary(snapshot, Path(ARCHIVE_DIR)).items():
+            setattr(snapshot, key, val)
+        snapshot.save(update_fields=['num_outputs', 'is_archived', 'archive_size', 'thumbnail_url', 'headers', 'status_code'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_archivefolder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='snapshot',
+            name='archive_size',
+            field=models.BigIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='snapshot',
+            name='headers',
+            field=JSONField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='snapshot',
+            name='is_archived',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.AddField(
+            model_name='snapshot',
+            name='num_outputs',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='snapshot',
+            name='status_code',
+            field=models.IntegerField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='snapshot',
+            name='thumbnail_url',
+            field=models.CharField(blank=True, default=None, max_length=1024, null=True),
+        ),
+        migrations.RunPython(backfill_snapshot_summaries, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.8 on 2021-04-21 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_snapshot_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archiveresult',
+            name='output_size',
+            field=models.BigIntegerField(blank=True, default=None, null=True),
+        ),
+    ]
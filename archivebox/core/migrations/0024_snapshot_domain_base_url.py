@@ -0,0 +1,38 @@
+# Generated by Django 3.1.8 on 2021-04-22 09:14
+
+from django.db import migrations, models
+
+
+def backfill_domain_and_base_url(apps, schema_editor):
+    from util import base_url, domain
+
+    Snapshot = apps.get_model("core", "Snapshot")
+
+    snapshots = []
+    for snapshot in Snapshot.objects.only('id', 'url').iterator():
+        snapshot.domain = domain(snapshot.url).lower()
+        snapshot.base_url = base_url(snapshot.url)
+        snapshots.append(snapshot)
+
+    Snapshot.objects.bulk_update(snapshots, ['domain', 'base_url'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_archiveresult_output_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='snapshot',
+            name='base_url',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=2048),
+        ),
+        migrations.AddField(
+            model_name='snapshot',
+            name='domain',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=256),
+        ),
+        migrations.RunPython(backfill_domain_and_base_url, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.1.8 on 2021-04-23 10:02
+
+from django.db import migrations
+
+# frozen copy of index.sql.SNAPSHOT_FTS_TABLE + SNAPSHOT_FTS_TRIGGERS at the time of this migration
+SNAPSHOT_FTS_TABLE = 'core_snapshot_fts'
+SNAPSHOT_FTS_TRIGGERS = (
+    'core_snapshot_fts_insert',
+    'core_snapshot_fts_update',
+    'core_snapshot_fts_delete',
+    'core_snapshot_tags_fts_insert',
+    'core_snapshot_tags_fts_delete',
+    'core_tag_fts_update',
+)
+
+
+def delete_snapshot_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in SNAPSHOT_FTS_TRIGGERS:
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {name}')
+    schema_editor.execute(f'DROP TABLE IF EXISTS {SNAPSHOT_FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_snapshot_domain_base_url'),
+    ]
+
+    operations = [
+        # the index + its triggers are only created once all the migrations have run (see
+        # index.sql.apply_migrations), any later migration that rebuilds core_snapshot would break on them
+        migrations.RunPython(migrations.RunPython.noop, reverse_code=delete_snapshot_fts),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.8 on 2021-04-24 11:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_snapshot_fts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='snapshot',
+            index=models.Index(fields=['added', 'id'], name='core_snapshot_added_id_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.1.8 on 2021-04-27 09:41
+
+from django.db import migrations, models
+
+# frozen copy of the trigger names in index.sql at the time of this migration
+SNAPSHOT_TAG_NAMES_TRIGGERS = (
+    'core_snapshot_tags_tag_names_insert',
+    'core_snapshot_tags_tag_names_delete',
+    'core_tag_tag_names_update',
+    'core_snapshot_tag_names_keep',
+)
+SNAPSHOT_FTS_TABLE = 'core_snapshot_fts'
+SNAPSHOT_FTS_TRIGGERS = (
+    'core_snapshot_fts_insert',
+    'core_snapshot_fts_update',
+    'core_snapshot_fts_delete',
+    'core_snapshot_tags_fts_insert',
+    'core_snapshot_tags_fts_delete',
+    'core_tag_fts_update',
+)
+
+
+def delete_triggers(apps, schema_editor):
+    # removing the column rebuilds core_snapshot, which breaks on the triggers that reference it
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in (*SNAPSHOT_TAG_NAMES_TRIGGERS, *SNAPSHOT_FTS_TRIGGERS):
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {name}')
+    schema_editor.execute(f'DROP TABLE IF EXISTS {SNAPSHOT_FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_apitoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='snapshot',
+            name='tag_names',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        # the triggers that keep tag_names up-to-date are created (and it gets filled in for the
+        # existing snapshots) once all the migrations have run, see index.sql.apply_migrations
+        migrations.RunPython(migrations.RunPython.noop, reverse_code=delete_triggers),
+    ]
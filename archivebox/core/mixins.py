@@ -1,21 +1,34 @@
 from django.contrib import messages
 
-from archivebox.search import query_search_index
+from django.contrib.admin.views.main import PAGE_VAR, ALL_VAR
+
+from archivebox.search import search_index_ids
+from archivebox.index.sql import q_snapshot_search, snapshot_fts_available, q_snapshot_ids, order_by_search_rank
 
 class SearchResultsAdminMixin:
     def get_search_results(self, request, queryset, search_term: str):
         """Enhances the search queryset with results from the search backend"""
         
-        qs, use_distinct = super().get_search_results(request, queryset, search_term)
-
         search_term = search_term.strip()
         if not search_term:
-            return qs, use_distinct
+            return queryset, False
+
+        # only fetch the full-text results up to the end of the page being shown (pages are 0-indexed here),
+        # so the paginator only knows if there's a next page, not the total (see KeysetPaginator.count_is_exact).
+        # "show all" and actions (which can be applied to every result across all pages) need all of them
+        page_num = request.GET.get(PAGE_VAR, '0')
+        fetch_all = not page_num.isdigit() or ALL_VAR in request.GET or request.method == 'POST'
+        limit = None if fetch_all else (int(page_num) + 1) * self.list_per_page + 1
         try:
-            qsearch = query_search_index(search_term)
-            qs = qs | qsearch
+            ranked_ids = search_index_ids(search_term, limit=limit)
         except Exception as err:
             print(f'[!] Error while using search backend: {err.__class__.__name__} {err}')
             messages.add_message(request, messages.WARNING, f'Error from the search backend, only showing results from default admin search fields - Error: {err}')
-        
-        return qs, use_distinct
+            ranked_ids = []
+
+        # title/url/tags are matched using the FTS index instead of LIKE-scanning every search_field,
+        # the full-text results come first in rank order (see KeysetChangeList.get_ordering)
+        qs = queryset.filter(q_snapshot_search(search_term) | q_snapshot_ids(ranked_ids))
+        use_distinct = not snapshot_fts_available()
+
+        return order_by_search_rank(qs, ranked_ids), use_distinct
@@ -3,21 +3,20 @@ __package__ = 'archivebox.core'
 
 import uuid
 import json
+import secrets
 
-from pathlib import Path
 from typing import Optional, List
 
 from django.db import models
 from django.utils.functional import cached_property
 from django.utils.text import slugify
-from django.core.cache import cache
 from django.urls import reverse
 from django.db.models import Case, When, Value, IntegerField
 from django.contrib.auth.models import User   # noqa
 
 from ..config import ARCHIVE_DIR, ARCHIVE_DIR_NAME
 from ..system import get_dir_size
-from ..util import parse_date, base_url, hashurl
+from ..util import parse_date, base_url, domain, hashurl
 from ..index.schema import Link
 from ..index.html import snapshot_icons
 from ..extractors import get_default_archive_methods, ARCHIVE_METHODS_INDEXING_PRECEDENCE
@@ -96,12 +95,46 @@ class Snapshot(models.Model):
     updated = models.DateTimeField(auto_now=True, blank=True, null=True, db_index=True)
     tags = models.ManyToManyField(Tag, blank=True)
 
+    # denormalized summary of the ArchiveResults and data dir, kept up-to-date by update_summary()
+    # so that listing pages don't need to hit the DB or filesystem for every row
+    num_outputs = models.PositiveIntegerField(default=0, db_index=True)
+    is_archived = models.BooleanField(default=False, db_index=True)
+    archive_size = models.BigIntegerField(default=0, db_index=True)
+    thumbnail_url = models.CharField(max_length=1024, default=None, null=True, blank=True)
+    headers = JSONField(default=None, null=True, blank=True)
+    status_code = models.IntegerField(default=None, null=True, blank=True)
+
+    # denormalized parts of the url, set automatically on save() from url, never set them manually
+    # (indexed so that domain filters and url lookups don't need a LIKE scan over every url)
+    domain = models.CharField(max_length=256, default='', blank=True, editable=False, db_index=True)
+    base_url = models.CharField(max_length=2048, default='', blank=True, editable=False, db_index=True)
+
+    # denormalized comma-separated sorted tag names, kept up-to-date by sqlite triggers on the tags
+    # tables (see index.sql.setup_snapshot_tag_names), so listing pages don't need a tags query per row
+    tag_names = models.TextField(default='', blank=True, editable=False)
+
     keys = ('url', 'timestamp', 'title', 'tags', 'updated')
 
+    class Meta:
+        indexes = [
+            # lets the paginators seek straight to the rows after a (added, id) cursor
+            models.Index(fields=['added', 'id'], name='core_snapshot_added_id_idx'),
+        ]
+
     def __repr__(self) -> str:
         title = self.title or '-'
         return f'[{self.timestamp}] {self.url[:64]} ({title[:64]})'
 
+    def save(self, *args, **kwargs):
+        self.domain = domain(self.url).lower()
+        self.base_url = base_url(self.url)
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'url' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'domain', 'base_url'}
+
+        super().save(*args, **kwargs)
+
     def __str__(self) -> str:
         title = self.title or '-'
         return f'[{self.timestamp}] {self.url[:64]} ({title[:64]})'
@@ -127,17 +160,32 @@ class Snapshot(models.Model):
         return load_link_details(self.as_link())
 
     def tags_str(self, nocache=True) -> str:
-        cache_key = f'{self.id}-{(self.updated or self.added).timestamp()}-tags'
-        calc_tags_str = lambda: ','.join(self.tags.order_by('name').values_list('name', flat=True))
-        if nocache:
-            tags_str = calc_tags_str()
-            cache.set(cache_key, tags_str)
-            return tags_str
-        return cache.get_or_set(cache_key, calc_tags_str)
+        # nocache is unused, tag_names is always up-to-date, it's only kept for backwards compatibility
+        if self.is_prefetched('tags'):
+            return ','.join(sorted(tag.name for tag in self.tags.all()))
+        return self.tag_names or ''
 
     def icons(self) -> str:
         return snapshot_icons(self)
 
+    def is_prefetched(self, relation: str) -> bool:
+        """check if a relation was loaded with prefetch_related() and can be read without querying the db"""
+        return relation in getattr(self, '_prefetched_objects_cache', {})
+
+    def succeeded_results(self, extractor: Optional[str]=None) -> List['ArchiveResult']:
+        """get the succeeded ArchiveResults (with an output), from the prefetched archiveresult_set if available"""
+        if self.is_prefetched('archiveresult_set'):
+            return [
+                result
+                for result in self.archiveresult_set.all()
+                if result.status == 'succeeded' and result.output and extractor in (None, result.extractor)
+            ]
+
+        results = self.archiveresult_set.filter(status='succeeded').exclude(output='')
+        if extractor is not None:
+            results = results.filter(extractor=extractor)
+        return list(results)
+
     @cached_property
     def extension(self) -> str:
         from ..util import extension
@@ -152,22 +200,10 @@ class Snapshot(models.Model):
         # TODO: remove this
         return self.bookmarked
 
-    @cached_property
-    def is_archived(self):
-        return self.as_link().is_archived
-
-    @cached_property
-    def num_outputs(self):
-        return self.archiveresult_set.filter(status='succeeded').count()
-
     @cached_property
     def url_hash(self):
         return hashurl(self.url)
 
-    @cached_property
-    def base_url(self):
-        return base_url(self.url)
-
     @cached_property
     def link_dir(self):
         return str(ARCHIVE_DIR / self.timestamp)
@@ -176,40 +212,6 @@ class Snapshot(models.Model):
     def archive_path(self):
         return '{}/{}'.format(ARCHIVE_DIR_NAME, self.timestamp)
 
-    @cached_property
-    def archive_size(self):
-        cache_key = f'{str(self.id)[:12]}-{(self.updated or self.added).timestamp()}-size'
-
-        def calc_dir_size():
-            try:
-                return get_dir_size(self.link_dir)[0]
-            except Exception:
-                return 0
-
-        return cache.get_or_set(cache_key, calc_dir_size)
-
-    @cached_property
-    def thumbnail_url(self) -> Optional[str]:
-        result = self.archiveresult_set.filter(
-            extractor='screenshot',
-            status='succeeded'
-        ).only('output').last()
-        if result:
-            return reverse('Snapshot', args=[f'{str(self.timestamp)}/{result.output}'])
-        return None
-
-    @cached_property
-    def headers(self) -> Optional[dict]:
-        try:
-            return json.loads((Path(self.link_dir) / 'headers.json').read_text(encoding='utf-8').strip())
-        except Exception:
-            pass
-        return None
-
-    @cached_property
-    def status_code(self) -> Optional[str]:
-        return self.headers and self.headers.get('Status-Code')
-
     @cached_property
     def history(self) -> dict:
         # TODO: use ArchiveResult for this instead of json
@@ -223,9 +225,7 @@ class Snapshot(models.Model):
         try:
             # take longest successful title from ArchiveResult db history
             return sorted(
-                self.archiveresult_set\
-                    .filter(extractor='title', status='succeeded', output__isnull=False)\
-                    .values_list('output', flat=True),
+                (result.output for result in self.succeeded_results('title')),
                 key=lambda r: len(r),
             )[-1]
         except IndexError:
@@ -246,13 +246,52 @@ class Snapshot(models.Model):
 
         return None
 
+    def update_summary(self, save: bool=True) -> None:
+        """recompute the denormalized summary columns from the ArchiveResults and data dir"""
+        for key, val in calc_snapshot_summary(self).items():
+            setattr(self, key, val)
+        if save:
+            self.save()
+
     def save_tags(self, tags: List[str]=()) -> None:
-        tags_id = []
-        for tag in tags:
-            if tag.strip():
-                tags_id.append(Tag.objects.get_or_create(name=tag)[0].id)
-        self.tags.clear()
-        self.tags.add(*tags_id)
+        from ..index.sql import set_snapshot_tags
+
+        set_snapshot_tags(self.id, tags)
+        self.tag_names = Snapshot.objects.filter(pk=self.pk).values_list('tag_names', flat=True).first() or ''
+        getattr(self, '_prefetched_objects_cache', {}).pop('tags', None)
+
+
+def calc_snapshot_summary(snapshot) -> dict:
+    """get the values of the Snapshot summary columns"""
+    link_dir = ARCHIVE_DIR / snapshot.timestamp
+    link = Link(timestamp=snapshot.timestamp, url=snapshot.url, title=None, tags=None, sources=[])
+
+    succeeded = snapshot.archiveresult_set.filter(status='succeeded')
+    screenshot = succeeded.filter(extractor='screenshot').only('output').order_by('start_ts').last()
+
+    try:
+        archive_size = get_dir_size(link_dir)[0]
+    except Exception:
+        archive_size = 0
+
+    try:
+        headers = json.loads((link_dir / 'headers.json').read_text(encoding='utf-8').strip())
+    except Exception:
+        headers = None
+
+    try:
+        status_code = int(headers['Status-Code'])
+    except Exception:
+        status_code = None
+
+    return {
+        'num_outputs': succeeded.count(),
+        'is_archived': link.is_archived,
+        'archive_size': archive_size,
+        'thumbnail_url': screenshot and reverse('Snapshot', args=[f'{snapshot.timestamp}/{screenshot.output}']),
+        'headers': headers,
+        'status_code': status_code,
+    }
 
 
 class ArchiveResultManager(models.Manager):
@@ -279,8 +318,114 @@ class ArchiveResult(models.Model):
     start_ts = models.DateTimeField(db_index=True)
     end_ts = models.DateTimeField()
     status = models.CharField(max_length=16, choices=STATUS_CHOICES)
+    output_size = models.BigIntegerField(default=None, null=True, blank=True)   # bytes on disk, null if the output isn't a file/dir in the snapshot dir
 
     objects = ArchiveResultManager()
 
     def __str__(self):
         return self.extractor
+
+    # the snapshot's cached summaries and details page are keyed on Snapshot.updated,
+    # so bump it whenever one of its results changes (e.g. when edited in the admin)
+    def save(self, *args, **kwargs):
+        from ..index.sql import touch_snapshots
+
+        super().save(*args, **kwargs)
+        touch_snapshots([self.snapshot_id])
+
+    def delete(self, *args, **kwargs):
+        from ..index.sql import touch_snapshots
+
+        snapshot_id = self.snapshot_id
+        result = super().delete(*args, **kwargs)
+        touch_snapshots([snapshot_id])
+        return result
+
+
+class ArchiveFolder(models.Model):
+    """
+    Cached manifest of a data dir in archive/, so that scanning the whole
+    collection only has to re-read the dirs that changed since the last scan
+    (see index.scan_archive_folders)
+    """
+    name = models.CharField(primary_key=True, max_length=256)                  # dir name in archive/, normally the Snapshot timestamp
+    dir_mtime = models.FloatField()
+    index_mtime = models.FloatField(default=None, null=True)                   # null if there is no index.json
+    index_size = models.BigIntegerField(default=None, null=True)
+    url = models.TextField(default=None, null=True)                            # null if index.json is missing or unparseable
+    timestamp = models.CharField(max_length=32, default=None, null=True)
+    is_parseable = models.BooleanField(default=False)
+    needs_repair = models.BooleanField(default=False)                          # index.json is only parseable with guess=True
+    entries = models.TextField(blank=True, default='')                         # newline-separated listdir() of the data dir
+
+    def __str__(self):
+        return self.name
+
+
+TASK_KIND_CHOICES = [
+    ("add", "add"),
+    ("update", "update"),
+    ("update_titles", "update_titles"),
+    ("overwrite", "overwrite"),
+    ("resnapshot", "resnapshot"),
+]
+TASK_STATUS_CHOICES = [
+    ("queued", "queued"),
+    ("running", "running"),
+    ("succeeded", "succeeded"),
+    ("failed", "failed"),
+]
+
+class Task(models.Model):
+    """
+    An add or (re-)archive submitted from the web UI, run in the background by a separate
+    `archivebox manage run_tasks` process instead of inside the HTTP request (see core.tasks)
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+
+    kind = models.CharField(max_length=32, choices=TASK_KIND_CHOICES)
+    kwargs = JSONField(default=dict)                                           # arguments for the kind's function, e.g. urls+depth for add
+    status = models.CharField(max_length=16, choices=TASK_STATUS_CHOICES, default='queued', db_index=True)
+
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, default=None, null=True, blank=True)
+    started = models.DateTimeField(default=None, null=True, blank=True)
+    finished = models.DateTimeField(default=None, null=True, blank=True)
+    pid = models.IntegerField(default=None, null=True, blank=True)               # of the run_tasks process running it
+
+    num_done = models.IntegerField(default=0)
+    num_total = models.IntegerField(default=0)                                   # 0 if not known in advance (e.g. add with depth=1)
+
+    def __str__(self):
+        return f'{self.kind} ({self.status})'
+
+    def get_absolute_url(self):
+        return reverse('task', args=[self.id])
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ('succeeded', 'failed')
+
+
+def generate_api_token() -> str:
+    return secrets.token_hex(20)
+
+class APIToken(models.Model):
+    """
+    Secret token that authenticates a user's requests to the JSON API at /api/v1/ (see core.api),
+    sent as an `Authorization: Bearer <token>` header
+    """
+    id = models.AutoField(primary_key=True, serialize=False, verbose_name='ID')
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    token = models.CharField(max_length=64, unique=True, default=generate_api_token, editable=False)
+    description = models.CharField(max_length=256, default='', blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    last_used = models.DateTimeField(default=None, null=True, blank=True)
+
+    class Meta:
+        verbose_name = "API Token"
+        verbose_name_plural = "API Tokens"
+
+    def __str__(self):
+        return f'{self.user} {self.description}'.strip()
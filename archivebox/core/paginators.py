@@ -0,0 +1,155 @@
+__package__ = 'archivebox.core'
+
+import hashlib
+
+from django.core.cache import cache
+from django.core.paginator import Paginator, Page
+from django.contrib.admin.views.main import ChangeList, PAGE_VAR, ORDER_VAR
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.db.models import Q, Max
+from django.utils.functional import cached_property
+
+from archivebox.search import add_search_snippets
+
+
+# the cursors only work for querysets with this exact (total) ordering
+KEYSET_ORDERING = ('-added', '-pk')
+
+# how long a cached count can be reused for if no snapshot was added or changed
+# (deleted snapshots aren't detected, so they only drop out of the totals after this)
+COUNT_CACHE_TIMEOUT = 60
+
+
+def cached_count(queryset) -> int:
+    """COUNT(*) the given Snapshot queryset, reusing the last result until any snapshot is added or updated"""
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+
+    latest_update = queryset.model.objects.aggregate(latest=Max('updated'))['latest']
+    cache_key = 'count-' + hashlib.sha256(f'{sql} {params} {latest_update}'.encode('utf-8')).hexdigest()
+    return cache.get_or_set(cache_key, queryset.count, timeout=COUNT_CACHE_TIMEOUT)
+
+
+def q_older_than_cursor(cursor: dict) -> Q:
+    """snapshots that come after the given {'pk', 'added'} cursor in KEYSET_ORDERING"""
+    # the outer range lets sqlite seek on the added index instead of scanning for the OR
+    return Q(added__lte=cursor['added']) & (Q(added__lt=cursor['added']) | Q(pk__lt=cursor['pk']))
+
+
+def q_newer_than_cursor(cursor: dict) -> Q:
+    """snapshots that come before the given {'pk', 'added'} cursor in KEYSET_ORDERING"""
+    return Q(added__gte=cursor['added']) & (Q(added__gt=cursor['added']) | Q(pk__gt=cursor['pk']))
+
+
+class KeysetPage(Page):
+    @property
+    def next_cursor(self):
+        return self[len(self) - 1].pk if len(self) else None
+
+    @property
+    def previous_cursor(self):
+        return self[0].pk if len(self) else None
+
+
+class KeysetPaginator(Paginator):
+    """
+    Paginator for Snapshot querysets that seeks straight to the page after/before a given
+    snapshot id (a cursor) instead of skipping over every earlier row with an OFFSET, so
+    following next/previous links costs the same on page 1000 as on page 1.
+
+    Counts are cached (see cached_count), the first and last pages never need an OFFSET,
+    and jumping to any other page number without a cursor falls back to the normal OFFSET.
+    For ranked full-text searches the count is only a lower bound (see count_is_exact).
+    """
+
+    def __init__(self, object_list, per_page, after=None, before=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        ordering = tuple(object_list.query.order_by) if hasattr(object_list, 'query') else ()
+        self.use_keyset = tuple(dict.fromkeys(ordering)) == KEYSET_ORDERING    # admin repeats '-added'
+        self.after = after if self.use_keyset else None
+        self.before = before if self.use_keyset else None
+        # ranked full-text searches only fetch the hits up to the end of the page being shown (see
+        # order_by_search_rank), so their count is only enough to tell if there's a next page,
+        # not the total number of results or which page is the last one
+        annotations = object_list.query.annotations if hasattr(object_list, 'query') else {}
+        self.count_is_exact = 'search_rank' not in annotations
+        self._pages = {}
+
+    @cached_property
+    def count(self) -> int:
+        return cached_count(self.object_list)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if number not in self._pages:
+            self._pages[number] = self._seek_page(number)
+        return self._pages[number]
+
+    def _seek_page(self, number):
+        if not self.use_keyset:
+            return super().page(number)
+
+        cursor = None
+        if self.after or self.before:
+            try:
+                cursor = self.object_list.model.objects.filter(pk=self.after or self.before).values('pk', 'added').first()
+            except ValidationError:
+                pass    # not a valid snapshot id, ignore it
+
+        if cursor and self.after:
+            objects = list(self.object_list.filter(q_older_than_cursor(cursor))[:self.per_page])
+        elif cursor and self.before:
+            objects = list(self.object_list.filter(q_newer_than_cursor(cursor)).reverse()[:self.per_page])[::-1]
+        elif number > 1 and number == self.num_pages:
+            # read the last page backwards from the end instead of skipping over every other page
+            last_page_size = self.count - (number - 1) * self.per_page
+            objects = list(self.object_list.reverse()[:last_page_size])[::-1]
+        else:
+            return super().page(number)
+
+        return self._get_page(objects, number, self)
+
+    def _get_page(self, *args, **kwargs):
+        return KeysetPage(*args, **kwargs)
+
+
+class KeysetChangeList(ChangeList):
+    """admin ChangeList that passes the cursor of the current page along in the next/previous page links"""
+
+    CURSOR_VARS = ('after', 'before')
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        for var in self.CURSOR_VARS:
+            lookup_params.pop(var, None)
+        return lookup_params
+
+    def get_ordering(self, request, queryset):
+        # full-text search results come ranked (see SearchResultsAdminMixin), keep them in
+        # rank order unless a column header was clicked to sort by something else
+        if 'search_rank' in queryset.query.annotations and ORDER_VAR not in self.params:
+            return list(queryset.query.order_by)
+        return super().get_ordering(request, queryset)
+
+    def get_query_string(self, new_params=None, remove=None):
+        new_params = dict(new_params or {})
+        remove = [*(remove or ()), *self.CURSOR_VARS]
+
+        page_num = new_params.get(PAGE_VAR)
+        page = getattr(self, 'keyset_page', None)
+        if page is not None and page_num is not None:
+            if page_num == self.page_num + 1 and page.has_next():
+                new_params['after'] = page.next_cursor
+            elif page_num == self.page_num - 1 and page.has_previous():
+                new_params['before'] = page.previous_cursor
+
+        return super().get_query_string(new_params, remove)
+
+    def get_results(self, request):
+        super().get_results(request)
+        add_search_snippets(self.result_list, self.query)
+        self.keyset_page = None
+        if getattr(self.paginator, 'use_keyset', False) and self.multi_page and not (self.show_all and self.can_show_all):
+            self.keyset_page = self.paginator.page(self.page_num + 1)   # already loaded by super()
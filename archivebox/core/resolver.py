@@ -0,0 +1,165 @@
+__package__ = 'archivebox.core'
+
+import re
+import time
+import threading
+
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from core.models import Snapshot
+
+from ..index import q_startswith
+from ..util import base_url
+
+
+# how many slugs to remember per process, and for how long (changes made by other
+# processes, e.g. `archivebox remove` in a terminal, aren't seen until an entry expires)
+SNAPSHOT_SLUG_CACHE_SIZE = 4096
+SNAPSHOT_SLUG_CACHE_TTL = 60    # seconds
+
+SNAPSHOT_ID_PREFIX_REGEX = re.compile(r'[0-9a-fA-F-]+')
+
+
+class ResolvedSnapshot(NamedTuple):
+    id: str
+    timestamp: str
+    link_dir: str
+    url: str
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Snapshot) -> 'ResolvedSnapshot':
+        return cls(id=str(snapshot.id), timestamp=snapshot.timestamp, link_dir=snapshot.link_dir, url=snapshot.url)
+
+
+class SnapshotSlugCache:
+    """
+    Thread-safe in-process LRU cache of the /archive/<slug>/... slugs (timestamps, ids, and urls)
+    that were already resolved to a Snapshot, so that loading an archived page with hundreds of
+    subresources doesn't look up the same Snapshot hundreds of times.
+    """
+
+    def __init__(self, maxsize: int=SNAPSHOT_SLUG_CACHE_SIZE, ttl: float=SNAPSHOT_SLUG_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, slug: str) -> Optional[ResolvedSnapshot]:
+        with self._lock:
+            entry = self._entries.get(slug)
+            if entry is None:
+                return None
+            snapshot, expires, _ = entry
+            if expires < time.monotonic():
+                del self._entries[slug]
+                return None
+            self._entries.move_to_end(slug)
+            return snapshot
+
+    def set(self, slug: str, snapshot: ResolvedSnapshot, exact: bool=True) -> None:
+        """
+        exact is whether the slug can only ever resolve to this snapshot, if it was a
+        prefix or fallback match a newly added snapshot may make it ambiguous
+        """
+        with self._lock:
+            self._entries[slug] = (snapshot, time.monotonic() + self.ttl, exact)
+            self._entries.move_to_end(slug)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, snapshot_id: Optional[str]=None) -> None:
+        """forget every slug that resolved to the given snapshot (or all of them)"""
+        with self._lock:
+            if snapshot_id is None:
+                self._entries.clear()
+                return
+            for slug, (snapshot, _, _) in list(self._entries.items()):
+                if snapshot.id == snapshot_id:
+                    del self._entries[slug]
+
+    def invalidate_inexact(self) -> None:
+        """forget every slug that was resolved with a prefix or fallback match"""
+        with self._lock:
+            for slug, (_, _, exact) in list(self._entries.items()):
+                if not exact:
+                    del self._entries[slug]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+snapshot_slug_cache = SnapshotSlugCache()
+
+
+@receiver(post_save, sender=Snapshot)
+@receiver(post_delete, sender=Snapshot)
+def invalidate_snapshot_slugs(sender, instance, created=False, **kwargs):
+    # the url or timestamp may have changed (or the snapshot is gone), re-resolve it next time
+    snapshot_slug_cache.invalidate(str(instance.id))
+    if created:
+        # the new snapshot may match the id prefixes / base urls that resolved to another one before
+        snapshot_slug_cache.invalidate_inexact()
+
+
+def is_full_id(slug: str) -> bool:
+    return len(slug.replace('-', '')) == 32
+
+
+def resolve_snapshot_slug(slug: str) -> ResolvedSnapshot:
+    """
+    find the Snapshot for an /archive/<timestamp or id prefix>/ slug,
+    raises Snapshot.DoesNotExist or Snapshot.MultipleObjectsReturned like .get()
+    """
+    resolved = snapshot_slug_cache.get(slug)
+    if resolved is None:
+        snapshots = Snapshot.objects.only('id', 'timestamp', 'url')
+        exact = True
+        try:
+            # exact timestamp first, it's the only indexed lookup
+            snapshot = snapshots.get(timestamp=slug)
+        except Snapshot.DoesNotExist:
+            if not SNAPSHOT_ID_PREFIX_REGEX.fullmatch(slug):
+                raise
+            snapshot = snapshots.get(id__startswith=slug)
+            exact = is_full_id(slug)
+        resolved = ResolvedSnapshot.from_snapshot(snapshot)
+        snapshot_slug_cache.set(slug, resolved, exact=exact)
+    return resolved
+
+
+def resolve_snapshot_url(path: str) -> ResolvedSnapshot:
+    """
+    find the Snapshot for an /archive/<url>/ path, trying the most specific matches first,
+    raises Snapshot.DoesNotExist or Snapshot.MultipleObjectsReturned like .get()
+    """
+    resolved = snapshot_slug_cache.get(path)
+    if resolved is None:
+        snapshots = Snapshot.objects.only('id', 'timestamp', 'url')
+        url_base = base_url(path)
+        exact = True
+        try:
+            # try exact match on full url first
+            snapshot = snapshots.get(Q(url='http://' + path) | Q(url='https://' + path))
+        except Snapshot.DoesNotExist:
+            exact = is_full_id(path)
+            try:
+                # then a snapshot id prefix (only worth the unindexed LIKE if it could be one)
+                if not SNAPSHOT_ID_PREFIX_REGEX.fullmatch(path):
+                    raise Snapshot.DoesNotExist()
+                snapshot = snapshots.get(id__startswith=path)
+            except Snapshot.DoesNotExist:
+                # fall back to match on exact base_url
+                exact = False
+                try:
+                    snapshot = snapshots.get(base_url=url_base)
+                except Snapshot.DoesNotExist:
+                    # fall back to matching base_url as prefix
+                    snapshot = snapshots.get(q_startswith('base_url', url_base))
+        resolved = ResolvedSnapshot.from_snapshot(snapshot)
+        snapshot_slug_cache.set(path, resolved, exact=exact)
+    return resolved
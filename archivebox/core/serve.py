@@ -0,0 +1,162 @@
+__package__ = 'archivebox.core'
+
+import re
+import stat
+import mimetypes
+import posixpath
+
+from pathlib import Path
+from typing import Optional, Tuple, Iterator, BinaryIO
+from urllib.parse import quote
+
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse, Http404
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from django.views.static import directory_index, was_modified_since
+
+from ..config import OUTPUT_DIR, SENDFILE_HEADER, SENDFILE_URL_PREFIX
+
+
+BYTE_RANGE_REGEX = re.compile(r'^bytes=(\d*)-(\d*)$')
+RANGE_CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def parse_byte_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    get the (first, last) byte positions requested by a Range: bytes=... header, or None
+    to send the whole file (no header, a syntax we don't understand, or multiple ranges)
+    """
+    match = header and BYTE_RANGE_REGEX.match(header.strip())
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        # suffix range, e.g. bytes=-500 for the last 500 bytes
+        if int(last) == 0 or size == 0:
+            raise RangeNotSatisfiable(header)
+        return max(size - int(last), 0), size - 1
+
+    first = int(first)
+    if last and int(last) < first:
+        return None
+    if first >= size:
+        raise RangeNotSatisfiable(header)
+    return first, min(int(last), size - 1) if last else size - 1
+
+
+def iter_file_range(file: BinaryIO, first: int, length: int) -> Iterator[bytes]:
+    with file:
+        file.seek(first)
+        while length > 0:
+            chunk = file.read(min(RANGE_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def sendfile_response(fullpath: Path) -> Optional[HttpResponse]:
+    """empty response telling the fronting proxy to send the file itself, if SENDFILE_HEADER is configured"""
+    if not SENDFILE_HEADER:
+        return None
+
+    if SENDFILE_HEADER.lower() == 'x-accel-redirect':
+        # nginx wants the uri of an internal location that maps to OUTPUT_DIR
+        try:
+            relative_path = fullpath.resolve().relative_to(Path(OUTPUT_DIR).resolve())
+        except ValueError:
+            return None
+        header_value = SENDFILE_URL_PREFIX.rstrip('/') + '/' + quote(str(relative_path))
+    else:
+        # X-Sendfile (apache mod_xsendfile) and X-Lighttpd-Send-File want the path on disk
+        header_value = str(fullpath.resolve())
+
+    response = HttpResponse()
+    response[SENDFILE_HEADER] = header_value
+    return response
+
+
+def serve_archive_file(request, path: str, document_root: str, show_indexes: bool=False) -> HttpResponse:
+    """
+    Drop-in replacement for django.views.static.serve for the files in the archive that also:
+      - answers If-None-Match with a 304 using a strong ETag (inode, mtime, and size)
+      - answers Range (and If-Range) requests with a 206 so media can be seeked
+      - hands the actual sending off to a fronting proxy if SENDFILE_HEADER is set,
+        or to the WSGI server's wsgi.file_wrapper (os.sendfile() under gunicorn/uwsgi)
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    fullpath = Path(safe_join(document_root, path))
+    if fullpath.is_dir():
+        if show_indexes:
+            return directory_index(path, fullpath)
+        raise Http404('Directory indexes are not allowed here.')
+
+    try:
+        statobj = fullpath.stat()
+    except OSError:
+        raise Http404(f'"{fullpath}" does not exist')
+    if not stat.S_ISREG(statobj.st_mode):
+        raise Http404(f'"{fullpath}" is not a file')
+
+    size = statobj.st_size
+    etag = f'"{statobj.st_ino:x}-{statobj.st_mtime_ns:x}-{size:x}"'
+    last_modified = http_date(statobj.st_mtime)
+
+    # If-None-Match takes precedence over If-Modified-Since when both are sent
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        not_modified = if_none_match.strip() == '*' or etag in (tag.replace('W/', '', 1) for tag in parse_etags(if_none_match))
+    else:
+        not_modified = not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), statobj.st_mtime, size)
+
+    content_type, encoding = mimetypes.guess_type(str(fullpath))
+    content_type = content_type or 'application/octet-stream'
+
+    if not_modified:
+        response = HttpResponseNotModified()
+    else:
+        response = sendfile_response(fullpath)
+
+    if response is None:
+        # only honor the Range if the client's copy (If-Range) is still current
+        if_range = request.META.get('HTTP_IF_RANGE')
+        range_is_current = (
+            if_range is None
+            or if_range.strip() == etag
+            or parse_http_date_safe(if_range) == int(statobj.st_mtime)
+        )
+        try:
+            byte_range = parse_byte_range(request.META.get('HTTP_RANGE'), size) if range_is_current else None
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            byte_range = None
+
+        if byte_range:
+            first, last = byte_range
+            response = StreamingHttpResponse(
+                iter_file_range(fullpath.open('rb'), first, last - first + 1),
+                status=206,
+                content_type=content_type,
+            )
+            response['Content-Range'] = f'bytes {first}-{last}/{size}'
+            response['Content-Length'] = str(last - first + 1)
+        elif response is None:
+            response = FileResponse(fullpath.open('rb'), content_type=content_type)
+
+    if response.status_code in (200, 206):
+        response['Content-Type'] = content_type
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = last_modified
+    response['ETag'] = etag
+    return response
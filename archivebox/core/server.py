@@ -0,0 +1,55 @@
+__package__ = 'archivebox.core'
+
+from typing import Any, Dict
+
+from django.db import connections
+from django.core.wsgi import get_wsgi_application
+from django.contrib.staticfiles.handlers import StaticFilesHandler
+
+from gunicorn.app.base import BaseApplication
+
+
+def post_fork(server, worker) -> None:
+    # sqlite3 connections must never be shared across a fork(), each worker opens its own
+    connections.close_all()
+
+
+class ArchiveBoxServer(BaseApplication):
+    """
+    Runs the ArchiveBox WSGI app in a gunicorn prefork server: the app is loaded once in the
+    master (preload_app) and forked into N workers with a pool of threads each. Workers are
+    recycled after max_requests (+ jitter so they don't all restart at once), and a SIGHUP to
+    the master gracefully replaces them without dropping in-flight requests (forked from the
+    same preloaded app, so config and code changes need a full restart of the master).
+    """
+
+    def __init__(self, bind: str, workers: int, threads: int, max_requests: int, timeout: int, debug: bool=False):
+        self.options: Dict[str, Any] = {
+            'bind': bind,
+            'workers': workers,
+            'threads': threads,
+            'worker_class': 'gthread',
+            'preload_app': True,
+            'max_requests': max_requests,
+            'max_requests_jitter': max(max_requests // 10, 1) if max_requests else 0,
+            'timeout': timeout,
+            'graceful_timeout': timeout,
+            'keepalive': 5,
+            'accesslog': '-' if debug else None,
+            'errorlog': '-',
+            'loglevel': 'debug' if debug else 'info',
+            'proc_name': 'archivebox server',
+            'post_fork': post_fork,
+        }
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            if value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        # serve /static/ from the app itself, same as runserver --insecure does
+        application = StaticFilesHandler(get_wsgi_application())
+        connections.close_all()
+        return application
@@ -17,6 +17,7 @@ from ..config import (
     TEMPLATES_DIR_NAME,
     CUSTOM_TEMPLATES_DIR,
     SQL_INDEX_FILENAME,
+    CACHE_DB_FILENAME,
     OUTPUT_DIR,
     LOGS_DIR,
     TIME_ZONE,
@@ -159,14 +160,20 @@ DATABASES = {
     }
 }
 
-CACHE_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
-# CACHE_BACKEND = 'django.core.cache.backends.db.DatabaseCache'
+CACHE_BACKEND = 'core.cache.SQLiteCache'
+# CACHE_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
 # CACHE_BACKEND = 'django.core.cache.backends.dummy.DummyCache'
 
 CACHES = {
     'default': {
         'BACKEND': CACHE_BACKEND,
-        'LOCATION': 'django_cache_default',
+        'LOCATION': str(Path(OUTPUT_DIR) / CACHE_DB_FILENAME),
+        # the cached summaries are keyed on {Snapshot.id}-{Snapshot.updated}, so they never need to expire,
+        # stale ones just stop being read and get evicted once the cache is full
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_SIZE': 64 * 1024 * 1024,   # bytes
+        },
     }
 }
 
@@ -0,0 +1,215 @@
+__package__ = 'archivebox.core'
+
+import os
+import sys
+import fcntl
+import threading
+import subprocess
+
+from pathlib import Path
+from datetime import datetime, timezone
+from contextlib import contextmanager, redirect_stdout, redirect_stderr
+from typing import Iterable, Iterator, Optional
+
+from core.models import Snapshot, Task
+
+from ..config import OUTPUT_DIR, LOGS_DIR
+from ..util import ansi_to_html
+from ..main import add
+from ..extractors import archive_links
+
+
+TASK_LOGS_DIR = LOGS_DIR / 'tasks'
+TASK_RUNNER_LOCK = TASK_LOGS_DIR / 'runner.lock'     # held by the one runner process working through the queue
+TASK_OUTPUT_MAX_BYTES = 256 * 1024      # only show the end of the output of huge tasks on the progress page
+
+
+def enqueue_task(kind: str, created_by=None, num_total: int=0, **kwargs) -> Task:
+    """save a new Task to run in the background, and make sure there's a runner to pick it up"""
+    task = Task.objects.create(
+        kind=kind,
+        kwargs=kwargs,
+        num_total=num_total,
+        created_by=created_by if created_by and created_by.is_authenticated else None,
+    )
+    start_task_runner()
+    return task
+
+
+@contextmanager
+def task_runner_lock() -> Iterator[bool]:
+    """try to take the lock that only one task runner can hold at a time, yields whether it was taken"""
+    TASK_LOGS_DIR.mkdir(parents=True, exist_ok=True)
+    with open(TASK_RUNNER_LOCK, 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def start_task_runner() -> None:
+    """
+    spawn a detached `archivebox manage run_tasks` process that works through the queued Tasks,
+    (its own session so it outlives the request, and the server worker getting recycled)
+    if one isn't running already, otherwise that one picks up the new Task (see run_queued_tasks)
+    """
+    with task_runner_lock() as is_free:
+        if not is_free:
+            return
+
+    runner = subprocess.Popen(
+        [sys.executable, '-m', 'archivebox', 'manage', 'run_tasks'],
+        cwd=OUTPUT_DIR,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    # reap it when it exits so it doesn't linger as a zombie of the server worker
+    threading.Thread(target=runner.wait, name='TaskRunnerReaper', daemon=True).start()
+
+
+def task_log_path(task: Task) -> Path:
+    return TASK_LOGS_DIR / f'{task.id}.log'
+
+
+def is_runner_alive(task: Task) -> bool:
+    if task.pid is None:
+        return False
+    try:
+        os.kill(task.pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def get_task_progress(task: Task) -> dict:
+    """current status of a Task for the progress page, marking it failed if its runner died"""
+    if task.status == 'running' and not is_runner_alive(task):
+        Task.objects.filter(pk=task.pk, status='running').update(status='failed', finished=datetime.now(timezone.utc))
+        task.refresh_from_db()
+
+    try:
+        with open(task_log_path(task), 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(f.tell() - TASK_OUTPUT_MAX_BYTES, 0))
+            output = f.read().decode('utf-8', errors='replace')
+    except FileNotFoundError:
+        output = ''
+
+    return {
+        'id': str(task.id),
+        'kind': task.kind,
+        'status': task.status,
+        'is_finished': task.is_finished,
+        'num_done': task.num_done,
+        'num_total': task.num_total,
+        'created': task.created.isoformat(),
+        'started': task.started and task.started.isoformat(),
+        'finished': task.finished and task.finished.isoformat(),
+        'output': ansi_to_html(output.strip()),
+    }
+
+
+class TaskProgress:
+    """
+    wraps the items a Task works through, bumping the Task's num_done as each one is
+    finished (i.e. when the next one is pulled), without archive_links having to know
+    """
+
+    def __init__(self, task: Task, items: list):
+        self.task = task
+        self.items = items
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __iter__(self) -> Iterator:
+        for idx, item in enumerate(self.items):
+            Task.objects.filter(pk=self.task.pk).update(num_done=idx)
+            yield item
+        Task.objects.filter(pk=self.task.pk).update(num_done=len(self.items))
+
+
+def snapshot_links(snapshot_ids: Iterable[str]) -> list:
+    snapshots = Snapshot.objects.filter(id__in=snapshot_ids).prefetch_related('tags').order_by('-added')
+    return [snapshot.as_link() for snapshot in snapshots]
+
+
+def run_task(task: Task) -> None:
+    kwargs = task.kwargs
+    if task.kind == 'add':
+        add(**kwargs, out_dir=OUTPUT_DIR)
+    elif task.kind == 'update':
+        archive_links(TaskProgress(task, snapshot_links(kwargs['snapshot_ids'])), out_dir=OUTPUT_DIR)
+    elif task.kind == 'update_titles':
+        archive_links(TaskProgress(task, snapshot_links(kwargs['snapshot_ids'])), overwrite=True, methods=('title', 'favicon'), out_dir=OUTPUT_DIR)
+    elif task.kind == 'overwrite':
+        archive_links(TaskProgress(task, snapshot_links(kwargs['snapshot_ids'])), overwrite=True, out_dir=OUTPUT_DIR)
+    elif task.kind == 'resnapshot':
+        for link in TaskProgress(task, snapshot_links(kwargs['snapshot_ids'])):
+            timestamp = datetime.now(timezone.utc).isoformat('T', 'seconds')
+            new_url = link.url.split('#')[0] + f'#{timestamp}'
+            add(new_url, tag=link.tags or '', out_dir=OUTPUT_DIR)
+    else:
+        raise ValueError(f'Unknown task kind: {task.kind}')
+
+
+def claim_next_task() -> Optional[Task]:
+    """atomically take the oldest queued Task, so that concurrent runners never run the same one"""
+    while True:
+        task = Task.objects.filter(status='queued').order_by('created').first()
+        if task is None:
+            return None
+        claimed = Task.objects.filter(pk=task.pk, status='queued').update(
+            status='running',
+            started=datetime.now(timezone.utc),
+            pid=os.getpid(),
+        )
+        if claimed:
+            task.refresh_from_db()
+            return task
+
+
+def run_queued_tasks() -> int:
+    """
+    run queued Tasks one at a time until there are none left, returns how many were run
+    (none if another runner already holds the lock, it will run them instead)
+    """
+    num_run = 0
+    while True:
+        with task_runner_lock() as is_runner:
+            if not is_runner:
+                return num_run
+            num_run += run_tasks_until_empty()
+
+        # a Task queued while the last one was finishing saw the lock held and didn't start a
+        # runner of its own, so check once more now that it's released before exiting
+        if not Task.objects.filter(status='queued').exists():
+            return num_run
+
+
+def run_tasks_until_empty() -> int:
+    num_run = 0
+    while True:
+        task = claim_next_task()
+        if task is None:
+            return num_run
+
+        status = 'succeeded'
+        with open(task_log_path(task), 'a', encoding='utf-8', buffering=1) as log, redirect_stdout(log), redirect_stderr(log):
+            try:
+                run_task(task)
+            except (Exception, SystemExit) as err:
+                status = 'failed'
+                print(f'[X] {task.kind} failed: {err.__class__.__name__} {err}')
+
+        Task.objects.filter(pk=task.pk).update(status=status, finished=datetime.now(timezone.utc))
+        num_run += 1
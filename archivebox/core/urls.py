@@ -6,7 +6,8 @@ from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from django.conf import settings
 from django.views.generic.base import RedirectView
 
-from core.views import HomepageView, SnapshotView, PublicIndexView, AddView, HealthCheckView
+from core.views import HomepageView, SnapshotView, PublicIndexView, AddView, TaskView, HealthCheckView
+from core import api
 
 
 # print('DEBUG', settings.DEBUG)
@@ -24,6 +25,7 @@ urlpatterns = [
 
     path('admin/core/snapshot/add/', RedirectView.as_view(url='/add/')),
     path('add/', AddView.as_view(), name='add'),
+    path('tasks/<uuid:task_id>/', TaskView.as_view(), name='task'),
 
     path('accounts/login/', RedirectView.as_view(url='/admin/login/')),
     path('accounts/logout/', RedirectView.as_view(url='/admin/logout/')),
@@ -34,6 +36,12 @@ urlpatterns = [
 
     path('health/', HealthCheckView.as_view(), name='healthcheck'),
 
+    path('api/v1/core/snapshot/', api.snapshots, name='api-snapshots'),
+    path('api/v1/core/snapshot/<uuid:snapshot_id>/', api.snapshot, name='api-snapshot'),
+    path('api/v1/core/archiveresult/', api.archiveresults, name='api-archiveresults'),
+    path('api/v1/core/tag/', api.tags, name='api-tags'),
+    path('api/v1/core/task/<uuid:task_id>/', api.task, name='api-task'),
+
     path('index.html', RedirectView.as_view(url='/')),
     path('index.json', static.serve, {'document_root': settings.OUTPUT_DIR, 'path': 'index.json'}),
     path('', HomepageView.as_view(), name='Home'),
@@ -56,7 +64,7 @@ if settings.DEBUG_TOOLBAR:
 # path('/admin',           admin.site.urls)
 # path('/accounts',        django.contrib.auth.urls)
 
-# # Prposed REST API spec
+# # Prposed REST API spec (the read + bulk parts are implemented so far, see core/api.py)
 # # :slugs can be uuid, short_uuid, or any of the unique index_fields
 # path('api/v1/'),
 # path('api/v1/core/'                      [GET])
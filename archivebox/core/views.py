@@ -1,24 +1,24 @@
 __package__ = 'archivebox.core'
 
-from io import StringIO
-from contextlib import redirect_stdout
 
 from django.shortcuts import render, redirect
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, JsonResponse, Http404
 from django.utils.html import format_html, mark_safe
-from django.views import View, static
+from django.views import View
 from django.views.generic.list import ListView
 from django.views.generic import FormView
-from django.db.models import Q
 from django.contrib.auth.mixins import UserPassesTestMixin
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 
-from core.models import Snapshot
+from core.models import Snapshot, Task
 from core.forms import AddLinkForm
+from core.paginators import KeysetPaginator, KEYSET_ORDERING
+from core.serve import serve_archive_file
+from core.resolver import resolve_snapshot_slug, resolve_snapshot_url
+from core.tasks import enqueue_task, get_task_progress
 
 from ..config import (
-    OUTPUT_DIR,
     PUBLIC_INDEX,
     PUBLIC_SNAPSHOTS,
     PUBLIC_ADD_VIEW,
@@ -26,9 +26,12 @@ from ..config import (
     FOOTER_INFO,
     SNAPSHOTS_PER_PAGE,
 )
-from ..main import add
-from ..util import base_url, ansi_to_html
-from ..search import query_search_index
+from ..index import q_startswith
+from ..index.sql import q_snapshot_search, q_snapshot_ids, order_by_search_rank
+from ..index.html import snapshot_details_template
+from ..util import base_url
+from ..search import search_index_ids, add_search_snippets
+
 
 
 class HomepageView(View):
@@ -63,8 +66,14 @@ class SnapshotView(View):
 
             try:
                 try:
-                    snapshot = Snapshot.objects.get(Q(timestamp=slug) | Q(id__startswith=slug))
-                    response = static.serve(request, archivefile, document_root=snapshot.link_dir, show_indexes=True)
+                    snapshot = resolve_snapshot_slug(slug)
+                    if archivefile == 'index.html':
+                        # render the snapshot details page from the db, the index.html file may be outdated or missing
+                        response = HttpResponse(snapshot_details_template(
+                            Snapshot.objects.get(pk=snapshot.id)
+                        ))
+                    else:
+                        response = serve_archive_file(request, archivefile, document_root=snapshot.link_dir, show_indexes=True)
                     response["Link"] = f'<{snapshot.url}>; rel="canonical"'
                     return response
                 except Snapshot.DoesNotExist:
@@ -141,23 +150,9 @@ class SnapshotView(View):
                     status=404,
                 )
         # slug is a URL
+        url_base = base_url(path)
         try:
-            try:
-                # try exact match on full url first
-                snapshot = Snapshot.objects.get(
-                    Q(url='http://' + path) | Q(url='https://' + path) | Q(id__startswith=path)
-                )
-            except Snapshot.DoesNotExist:
-                # fall back to match on exact base_url
-                try:
-                    snapshot = Snapshot.objects.get(
-                        Q(url='http://' + base_url(path)) | Q(url='https://' + base_url(path))
-                    )
-                except Snapshot.DoesNotExist:
-                    # fall back to matching base_url as prefix
-                    snapshot = Snapshot.objects.get(
-                        Q(url__startswith='http://' + base_url(path)) | Q(url__startswith='https://' + base_url(path))
-                    )
+            snapshot = resolve_snapshot_url(path)
             return redirect(f'/archive/{snapshot.timestamp}/index.html')
         except Snapshot.DoesNotExist:
             return HttpResponse(
@@ -169,7 +164,7 @@ class SnapshotView(View):
                         '+ <i><a href="/add/?url={}" target="_top">Add a new Snapshot for <code>{}</code></a><br/><br/></i>'
                         '</center>'
                     ),
-                    base_url(path),
+                    url_base,
                     path if '://' in path else f'https://{path}',
                     path,
                 ),
@@ -187,7 +182,7 @@ class SnapshotView(View):
                     snap.title or '',
                 )
                 for snap in Snapshot.objects.filter(
-                    Q(url__startswith='http://' + base_url(path)) | Q(url__startswith='https://' + base_url(path))
+                    q_startswith('base_url', url_base)
                 ).only('url', 'timestamp', 'title', 'added').order_by('-added')
             )
             return HttpResponse(
@@ -195,7 +190,7 @@ class SnapshotView(View):
                     (
                         'Multiple Snapshots match the given URL <code>{}</code><br/><pre>'
                     ),
-                    base_url(path),
+                    url_base,
                 ) + snapshot_hrefs + format_html(
                     (
                         '</pre><br/>'
@@ -211,11 +206,20 @@ class PublicIndexView(ListView):
     template_name = 'public_index.html'
     model = Snapshot
     paginate_by = SNAPSHOTS_PER_PAGE
-    ordering = ['-added']
+    paginator_class = KeysetPaginator
+    ordering = list(KEYSET_ORDERING)
+
+    def get_paginator(self, *args, **kwargs):
+        # next/previous links pass the id of the snapshot the page should start after/before
+        kwargs['after'] = self.request.GET.get('after')
+        kwargs['before'] = self.request.GET.get('before')
+        return super().get_paginator(*args, **kwargs)
 
     def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        add_search_snippets(context['object_list'], self.request.GET.get('q') or '')
         return {
-            **super().get_context_data(**kwargs),
+            **context,
             'VERSION': VERSION,
             'FOOTER_INFO': FOOTER_INFO,
         }
@@ -224,12 +228,18 @@ class PublicIndexView(ListView):
         qs = super().get_queryset(**kwargs)
         query = self.request.GET.get('q')
         if query and query.strip():
-            qs = qs.filter(Q(title__icontains=query) | Q(url__icontains=query) | Q(timestamp__icontains=query) | Q(tags__name__icontains=query))
+            # only fetch the full-text results up to the end of the page being shown, best matches
+            # first, followed by the rest of the snapshots whose title/url/tags match, newest first
+            page = self.request.GET.get('page') or '1'
+            limit = int(page) * self.paginate_by + 1 if page.isdigit() else None
             try:
-                qs = qs | query_search_index(query)
+                ranked_ids = search_index_ids(query, limit=limit)
             except Exception as err:
                 print(f'[!] Error while using search backend: {err.__class__.__name__} {err}')
-        return qs
+                ranked_ids = []
+            qs = order_by_search_rank(qs.filter(q_snapshot_search(query) | q_snapshot_ids(ranked_ids)), ranked_ids)
+        # the tags are rendered from the denormalized tag_names column, no need to load them
+        return qs.prefetch_related('archiveresult_set')
 
     def get(self, *args, **kwargs):
         if PUBLIC_INDEX or self.request.user.is_authenticated:
@@ -263,7 +273,6 @@ class AddView(UserPassesTestMixin, FormView):
             'absolute_add_path': self.request.build_absolute_uri(self.request.path),
             'VERSION': VERSION,
             'FOOTER_INFO': FOOTER_INFO,
-            'stdout': '',
         }
 
     def form_valid(self, form):
@@ -279,22 +288,40 @@ class AddView(UserPassesTestMixin, FormView):
             "depth": depth,
             "parser": parser,
             "update_all": False,
-            "out_dir": OUTPUT_DIR,
         }
         if extractors:
             input_kwargs.update({"extractors": extractors})
-        add_stdout = StringIO()
-        with redirect_stdout(add_stdout):
-            add(**input_kwargs)
-            print(add_stdout.getvalue())
 
-        context = self.get_context_data()
+        # adding can take hours, run it in the background and show its progress instead
+        task = enqueue_task('add', created_by=self.request.user, **input_kwargs)
+        return redirect(task)
+
 
-        context.update({
-            "stdout": ansi_to_html(add_stdout.getvalue().strip()),
-            "form": AddLinkForm()
+class TaskView(UserPassesTestMixin, View):
+    """
+    Progress page for a background Task (see core.tasks), polls ?format=json until it's finished
+    """
+
+    def test_func(self):
+        return PUBLIC_ADD_VIEW or self.request.user.is_authenticated
+
+    def get(self, request, task_id):
+        try:
+            task = Task.objects.get(pk=task_id)
+        except Task.DoesNotExist:
+            raise Http404('Task not found')
+
+        progress = get_task_progress(task)
+        if request.GET.get('format') == 'json':
+            return JsonResponse(progress)
+
+        return render(template_name='core/task.html', request=request, context={
+            'title': f'{task.kind.replace("_", " ").title()} progress',
+            'task': task,
+            'progress': progress,
+            'VERSION': VERSION,
+            'FOOTER_INFO': FOOTER_INFO,
         })
-        return render(template_name=self.template_name, request=self.request, context=context)
 
 
 class HealthCheckView(View):
@@ -6,14 +6,16 @@ from pathlib import Path
 from typing import Optional, List, Iterable, Union
 from datetime import datetime, timezone
 from django.db.models import QuerySet
+from django.urls import reverse
 
 from ..index.schema import Link
-from ..index.sql import write_link_to_sql_index
+from ..index.sql import write_link_to_sql_index, sql_writer
 from ..index import (
     load_link_details,
     write_link_details,
 )
 from ..util import enforce_types
+from ..system import get_output_size
 from ..logging_util import (
     log_archiving_started,
     log_archiving_paused,
@@ -23,7 +25,7 @@ from ..logging_util import (
     log_archive_method_started,
     log_archive_method_finished,
 )
-from ..search import write_search_index
+from ..search import write_search_text, write_search_index
 
 from .title import should_save_title, save_title
 from .favicon import should_save_favicon, save_favicon
@@ -75,7 +77,7 @@ def archive_link(link: Link, overwrite: bool=False, methods: Optional[Iterable[s
     try:
         snapshot = Snapshot.objects.get(url=link.url) # TODO: This will be unnecessary once everything is a snapshot
     except Snapshot.DoesNotExist:
-        snapshot = write_link_to_sql_index(link)
+        snapshot = sql_writer.write(write_link_to_sql_index, link)
 
     ARCHIVE_METHODS = get_default_archive_methods()
     
@@ -92,7 +94,8 @@ def archive_link(link: Link, overwrite: bool=False, methods: Optional[Iterable[s
             os.makedirs(out_dir)
 
         link = load_link_details(link, out_dir=out_dir)
-        write_link_details(link, out_dir=out_dir, skip_sql_index=False)
+        # index.html is only rendered once everything is done, nothing reads it in the meantime
+        write_link_details(link, out_dir=out_dir, skip_sql_index=False, skip_html_index=True)
         log_link_archiving_started(link, out_dir, is_new)
         link = link.overwrite(updated=datetime.now(timezone.utc))
         stats = {'skipped': 0, 'succeeded': 0, 'failed': 0}
@@ -112,17 +115,27 @@ def archive_link(link: Link, overwrite: bool=False, methods: Optional[Iterable[s
 
                     stats[result.status] += 1
                     log_archive_method_finished(result)
-                    write_search_index(link=link, texts=result.index_texts)
-                    ArchiveResult.objects.create(snapshot=snapshot, extractor=method_name, cmd=result.cmd, cmd_version=result.cmd_version,
-                                                 output=result.output, pwd=result.pwd, start_ts=result.start_ts, end_ts=result.end_ts, status=result.status)
-
-
-                    # bump the updated time on the main Snapshot here, this is critical
-                    # to be able to cache summaries of the ArchiveResults for a given
-                    # snapshot without having to load all the results from the DB each time.
-                    # (we use {Snapshot.id}-{Snapshot.updated} as the cache key and assume
-                    # ArchiveResults are unchanged as long as the updated timestamp is unchanged)
-                    snapshot.save()
+                    output_size = get_output_size(out_dir, result.output) if result.status == 'succeeded' else None
+
+                    # keep the cheap summary columns live while archiving, the rest are recounted once all methods are done
+                    if result.status == 'succeeded':
+                        snapshot.num_outputs += 1
+                        if method_name == 'screenshot':
+                            snapshot.thumbnail_url = reverse('Snapshot', args=[f'{snapshot.timestamp}/{result.output}'])
+
+                    def save_result():
+                        ArchiveResult.objects.create(snapshot=snapshot, extractor=method_name, cmd=result.cmd, cmd_version=result.cmd_version,
+                                                     output=result.output, pwd=result.pwd, start_ts=result.start_ts, end_ts=result.end_ts, status=result.status,
+                                                     output_size=output_size)
+
+                        # bump the updated time on the main Snapshot here, this is critical
+                        # to be able to cache summaries of the ArchiveResults for a given
+                        # snapshot without having to load all the results from the DB each time.
+                        # (we use {Snapshot.id}-{Snapshot.updated} as the cache key and assume
+                        # ArchiveResults are unchanged as long as the updated timestamp is unchanged)
+                        snapshot.save()
+
+                    sql_writer.write(save_result)
                 else:
                     # print('{black}      X {}{reset}'.format(method_name, **ANSI))
                     stats['skipped'] += 1
@@ -134,6 +147,13 @@ def archive_link(link: Link, overwrite: bool=False, methods: Optional[Iterable[s
 
         # print('    ', stats)
 
+        if stats['succeeded']:
+            # index the snapshot once with the plain text of its new outputs, instead of once per extractor
+            write_search_index(link=link, texts=[write_search_text(link, out_dir=Path(out_dir))])
+
+        snapshot.update_summary(save=False)
+        sql_writer.write(snapshot.save)
+
         try:
             latest_title = link.history['title'][-1].output.strip()
             if latest_title and len(latest_title) >= len(link.title or ''):
@@ -143,6 +163,10 @@ def archive_link(link: Link, overwrite: bool=False, methods: Optional[Iterable[s
 
         write_link_details(link, out_dir=out_dir, skip_sql_index=False)
 
+        # prewarm the shared cache with the summaries shown in the snapshot lists, they're keyed
+        # on Snapshot.updated so this has to happen after the last save above bumped it
+        Snapshot.objects.get(pk=snapshot.pk).icons()
+
         log_link_archiving_finished(link, link.link_dir, is_new, stats, start_ts)
 
     except KeyboardInterrupt:
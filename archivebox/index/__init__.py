@@ -1,18 +1,23 @@
 __package__ = 'archivebox.index'
 
 import os
+import re
 import shutil
 from pathlib import Path
 
-from itertools import chain
-from typing import List, Tuple, Dict, Optional, Iterable
-from collections import OrderedDict
+from itertools import chain, islice
+from typing import List, Tuple, Dict, Optional, Iterable, Iterator
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from contextlib import contextmanager
 from urllib.parse import urlparse
 from django.db.models import QuerySet, Q
+from django.db import transaction
 
 from ..util import (
     scheme,
+    domain,
+    regex_literals,
     enforce_types,
     ExtendedEncoder,
 )
@@ -25,8 +30,11 @@ from ..config import (
     URL_BLACKLIST_PTN,
     URL_WHITELIST_PTN,
     stderr,
-    OUTPUT_PERMISSIONS
+    OUTPUT_PERMISSIONS,
+    ENFORCE_ATOMIC_WRITES,
+    SAVE_SNAPSHOT_HTML_INDEX,
 )
+from ..system import get_dir_size, get_output_size
 from ..logging_util import (
     TimedProgress,
     log_indexing_process_started,
@@ -49,9 +57,10 @@ from .json import (
 from .sql import (
     write_sql_main_index,
     write_sql_link_details,
+    q_snapshot_ids,
 )
 
-from ..search import search_backend_enabled, query_search_index
+from ..search import search_backend_enabled, search_index_ids
 
 ### Link filtering and checking
 
@@ -329,11 +338,13 @@ def dedupe_links(snapshots: QuerySet,
 ### Link Details Index
 
 @enforce_types
-def write_link_details(link: Link, out_dir: Optional[str]=None, skip_sql_index: bool=False) -> None:
+def write_link_details(link: Link, out_dir: Optional[str]=None, skip_sql_index: bool=False, skip_html_index: bool=False) -> None:
     out_dir = out_dir or link.link_dir
 
     write_json_link_details(link, out_dir=out_dir)
-    write_html_link_details(link, out_dir=out_dir)
+    # the server renders the snapshot index.html from the db, the file is only for browsing the archive dir without it
+    if SAVE_SNAPSHOT_HTML_INDEX and not skip_html_index:
+        write_html_link_details(link, out_dir=out_dir)
     if not skip_sql_index:
         write_sql_link_details(link)
 
@@ -353,11 +364,35 @@ def load_link_details(link: Link, out_dir: Optional[str]=None) -> Link:
 
 
 
+def q_startswith(field: str, prefix: str) -> Q:
+    """prefix match on an indexed column that can use the index (sqlite never uses one for LIKE)"""
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + '\U0010ffff'})
+
+def q_domain(pattern: str) -> Q:
+    """match snapshots whose domain is pattern, with or without a :port"""
+    pattern = pattern.lower()
+    return Q(domain=pattern) | q_startswith('domain', f'{pattern}:')
+
+def q_regex(pattern: str) -> Q:
+    """
+    case-insensitive regex match on url, narrowed down first by the literal parts of the pattern
+    (sqlite checks the cheap LIKEs first, so the python REGEXP callback only runs on candidates)
+    """
+    try:
+        literals = regex_literals(pattern)
+    except re.error:
+        literals = []   # let the query itself raise the error for the invalid pattern
+
+    prefilter = Q()
+    for literal in literals:
+        prefilter &= Q(url__icontains=literal)
+    return prefilter & Q(url__iregex=pattern)
+
 LINK_FILTERS = {
     'exact': lambda pattern: Q(url=pattern),
     'substring': lambda pattern: Q(url__icontains=pattern),
-    'regex': lambda pattern: Q(url__iregex=pattern),
-    'domain': lambda pattern: Q(url__istartswith=f"http://{pattern}") | Q(url__istartswith=f"https://{pattern}") | Q(url__istartswith=f"ftp://{pattern}"),
+    'regex': q_regex,
+    'domain': q_domain,
     'tag': lambda pattern: Q(tags__name=pattern),
     'timestamp': lambda pattern: Q(timestamp=pattern),
 }
@@ -386,16 +421,14 @@ def search_filter(snapshots: QuerySet, filter_patterns: List[str], filter_type:
                 color='red',
             )
         raise SystemExit(2)
-    from core.models import Snapshot
-
-    qsearch = Snapshot.objects.none()
+    q_search = Q(pk__in=[])
     for pattern in filter_patterns:
         try:
-            qsearch |= query_search_index(pattern)
+            q_search |= q_snapshot_ids(search_index_ids(pattern))
         except:
             raise SystemExit(2)
-    
-    return snapshots & qsearch
+
+    return snapshots.filter(q_search)
 
 @enforce_types
 def snapshot_filter(snapshots: QuerySet, filter_patterns: List[str], filter_type: str='exact') -> QuerySet:
@@ -405,157 +438,456 @@ def snapshot_filter(snapshots: QuerySet, filter_patterns: List[str], filter_type
         return search_filter(snapshots, filter_patterns, filter_type)
 
 
-def get_indexed_folders(snapshots, out_dir: Path=OUTPUT_DIR) -> Dict[str, Optional[Link]]:
-    """indexed links without checking archive status or data directory validity"""
-    links = [snapshot.as_link_with_details() for snapshot in snapshots.iterator()]
-    return {
-        link.link_dir: link
-        for link in links
-    }
+### Archive Folder Scanning
 
-def get_archived_folders(snapshots, out_dir: Path=OUTPUT_DIR) -> Dict[str, Optional[Link]]:
-    """indexed links that are archived with a valid data directory"""
-    links = [snapshot.as_link_with_details() for snapshot in snapshots.iterator()]
-    return {
-        link.link_dir: link
-        for link in filter(is_archived, links)
-    }
+FOLDER_STATUSES = ('indexed', 'archived', 'unarchived', 'present', 'valid', 'invalid', 'duplicate', 'orphaned', 'corrupted', 'unrecognized')
 
-def get_unarchived_folders(snapshots, out_dir: Path=OUTPUT_DIR) -> Dict[str, Optional[Link]]:
-    """indexed links that are unarchived with no data directory or an empty data directory"""
-    links = [snapshot.as_link_with_details() for snapshot in snapshots.iterator()]
-    return {
-        link.link_dir: link
-        for link in filter(is_unarchived, links)
+# these statuses only depend on the data dirs of Snapshots in the main index,
+# so they can be computed without walking the rest of the archive/ folder
+INDEXED_FOLDER_STATUSES = ('indexed', 'archived', 'unarchived', 'valid', 'corrupted')
+
+# same list of outputs as Link.is_archived, checked against the cached listdir() of the data dir
+ARCHIVED_OUTPUT_NAMES = ('output.pdf', 'screenshot.png', 'output.html', 'media', 'singlefile.html')
+
+SCAN_MIN_FOLDERS_FOR_PARALLEL = 500   # below this, starting a process pool costs more than it saves
+SCAN_CHUNK_SIZE = 250
+SCAN_DB_BATCH_SIZE = 500              # stay under SQLite's max number of query params
+
+
+def load_folder_manifest(path: str, dir_mtime: float) -> Optional[dict]:
+    """read a data dir's file listing and the url/timestamp from its index.json
+
+    Runs inside the scanner's process pool, so it must not touch the database.
+    Returns the fields for its core.models.ArchiveFolder row, or None if the dir doesn't exist.
+    """
+    try:
+        entries = os.listdir(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+    manifest = {
+        'name': Path(path).name,
+        'dir_mtime': dir_mtime,
+        'index_mtime': None,
+        'index_size': None,
+        'url': None,
+        'timestamp': None,
+        'is_parseable': False,
+        'needs_repair': False,
+        'entries': '\n'.join(sorted(entries)),
     }
+    if JSON_INDEX_FILENAME not in entries:
+        return manifest
 
-def get_present_folders(snapshots, out_dir: Path=OUTPUT_DIR) -> Dict[str, Optional[Link]]:
-    """dirs that actually exist in the archive/ folder"""
+    index_path = Path(path) / JSON_INDEX_FILENAME
+    try:
+        index_stat = index_path.stat()
+        manifest['index_mtime'] = index_stat.st_mtime
+        manifest['index_size'] = index_stat.st_size
+        with open(index_path, 'r', encoding='utf-8') as f:
+            link = Link.from_json(pyjson.load(f))
+        manifest['is_parseable'] = True
+    except KeyError:
+        # index is missing some keys, it may be repairable by guessing them
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                link = Link.from_json(pyjson.load(f), guess=True)
+            manifest['needs_repair'] = True
+        except Exception:
+            return manifest
+    except Exception:
+        return manifest
 
-    all_folders = {}
+    manifest['url'] = link.url
+    manifest['timestamp'] = link.timestamp
+    return manifest
 
-    for entry in (out_dir / ARCHIVE_DIR_NAME).iterdir():
-        if entry.is_dir():
-            link = None
-            try:
-                link = parse_json_link_details(entry.path)
-            except Exception:
-                pass
 
-            all_folders[entry.name] = link
+def load_folder_manifests(paths: List[str], dir_mtimes: List[float]) -> List[Optional[dict]]:
+    """read a batch of data dirs, in parallel across all CPUs when there are enough of them"""
+    if len(paths) < SCAN_MIN_FOLDERS_FOR_PARALLEL:
+        return [load_folder_manifest(path, dir_mtime) for path, dir_mtime in zip(paths, dir_mtimes)]
 
-    return all_folders
+    with ProcessPoolExecutor() as pool:
+        return list(pool.map(load_folder_manifest, paths, dir_mtimes, chunksize=SCAN_CHUNK_SIZE))
 
-def get_valid_folders(snapshots, out_dir: Path=OUTPUT_DIR) -> Dict[str, Optional[Link]]:
-    """dirs with a valid index matched to the main index and archived content"""
-    links = [snapshot.as_link_with_details() for snapshot in snapshots.iterator()]
-    return {
-        link.link_dir: link
-        for link in filter(is_valid, links)
-    }
 
-def get_invalid_folders(snapshots, out_dir: Path=OUTPUT_DIR) -> Dict[str, Optional[Link]]:
-    """dirs that are invalid for any reason: corrupted/duplicate/orphaned/unrecognized"""
-    duplicate = get_duplicate_folders(snapshots, out_dir=OUTPUT_DIR)
-    orphaned = get_orphaned_folders(snapshots, out_dir=OUTPUT_DIR)
-    corrupted = get_corrupted_folders(snapshots, out_dir=OUTPUT_DIR)
-    unrecognized = get_unrecognized_folders(snapshots, out_dir=OUTPUT_DIR)
-    return {**duplicate, **orphaned, **corrupted, **unrecognized}
+def update_folder_manifests(archive_dir: Path, dir_mtimes: Dict[str, float], prune: bool=False) -> Dict[str, dict]:
+    """get the manifests for the given data dirs, only re-reading dirs that changed since they were cached
 
+    A dir is re-read if its mtime differs from the cached one. index.json is normally replaced
+    with an atomic rename which always bumps the dir mtime, but when ENFORCE_ATOMIC_WRITES is off
+    it can be rewritten in-place, so then its own mtime and size are checked too.
+    If prune is set, the cached manifests of any dirs not in dir_mtimes are removed.
+    """
+    from core.models import ArchiveFolder
 
-def get_duplicate_folders(snapshots, out_dir: Path=OUTPUT_DIR) -> Dict[str, Optional[Link]]:
-    """dirs that conflict with other directories that have the same link URL or timestamp"""
-    by_url = {}
-    by_timestamp = {}
-    duplicate_folders = {}
-
-    data_folders = (
-        str(entry)
-        for entry in (Path(out_dir) / ARCHIVE_DIR_NAME).iterdir()
-            if entry.is_dir() and not snapshots.filter(timestamp=entry.name).exists()
+    if prune:
+        cached_manifests = ArchiveFolder.objects.values().iterator()
+    else:
+        names = list(dir_mtimes.keys())
+        cached_manifests = chain.from_iterable(
+            ArchiveFolder.objects.filter(name__in=names[i:i + SCAN_DB_BATCH_SIZE]).values()
+            for i in range(0, len(names), SCAN_DB_BATCH_SIZE)
+        )
+    cached = {manifest['name']: manifest for manifest in cached_manifests}
+
+    def is_stale(name: str, dir_mtime: float) -> bool:
+        manifest = cached.get(name)
+        if manifest is None or manifest['needs_repair'] or manifest['dir_mtime'] != dir_mtime:
+            return True
+        if not ENFORCE_ATOMIC_WRITES and manifest['index_mtime'] is not None:
+            try:
+                index_stat = (archive_dir / name / JSON_INDEX_FILENAME).stat()
+            except OSError:
+                return True
+            return (index_stat.st_mtime, index_stat.st_size) != (manifest['index_mtime'], manifest['index_size'])
+        return False
+
+    stale = [name for name, dir_mtime in dir_mtimes.items() if is_stale(name, dir_mtime)]
+    refreshed = load_folder_manifests(
+        [str(archive_dir / name) for name in stale],
+        [dir_mtimes[name] for name in stale],
     )
 
-    for path in chain(snapshots.iterator(), data_folders):
-        link = None
-        if type(path) is not str:
-            path = path.as_link().link_dir
+    manifests = {
+        name: cached[name]
+        for name in dir_mtimes.keys()
+        if name in cached
+    }
+    for name, manifest in zip(stale, refreshed):
+        if manifest is None:
+            manifests.pop(name, None)
+        else:
+            manifests[name] = manifest
+
+    removed = set(stale) | (cached.keys() - dir_mtimes.keys() if prune else set())
+    removed = list(removed & cached.keys())
+    with transaction.atomic():
+        for i in range(0, len(removed), SCAN_DB_BATCH_SIZE):
+            ArchiveFolder.objects.filter(name__in=removed[i:i + SCAN_DB_BATCH_SIZE]).delete()
+        # another scan (e.g. a cron'd status) may have just cached the same new dirs,
+        # its manifests are as fresh as ours so keep whichever got there first
+        ArchiveFolder.objects.bulk_create(
+            (ArchiveFolder(**manifest) for manifest in refreshed if manifest is not None),
+            batch_size=SCAN_DB_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    return manifests
+
+
+def iter_archive_folders(snapshots,
+                         status: str,
+                         out_dir: Path=OUTPUT_DIR,
+                         chunk_size: int=SCAN_DB_BATCH_SIZE) -> Iterator[Tuple[str, Optional[Link]]]:
+    """same folders as scan_archive_folders(snapshots, statuses=(status,))[status], in the same order,
+    but scanned a chunk of Snapshots at a time so that memory use stays constant for huge indexes
+
+    Statuses that need the whole archive/ folder walked (see INDEXED_FOLDER_STATUSES) can't be
+    split up like that, so those are still scanned all at once.
+    """
+    if status not in INDEXED_FOLDER_STATUSES:
+        yield from scan_archive_folders(snapshots, out_dir=out_dir, statuses=(status,))[status].items()
+        return
+
+    snapshot_rows = snapshots.values_list('pk', 'timestamp').iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(snapshot_rows, chunk_size))
+        if not chunk:
+            break
+        chunk_snapshots = snapshots.filter(pk__in=[pk for pk, _ in chunk])
+        folders = scan_archive_folders(chunk_snapshots, out_dir=out_dir, statuses=(status,))[status]
 
-        try:
-            link = parse_json_link_details(path)
-        except Exception:
-            pass
+        # the pk__in lookup can come back in index order, put the chunk back in the original order
+        position = {timestamp: i for i, (_, timestamp) in enumerate(chunk)}
+        yield from sorted(folders.items(), key=lambda folder: position.get(Path(folder[0]).name, len(chunk)))
 
-        if link:
-            # link folder has same timestamp as different link folder
-            by_timestamp[link.timestamp] = by_timestamp.get(link.timestamp, 0) + 1
-            if by_timestamp[link.timestamp] > 1:
-                duplicate_folders[path] = link
 
-            # link folder has same url as different link folder
-            by_url[link.url] = by_url.get(link.url, 0) + 1
-            if by_url[link.url] > 1:
-                duplicate_folders[path] = link
-    return duplicate_folders
+def scan_archive_folders(snapshots,
+                         out_dir: Path=OUTPUT_DIR,
+                         statuses: Iterable[str]=FOLDER_STATUSES,
+                         with_details: bool=True) -> Dict[str, Dict[str, Optional[Link]]]:
+    """walk the archive/ folder once and sort every Snapshot and data dir into each of the given statuses
 
-def get_orphaned_folders(snapshots, out_dir: Path=OUTPUT_DIR) -> Dict[str, Optional[Link]]:
-    """dirs that contain a valid index but aren't listed in the main index"""
-    orphaned_folders = {}
+    The main index is loaded into memory with one query for the rows and one for the tags,
+    each data dir is read through its cached manifest (see update_folder_manifests),
+    and the results are joined in memory instead of querying the DB for each folder.
+
+    Without details, folder Links only have their url and timestamp filled in (enough to count them),
+    otherwise the index.json of every folder that ends up in one of the requested statuses is loaded.
+    """
+    from core.models import Snapshot
+
+    statuses = set(statuses)
+    unknown_statuses = statuses - set(FOLDER_STATUSES)
+    if unknown_statuses:
+        raise ValueError(f'Status not recognized: {", ".join(sorted(unknown_statuses))}')
 
-    for entry in (Path(out_dir) / ARCHIVE_DIR_NAME).iterdir():
-        if entry.is_dir():
-            link = None
+    archive_dir = Path(out_dir) / ARCHIVE_DIR_NAME
+
+    tags_by_snapshot = defaultdict(list)
+    snapshot_tags = (
+        Snapshot.tags.through.objects
+            .filter(snapshot_id__in=snapshots.values('pk'))
+            .order_by('tag__name')
+            .values_list('snapshot_id', 'tag__name')
+    )
+    for snapshot_id, tag_name in snapshot_tags.iterator():
+        tags_by_snapshot[snapshot_id].append(tag_name)
+
+    indexed_links = [
+        Link.from_json({
+            'url': url,
+            'timestamp': timestamp,
+            'title': title,
+            'updated': updated,
+            'tags': ','.join(tags_by_snapshot[snapshot_id]),
+        })
+        for snapshot_id, url, timestamp, title, updated in (
+            snapshots.values_list('id', 'url', 'timestamp', 'title', 'updated').iterator()
+        )
+    ]
+    indexed_timestamps = {link.timestamp for link in indexed_links}
+
+    walk_all_folders = not statuses.issubset(INDEXED_FOLDER_STATUSES)
+    dir_mtimes: Dict[str, float] = {}
+    if walk_all_folders:
+        for entry in os.scandir(archive_dir):
+            if entry.is_dir():
+                dir_mtimes[entry.name] = entry.stat().st_mtime
+    else:
+        for timestamp in indexed_timestamps:
             try:
-                link = parse_json_link_details(str(entry))
-            except Exception:
+                dir_mtimes[timestamp] = (archive_dir / timestamp).stat().st_mtime
+            except FileNotFoundError:
                 pass
 
-            if link and not snapshots.filter(timestamp=entry.name).exists():
-                # folder is a valid link data dir with index details, but it's not in the main index
-                orphaned_folders[str(entry)] = link
+    manifests = update_folder_manifests(archive_dir, dir_mtimes, prune=walk_all_folders)
 
-    return orphaned_folders
+    def folder_link(name: str) -> Optional[Link]:
+        manifest = manifests.get(name)
+        if manifest and manifest['is_parseable']:
+            return Link(timestamp=manifest['timestamp'], url=manifest['url'], title=None, tags=None, sources=[])
+        return None
 
-def get_corrupted_folders(snapshots, out_dir: Path=OUTPUT_DIR) -> Dict[str, Optional[Link]]:
-    """dirs that don't contain a valid index and aren't listed in the main index"""
-    corrupted = {}
-    for snapshot in snapshots.iterator():
-        link = snapshot.as_link()
-        if is_corrupt(link):
+    def folder_link_with_details(name: str) -> Optional[Link]:
+        try:
+            return parse_json_link_details(str(archive_dir / name)) or folder_link(name)
+        except Exception:
+            return folder_link(name)
+
+    def merge_folder_link(link: Link, folder_link: Optional[Link]) -> Link:
+        if folder_link and folder_link.base_url == link.base_url:
+            return merge_links(folder_link, link)
+        return link
+
+    def is_valid_folder(link: Link) -> bool:
+        manifest = manifests.get(link.timestamp)
+        return bool(manifest and manifest['url'] == link.url)
+
+    def is_archived_folder(link: Link) -> bool:
+        manifest = manifests.get(link.timestamp)
+        if not manifest:
+            return False
+        entries = set(manifest['entries'].split('\n'))
+        return any(name in entries for name in (domain(link.url), *ARCHIVED_OUTPUT_NAMES))
+
+    indexed, archived, unarchived, valid, corrupted = {}, {}, {}, {}, {}
+    indexed_by_dir: Dict[str, Link] = {}
+    for link in indexed_links:
+        link_with_details = merge_folder_link(link, folder_link(link.timestamp))
+        link_dir = link_with_details.link_dir
+
+        indexed_by_dir[link_dir] = link
+        indexed[link_dir] = link_with_details
+        if is_valid_folder(link_with_details):
+            valid[link_dir] = link_with_details
+            if is_archived_folder(link_with_details):
+                archived[link_dir] = link_with_details
+        if not is_archived_folder(link_with_details):
+            unarchived[link_dir] = link_with_details
+        if link.timestamp in manifests and not is_valid_folder(link):
             corrupted[link.link_dir] = link
-    return corrupted
 
-def get_unrecognized_folders(snapshots, out_dir: Path=OUTPUT_DIR) -> Dict[str, Optional[Link]]:
-    """dirs that don't contain recognizable archive data and aren't listed in the main index"""
-    unrecognized_folders: Dict[str, Optional[Link]] = {}
+    results = {
+        'indexed': indexed,
+        'archived': archived,
+        'unarchived': unarchived,
+        'valid': valid,
+        'corrupted': corrupted,
+    }
 
-    for entry in (Path(out_dir) / ARCHIVE_DIR_NAME).iterdir():
-        if entry.is_dir():
-            index_exists = (entry / "index.json").exists()
-            link = None
-            try:
-                link = parse_json_link_details(str(entry))
-            except KeyError:
-                # Try to fix index
-                if index_exists:
-                    try:
-                        # Last attempt to repair the detail index
-                        link_guessed = parse_json_link_details(str(entry), guess=True)
-                        write_json_link_details(link_guessed, out_dir=str(entry))
-                        link = parse_json_link_details(str(entry))
-                    except Exception:
-                        pass
+    if walk_all_folders:
+        present, orphaned, unrecognized = {}, {}, {}
+        for name, manifest in manifests.items():
+            path = str(archive_dir / name)
+            if manifest['needs_repair']:
+                try:
+                    # Last attempt to repair the detail index, its manifest gets refreshed on the next scan
+                    write_json_link_details(parse_json_link_details(path, guess=True), out_dir=path)
+                    manifest['is_parseable'] = bool(parse_json_link_details(path))
+                except Exception:
+                    pass
 
+            link = folder_link(name)
+            present[name] = link
+
+            if link and name not in indexed_timestamps:
+                # folder is a valid link data dir with index details, but it's not in the main index
+                orphaned[path] = link
+
+            index_exists = manifest['index_mtime'] is not None
             if index_exists and link is None:
                 # index exists but it's corrupted or unparseable
-                unrecognized_folders[str(entry)] = link
-            
-            elif not index_exists:
+                unrecognized[path] = None
+            elif not index_exists and name not in indexed_timestamps:
                 # link details index doesn't exist and the folder isn't in the main index
-                timestamp = entry.name
-                if not snapshots.filter(timestamp=timestamp).exists():
-                    unrecognized_folders[str(entry)] = link
+                unrecognized[path] = None
+
+        by_url: Dict[str, int] = defaultdict(int)
+        by_timestamp: Dict[str, int] = defaultdict(int)
+        duplicate = {}
+        duplicate_candidates = chain(
+            ((link.link_dir, link.timestamp) for link in indexed_links),
+            ((str(archive_dir / name), name) for name in manifests.keys() if name not in indexed_timestamps),
+        )
+        for path, name in duplicate_candidates:
+            link = folder_link(name)
+            if link:
+                # link folder has same timestamp as different link folder
+                by_timestamp[link.timestamp] += 1
+                if by_timestamp[link.timestamp] > 1:
+                    duplicate[path] = link
+
+                # link folder has same url as different link folder
+                by_url[link.url] += 1
+                if by_url[link.url] > 1:
+                    duplicate[path] = link
+
+        results.update({
+            'present': present,
+            'orphaned': orphaned,
+            'unrecognized': unrecognized,
+            'duplicate': duplicate,
+        })
+
+    if with_details:
+        for status in statuses & {'indexed', 'archived', 'unarchived', 'valid'}:
+            results[status] = {
+                link_dir: merge_folder_link(indexed_by_dir[link_dir], folder_link_with_details(indexed_by_dir[link_dir].timestamp))
+                for link_dir in results[status].keys()
+            }
+        for status in statuses & {'present', 'orphaned', 'duplicate'}:
+            results[status] = {
+                key: link and folder_link_with_details(Path(key).name)
+                for key, link in results[status].items()
+            }
+
+    if walk_all_folders:
+        results['invalid'] = {
+            **results['duplicate'],
+            **results['orphaned'],
+            **results['corrupted'],
+            **results['unrecognized'],
+        }
 
-    return unrecognized_folders
+    return results
+
+
+def load_output_sizes(link_dir: str, outputs: List[str]) -> Tuple[int, List[Optional[int]]]:
+    """measure a snapshot dir and each of the given archive method outputs in it
+
+    Runs inside the recount's process pool, so it must not touch the database.
+    """
+    try:
+        archive_size = get_dir_size(link_dir)[0]
+    except Exception:
+        archive_size = 0
+    return archive_size, [get_output_size(link_dir, output) for output in outputs]
+
+
+def recount_archive_sizes(snapshots, out_dir: Path=OUTPUT_DIR) -> int:
+    """re-measure the stored archive_size of the given Snapshots and the output_size
+       of their ArchiveResults by walking their data dirs in parallel, returns the new total
+    """
+    from core.models import Snapshot, ArchiveResult
+
+    archive_dir = Path(out_dir) / ARCHIVE_DIR_NAME
+
+    results_by_snapshot = defaultdict(list)
+    succeeded_results = (
+        ArchiveResult.objects
+            .filter(snapshot__in=snapshots.values('pk'), status='succeeded')
+            .values_list('id', 'snapshot_id', 'output')
+    )
+    for result_id, snapshot_id, output in succeeded_results.iterator():
+        results_by_snapshot[snapshot_id].append((result_id, output))
+
+    snapshot_dirs = list(snapshots.values_list('pk', 'timestamp').iterator())
+    link_dirs = [str(archive_dir / timestamp) for _, timestamp in snapshot_dirs]
+    outputs = [[output for _, output in results_by_snapshot[pk]] for pk, _ in snapshot_dirs]
+
+    if len(snapshot_dirs) < SCAN_MIN_FOLDERS_FOR_PARALLEL:
+        sizes = [load_output_sizes(link_dir, dir_outputs) for link_dir, dir_outputs in zip(link_dirs, outputs)]
+    else:
+        with ProcessPoolExecutor() as pool:
+            sizes = list(pool.map(load_output_sizes, link_dirs, outputs, chunksize=SCAN_CHUNK_SIZE))
+
+    updated_snapshots, updated_results = [], []
+    for (pk, _), (archive_size, output_sizes) in zip(snapshot_dirs, sizes):
+        updated_snapshots.append(Snapshot(pk=pk, archive_size=archive_size))
+        updated_results.extend(
+            ArchiveResult(id=result_id, output_size=output_size)
+            for (result_id, _), output_size in zip(results_by_snapshot[pk], output_sizes)
+        )
+
+    with transaction.atomic():
+        Snapshot.objects.bulk_update(updated_snapshots, ['archive_size'], batch_size=SCAN_DB_BATCH_SIZE)
+        ArchiveResult.objects.bulk_update(updated_results, ['output_size'], batch_size=SCAN_DB_BATCH_SIZE)
+
+    return sum(archive_size for archive_size, _ in sizes)
+
+
+def get_indexed_folders(snapshots, out_dir: Path=OUTPUT_DIR) -> Dict[str, Optional[Link]]:
+    """indexed links without checking archive status or data directory validity"""
+    return scan_archive_folders(snapshots, out_dir=out_dir, statuses=('indexed',))['indexed']
+
+def get_archived_folders(snapshots, out_dir: Path=OUTPUT_DIR) -> Dict[str, Optional[Link]]:
+    """indexed links that are archived with a valid data directory"""
+    return scan_archive_folders(snapshots, out_dir=out_dir, statuses=('archived',))['archived']
+
+def get_unarchived_folders(snapshots, out_dir: Path=OUTPUT_DIR) -> Dict[str, Optional[Link]]:
+    """indexed links that are unarchived with no data directory or an empty data directory"""
+    return scan_archive_folders(snapshots, out_dir=out_dir, statuses=('unarchived',))['unarchived']
+
+def get_present_folders(snapshots, out_dir: Path=OUTPUT_DIR) -> Dict[str, Optional[Link]]:
+    """dirs that actually exist in the archive/ folder"""
+    return scan_archive_folders(snapshots, out_dir=out_dir, statuses=('present',))['present']
+
+def get_valid_folders(snapshots, out_dir: Path=OUTPUT_DIR) -> Dict[str, Optional[Link]]:
+    """dirs with a valid index matched to the main index and archived content"""
+    return scan_archive_folders(snapshots, out_dir=out_dir, statuses=('valid',))['valid']
+
+def get_invalid_folders(snapshots, out_dir: Path=OUTPUT_DIR) -> Dict[str, Optional[Link]]:
+    """dirs that are invalid for any reason: corrupted/duplicate/orphaned/unrecognized"""
+    return scan_archive_folders(snapshots, out_dir=out_dir, statuses=('invalid',))['invalid']
+
+def get_duplicate_folders(snapshots, out_dir: Path=OUTPUT_DIR) -> Dict[str, Optional[Link]]:
+    """dirs that conflict with other directories that have the same link URL or timestamp"""
+    return scan_archive_folders(snapshots, out_dir=out_dir, statuses=('duplicate',))['duplicate']
+
+def get_orphaned_folders(snapshots, out_dir: Path=OUTPUT_DIR) -> Dict[str, Optional[Link]]:
+    """dirs that contain a valid index but aren't listed in the main index"""
+    return scan_archive_folders(snapshots, out_dir=out_dir, statuses=('orphaned',))['orphaned']
+
+def get_corrupted_folders(snapshots, out_dir: Path=OUTPUT_DIR) -> Dict[str, Optional[Link]]:
+    """dirs that don't contain a valid index and aren't listed in the main index"""
+    return scan_archive_folders(snapshots, out_dir=out_dir, statuses=('corrupted',))['corrupted']
+
+def get_unrecognized_folders(snapshots, out_dir: Path=OUTPUT_DIR) -> Dict[str, Optional[Link]]:
+    """dirs that don't contain recognizable archive data and aren't listed in the main index"""
+    return scan_archive_folders(snapshots, out_dir=out_dir, statuses=('unrecognized',))['unrecognized']
 
 
 def is_valid(link: Link) -> bool:
@@ -596,26 +928,33 @@ def is_unarchived(link: Link) -> bool:
 def fix_invalid_folder_locations(out_dir: Path=OUTPUT_DIR) -> Tuple[List[str], List[str]]:
     fixed = []
     cant_fix = []
-    for entry in os.scandir(out_dir / ARCHIVE_DIR_NAME):
-        if entry.is_dir(follow_symlinks=True):
-            if (Path(entry.path) / 'index.json').exists():
-                try:
-                    link = parse_json_link_details(entry.path)
-                except KeyError:
-                    link = None
-                if not link:
-                    continue
-
-                if not entry.path.endswith(f'/{link.timestamp}'):
-                    dest = out_dir / ARCHIVE_DIR_NAME / link.timestamp
-                    if dest.exists():
-                        cant_fix.append(entry.path)
-                    else:
-                        shutil.move(entry.path, dest)
-                        fixed.append(dest)
-                        timestamp = entry.path.rsplit('/', 1)[-1]
-                        assert link.link_dir == entry.path
-                        assert link.timestamp == timestamp
-                        write_json_link_details(link, out_dir=entry.path)
+    archive_dir = out_dir / ARCHIVE_DIR_NAME
+    dir_mtimes = {
+        entry.name: entry.stat().st_mtime
+        for entry in os.scandir(archive_dir)
+            if entry.is_dir(follow_symlinks=True)
+    }
+    # only dirs whose cached index timestamp doesn't match their name need to be opened
+    for name, manifest in update_folder_manifests(archive_dir, dir_mtimes, prune=True).items():
+        if manifest['is_parseable'] and manifest['timestamp'] != name:
+            entry_path = str(archive_dir / name)
+            try:
+                link = parse_json_link_details(entry_path)
+            except KeyError:
+                link = None
+            if not link:
+                continue
+
+            if not entry_path.endswith(f'/{link.timestamp}'):
+                dest = out_dir / ARCHIVE_DIR_NAME / link.timestamp
+                if dest.exists():
+                    cant_fix.append(entry_path)
+                else:
+                    shutil.move(entry_path, dest)
+                    fixed.append(dest)
+                    timestamp = entry_path.rsplit('/', 1)[-1]
+                    assert link.link_dir == entry_path
+                    assert link.timestamp == timestamp
+                    write_json_link_details(link, out_dir=entry_path)
 
     return fixed, cant_fix
@@ -1,11 +1,17 @@
 __package__ = 'archivebox.index'
 
-from typing import List, Optional, Any
+from typing import List, Optional, Iterable, Iterator, Tuple, Any
 
-from ..util import enforce_types
+from ..util import enforce_types, ExtendedEncoder
 from .schema import Link
 
 
+# Link attributes that are stored as-is in the main index, so they can be exported
+# straight from the Snapshot rows without building a Link for every row
+SNAPSHOT_CSV_COLS = ('timestamp', 'url', 'title', 'base_url')
+SNAPSHOT_CSV_CHUNK_SIZE = 2000
+
+
 @enforce_types
 def links_to_csv(links: List[Link],
                  cols: Optional[List[str]]=None,
@@ -13,18 +19,42 @@ def links_to_csv(links: List[Link],
                  separator: str=',',
                  ljust: int=0) -> str:
 
+    return ''.join(iter_links_csv(links, cols=cols, header=header, separator=separator, ljust=ljust))
+
+
+def iter_links_csv(links: Iterable[Link],
+                   cols: Optional[List[str]]=None,
+                   header: bool=True,
+                   separator: str=',',
+                   ljust: int=0) -> Iterator[str]:
+    """same output as links_to_csv, rendered one row at a time"""
+
     cols = cols or ['timestamp', 'is_archived', 'url']
-    
-    header_str = ''
+
     if header:
-        header_str = separator.join(col.ljust(ljust) for col in cols)
+        yield separator.join(col.ljust(ljust) for col in cols)
 
-    row_strs = (
-        link.to_csv(cols=cols, ljust=ljust, separator=separator)
-        for link in links
-    )
+    for link in links:
+        yield '\n' + link.to_csv(cols=cols, ljust=ljust, separator=separator)
+
+
+def iter_snapshot_rows_csv(rows: Iterable[Tuple[Any, ...]],
+                           cols: List[str],
+                           header: bool=True,
+                           separator: str=',',
+                           ljust: int=0) -> Iterator[str]:
+    """
+    same output as iter_links_csv, but for rows from Snapshot.objects.values_list(*cols)
+    (only valid when every col is in SNAPSHOT_CSV_COLS)
+    """
+
+    encode = ExtendedEncoder(sort_keys=True).encode
+
+    if header:
+        yield separator.join(col.ljust(ljust) for col in cols)
 
-    return '\n'.join((header_str, *row_strs))
+    for row in rows:
+        yield '\n' + separator.join(encode(val).ljust(ljust) for val in row)
 
 
 @enforce_types
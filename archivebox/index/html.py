@@ -3,10 +3,11 @@ __package__ = 'archivebox.index'
 from pathlib import Path
 from datetime import datetime, timezone
 from collections import defaultdict
-from typing import List, Optional, Iterator, Mapping
+from typing import List, Optional, Iterable, Iterator, Mapping
 
 from django.utils.html import format_html, mark_safe
 from django.core.cache import cache
+from django.template.base import Node
 
 from .schema import Link
 from ..system import atomic_write
@@ -17,6 +18,7 @@ from ..util import (
     urlencode,
     htmlencode,
     urldecode,
+    domain,
 )
 from ..config import (
     OUTPUT_DIR,
@@ -54,19 +56,107 @@ def generate_index_from_links(links: List[Link], with_headers: bool):
         output = main_index_template(links, template=MINIMAL_INDEX_TEMPLATE)
     return output
 
+def iter_index_from_links(links: Iterable[Link], with_headers: bool, num_links: int) -> Iterator[str]:
+    """same output as generate_index_from_links, rendered one row at a time"""
+    template = MAIN_INDEX_TEMPLATE if with_headers else MINIMAL_INDEX_TEMPLATE
+    yield from iter_main_index_template(links, num_links, template=template)
+
 @enforce_types
 def main_index_template(links: List[Link], template: str=MAIN_INDEX_TEMPLATE) -> str:
     """render the template for the entire main index"""
 
-    return render_django_template(template, {
+    return render_django_template(template, main_index_context(links, num_links=len(links)))
+
+def main_index_context(links: Iterable[Link], num_links: int) -> dict:
+    return {
         'version': VERSION,
         'git_sha': VERSION,  # not used anymore, but kept for backwards compatibility
-        'num_links': str(len(links)),
+        'num_links': str(num_links),
         'date_updated': datetime.now(timezone.utc).strftime('%Y-%m-%d'),
         'time_updated': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M'),
         'links': [link._asdict(extended=True) for link in links],
         'FOOTER_INFO': FOOTER_INFO,
-    })
+    }
+
+def iter_main_index_template(links: Iterable[Link], num_links: int, template: str=MAIN_INDEX_TEMPLATE) -> Iterator[str]:
+    """
+    render the main index template with its {% for ... in links %} loop rendered a link at a time,
+    or all at once if the loop can't be found (e.g. it's in a parent template of a custom one)
+    """
+    from django.template import Context, Template
+    from django.template.loader import get_template
+
+    # parse a private copy of the template, so the loop can be swapped out without touching the cached one
+    cached_template = get_template(template).template
+    django_template = Template(cached_template.source, cached_template.origin, cached_template.name, cached_template.engine)
+    links_loop = replace_links_loop(django_template.nodelist, num_links)
+    if links_loop is None:
+        yield main_index_template(list(links), template=template)
+        return
+
+    context = Context(main_index_context((), num_links=num_links), autoescape=django_template.engine.autoescape)
+    before, _, after = django_template.render(context).partition(LinksLoopNode.MARKER)
+    yield before
+    if links_loop.context is not None:
+        yield from links_loop.iter_rows(links)
+    yield after
+
+
+class LinksLoopNode(Node):
+    """
+    stands in for the {% for link in links %} loop of the main index template, rendering a marker where
+    the rows go and keeping the context the loop was rendered in, to render the rows in it afterwards
+    """
+    MARKER = '\x00links\x00'
+
+    def __init__(self, for_node, num_links: int):
+        self.for_node = for_node
+        self.num_links = num_links
+        self.context = None
+        self.token = for_node.token
+        self.origin = for_node.origin
+
+    def render(self, context) -> str:
+        if self.num_links < 1:
+            return self.for_node.nodelist_empty.render(context)
+        self.context = context.__copy__()
+        return self.MARKER
+
+    def iter_rows(self, links: Iterable[Link]) -> Iterator[str]:
+        context, loopvar = self.context, self.for_node.loopvars[0]
+        forloop = {'parentloop': context.get('forloop', {})}
+        with context.push(forloop=forloop):
+            for idx, link in enumerate(links):
+                forloop.update(
+                    counter0=idx,
+                    counter=idx + 1,
+                    revcounter=self.num_links - idx,
+                    revcounter0=self.num_links - idx - 1,
+                    first=idx == 0,
+                    last=idx == self.num_links - 1,
+                )
+                with context.push({loopvar: link._asdict(extended=True)}):
+                    yield self.for_node.nodelist_loop.render(context)
+
+
+def replace_links_loop(nodelist, num_links: int) -> Optional[LinksLoopNode]:
+    """find the {% for x in links %} loop anywhere in the nodelist (in blocks, ifs, etc.) and swap in a LinksLoopNode"""
+    from django.template.defaulttags import ForNode, IfNode
+
+    for idx, node in enumerate(nodelist):
+        if isinstance(node, ForNode) and node.sequence.token == 'links' and len(node.loopvars) == 1 and not node.is_reversed:
+            nodelist[idx] = LinksLoopNode(node, num_links)
+            return nodelist[idx]
+
+        if isinstance(node, IfNode):
+            child_nodelists = [child for _, child in node.conditions_nodelists]
+        else:
+            child_nodelists = [getattr(node, attr, None) for attr in node.child_nodelists]
+        for child in child_nodelists:
+            links_loop = child and replace_links_loop(child, num_links)
+            if links_loop:
+                return links_loop
+    return None
 
 
 ### Link Details Index
@@ -84,28 +174,76 @@ def link_details_template(link: Link) -> str:
 
     from ..extractors.wget import wget_output_path
 
-    link_info = link._asdict(extended=True)
+    return render_django_template(LINK_DETAILS_TEMPLATE, link_details_context(
+        link,
+        link._asdict(extended=True),
+        wget_path=wget_output_path(link),
+        is_archived=link.is_archived,
+        archive_size=link.archive_size,
+        oldest_archive_date=link.oldest_archive_date,
+    ))
+
 
-    return render_django_template(LINK_DETAILS_TEMPLATE, {
+def link_details_context(link: Link, link_info: dict, wget_path: Optional[str], is_archived: bool,
+                         archive_size: float, oldest_archive_date: Optional[datetime]) -> dict:
+    return {
         **link_info,
         **link_info['canonical'],
         'title': htmlencode(
             link.title
-            or (link.base_url if link.is_archived else TITLE_LOADING_MSG)
+            or (link.base_url if is_archived else TITLE_LOADING_MSG)
         ),
         'url_str': htmlencode(urldecode(link.base_url)),
         'archive_url': urlencode(
-            wget_output_path(link)
-            or (link.domain if link.is_archived else '')
+            wget_path
+            or (link.domain if is_archived else '')
         ) or 'about:blank',
         'extension': link.extension or 'html',
         'tags': link.tags or 'untagged',
-        'size': printable_filesize(link.archive_size) if link.archive_size else 'pending',
-        'status': 'archived' if link.is_archived else 'not yet archived',
-        'status_color': 'success' if link.is_archived else 'danger',
-        'oldest_archive_date': ts_to_date_str(link.oldest_archive_date),
+        'size': printable_filesize(archive_size) if archive_size else 'pending',
+        'status': 'archived' if is_archived else 'not yet archived',
+        'status_color': 'success' if is_archived else 'danger',
+        'oldest_archive_date': ts_to_date_str(oldest_archive_date),
         'SAVE_ARCHIVE_DOT_ORG': SAVE_ARCHIVE_DOT_ORG,
-    })
+    }
+
+
+def snapshot_details_template(snapshot) -> str:
+    """
+    render the same page as link_details_template() from the Snapshot and its ArchiveResults in the db
+    instead of the index.json and the files in the snapshot dir, cached until the Snapshot is next updated
+    """
+    cache_key = f'{snapshot.id}-{(snapshot.updated or snapshot.added).timestamp()}-details-html'
+
+    def calc_snapshot_details():
+        results = sorted(snapshot.archiveresult_set.all(), key=lambda result: result.start_ts)
+        succeeded = [result for result in results if result.status == 'succeeded' and result.output]
+        wget_path = next((result.output for result in reversed(succeeded) if result.extractor == 'wget'), None)
+        archive_dates = [result.start_ts for result in results]
+
+        link = snapshot.as_link().overwrite(title=snapshot.latest_title)
+        # everything that would otherwise be read from the index.json history and the snapshot dir
+        link_info = link._asdict(
+            extended=True,
+            snapshot_id=str(snapshot.id),
+            oldest_archive_date=min(archive_dates, default=None),
+            newest_archive_date=max(archive_dates, default=None),
+            is_archived=snapshot.is_archived,
+            num_outputs=snapshot.num_outputs,
+            num_failures=sum(1 for result in results if result.status == 'failed'),
+            latest={result.extractor: result.output for result in succeeded},
+            canonical=link.canonical_outputs(wget_path=wget_path or domain(link.url).replace(':', '+')),
+        )
+        return render_django_template(LINK_DETAILS_TEMPLATE, link_details_context(
+            link,
+            link_info,
+            wget_path=wget_path,
+            is_archived=snapshot.is_archived,
+            archive_size=snapshot.archive_size,
+            oldest_archive_date=link_info['oldest_archive_date'],
+        ))
+
+    return cache.get_or_set(cache_key, calc_snapshot_details)
 
 @enforce_types
 def render_django_template(template: str, context: Mapping[str, str]) -> str:
@@ -122,10 +260,13 @@ def snapshot_icons(snapshot) -> str:
         from core.models import EXTRACTORS
         # start = datetime.now(timezone.utc)
 
-        archive_results = snapshot.archiveresult_set.filter(status="succeeded", output__isnull=False)
+        archive_results = snapshot.succeeded_results()
         link = snapshot.as_link()
         path = link.archive_path
-        canon = link.canonical_outputs()
+        # take the wget output path from its ArchiveResult instead of searching the link dir for it,
+        # (if wget never succeeded the icon is greyed out anyway, so just point it at the domain dir)
+        wget_path = next((result.output for result in reversed(archive_results) if result.extractor == 'wget'), None)
+        canon = link.canonical_outputs(wget_path=wget_path or domain(link.url).replace(':', '+'))
         output = ""
         output_template = '<a href="/{}/{}" class="exists-{}" title="{}">{}</a> &nbsp;'
         icons = {
@@ -6,7 +6,7 @@ import json as pyjson
 from pathlib import Path
 
 from datetime import datetime, timezone
-from typing import List, Optional, Iterator, Any, Union
+from typing import List, Optional, Iterable, Iterator, Any, Union
 
 from .schema import Link
 from ..system import atomic_write
@@ -40,17 +40,49 @@ MAIN_INDEX_HEADER = {
 
 @enforce_types
 def generate_json_index_from_links(links: List[Link], with_headers: bool):
-    if with_headers:
-        output = {
-            **MAIN_INDEX_HEADER,
-            'num_links': len(links),
-            'updated': datetime.now(timezone.utc),
-            'last_run_cmd': sys.argv,
-            'links': links,
-        }
-    else:
-        output = links
-    return to_json(output, indent=4, sort_keys=True)
+    return ''.join(iter_json_index_from_links(links, with_headers))
+
+
+def iter_json_index_from_links(links: Iterable[Link], with_headers: bool) -> Iterator[str]:
+    """
+    render the same json as to_json(output, indent=4, sort_keys=True) a link at a time,
+    so that exporting a huge index doesn't need the whole thing in memory at once
+    """
+    if not with_headers:
+        yield from iter_json_list(links, level=0)
+        return
+
+    # keys are sorted, so the links list comes before num_links and it can be counted while streaming it
+    placeholder = '__archivebox_links__'
+    num_links = 0
+    def counted(links):
+        nonlocal num_links
+        for link in links:
+            num_links += 1
+            yield link
+
+    header = to_json({
+        **MAIN_INDEX_HEADER,
+        'num_links': placeholder,
+        'updated': datetime.now(timezone.utc),
+        'last_run_cmd': sys.argv,
+        'links': placeholder,
+    }, indent=4, sort_keys=True)
+    before_links, after_links = header.split(f'"{placeholder}"', 1)
+
+    yield before_links
+    yield from iter_json_list(counted(links), level=1)
+    yield after_links.replace(f'"{placeholder}"', str(num_links), 1)
+
+
+def iter_json_list(items: Iterable[Any], level: int=0, indent: int=4) -> Iterator[str]:
+    """render a json list nested at the given indentation level one item at a time"""
+    item_indent = '\n' + ' ' * (indent * (level + 1))
+    is_empty = True
+    for item in items:
+        yield ('[' if is_empty else ',') + item_indent + to_json(item, indent=indent, sort_keys=True).replace('\n', item_indent)
+        is_empty = False
+    yield '[]' if is_empty else '\n' + ' ' * (indent * level) + ']'
 
 
 @enforce_types
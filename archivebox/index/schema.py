@@ -177,7 +177,11 @@ class Link:
             stderr('{red}[X] Error while loading link! [{}] {} "{}"{reset}'.format(self.timestamp, self.url, self.title, **ANSI))
             raise
     
-    def _asdict(self, extended=False):
+    def _asdict(self, extended=False, **known):
+        """
+        extended adds all the fields derived from the url, history, and link dir, pass any that are
+        already known (e.g. from the db) as keyword args to use those instead of computing them
+        """
         info = {
             'schema': 'Link',
             'url': self.url,
@@ -189,34 +193,38 @@ class Link:
             'history': self.history or {},
         }
         if extended:
+            extended_fields = {
+                'snapshot_id': lambda: self.snapshot_id,
+                'link_dir': lambda: self.link_dir,
+                'archive_path': lambda: self.archive_path,
+
+                'hash': lambda: self.url_hash,
+                'base_url': lambda: self.base_url,
+                'scheme': lambda: self.scheme,
+                'domain': lambda: self.domain,
+                'path': lambda: self.path,
+                'basename': lambda: self.basename,
+                'extension': lambda: self.extension,
+                'is_static': lambda: self.is_static,
+
+                'tags_str': lambda: (self.tags or '').strip(','),   # only used to render static index in index/html.py, remove if no longer needed there
+                'icons': lambda: None,           # only used to render static index in index/html.py, remove if no longer needed there
+
+                'bookmarked_date': lambda: self.bookmarked_date,
+                'updated_date': lambda: self.updated_date,
+                'oldest_archive_date': lambda: self.oldest_archive_date,
+                'newest_archive_date': lambda: self.newest_archive_date,
+
+                'is_archived': lambda: self.is_archived,
+                'num_outputs': lambda: self.num_outputs,
+                'num_failures': lambda: self.num_failures,
+
+                'latest': lambda: self.latest_outputs(),
+                'canonical': lambda: self.canonical_outputs(),
+            }
             info.update({
-                'snapshot_id': self.snapshot_id,
-                'link_dir': self.link_dir,
-                'archive_path': self.archive_path,
-                
-                'hash': self.url_hash,
-                'base_url': self.base_url,
-                'scheme': self.scheme,
-                'domain': self.domain,
-                'path': self.path,
-                'basename': self.basename,
-                'extension': self.extension,
-                'is_static': self.is_static,
-                
-                'tags_str': (self.tags or '').strip(','),   # only used to render static index in index/html.py, remove if no longer needed there
-                'icons': None,           # only used to render static index in index/html.py, remove if no longer needed there
-
-                'bookmarked_date': self.bookmarked_date,
-                'updated_date': self.updated_date,
-                'oldest_archive_date': self.oldest_archive_date,
-                'newest_archive_date': self.newest_archive_date,
-        
-                'is_archived': self.is_archived,
-                'num_outputs': self.num_outputs,
-                'num_failures': self.num_failures,
-                
-                'latest': self.latest_outputs(),
-                'canonical': self.canonical_outputs(),
+                key: known[key] if key in known else compute()
+                for key, compute in extended_fields.items()
             })
         return info
 
@@ -414,17 +422,21 @@ class Link:
         return latest
 
 
-    def canonical_outputs(self) -> Dict[str, Optional[str]]:
-        """predict the expected output paths that should be present after archiving"""
+    def canonical_outputs(self, wget_path: Optional[str]=None) -> Dict[str, Optional[str]]:
+        """
+        predict the expected output paths that should be present after archiving,
+        pass wget_path if it's already known (e.g. from the wget ArchiveResult) to skip searching the link dir for it
+        """
 
         from ..extractors.wget import wget_output_path
+        wget_path = wget_path or wget_output_path(self)
         # TODO: banish this awful duplication from the codebase and import these
         # from their respective extractor files
         canonical = {
             'index_path': 'index.html',
             'favicon_path': 'favicon.ico',
             'google_favicon_path': 'https://www.google.com/s2/favicons?domain={}'.format(self.domain),
-            'wget_path': wget_output_path(self),
+            'wget_path': wget_path,
             'warc_path': 'warc/',
             'singlefile_path': 'singlefile.html',
             'readability_path': 'readability/content.html',
@@ -442,7 +454,7 @@ class Link:
             # they're just downloaded once and aren't archived separately multiple times, 
             # so the wget, screenshot, & pdf urls should all point to the same file
 
-            static_path = wget_output_path(self)
+            static_path = wget_path
             canonical.update({
                 'title': self.basename,
                 'wget_path': static_path,
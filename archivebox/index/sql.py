@@ -1,16 +1,169 @@
 __package__ = 'archivebox.index'
 
+import json
+import time
+import uuid
+import queue
+import atexit
+import threading
+
 from io import StringIO
 from pathlib import Path
-from typing import List, Tuple, Iterator
-from django.db.models import QuerySet
-from django.db import transaction
+from typing import List, Dict, Tuple, Iterator, Callable, Optional, Any
+from dataclasses import dataclass
+from concurrent.futures import Future
+from django.db.models import QuerySet, Q, F, IntegerField
+from django.db.models.expressions import RawSQL
+from django.db import transaction, connection, OperationalError
 
 from .schema import Link
 from ..util import enforce_types, parse_date
 from ..config import OUTPUT_DIR
 
 
+### Single Writer
+
+@dataclass
+class SQLWriterStats:
+    """mutable stats counter for the writes funneled through the SQLWriter"""
+
+    writes: int = 0
+    failed: int = 0
+    batches: int = 0
+    total_queue_wait: float = 0.0   # seconds between a write being queued and it starting to run
+    max_queue_wait: float = 0.0
+    total_commit_time: float = 0.0  # seconds spent running + committing batches
+
+    def summary(self) -> str:
+        avg_wait = self.total_queue_wait / (self.writes or 1)
+        avg_batch = self.writes / (self.batches or 1)
+        return (
+            f'sql_writer writes={self.writes} failed={self.failed} batches={self.batches} avg_batch={avg_batch:.1f} '
+            f'avg_queue_wait={avg_wait * 1000:.1f}ms max_queue_wait={self.max_queue_wait * 1000:.1f}ms '
+            f'commit_time={self.total_commit_time:.2f}s'
+        )
+
+
+class SQLWriter:
+    """
+    Funnels writes to the main index through a single background thread that
+    group-commits everything queued up since its last commit in one transaction,
+    instead of every process/thread taking the sqlite3 write lock for each statement.
+    Readers don't go through here, they never block under WAL (see setup_django).
+    """
+
+    max_batch_size = 500
+
+    def __init__(self):
+        self.queue: queue.Queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.stats = SQLWriterStats()
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        """queue up a write, returns a Future for its result once its batch is committed"""
+        future: Future = Future()
+        if not self.runs_in_background():
+            self.run_inline(future, func, *args, **kwargs)
+            return future
+
+        self.start()
+        self.queue.put((time.monotonic(), future, func, args, kwargs))
+        return future
+
+    def write(self, func: Callable, *args, **kwargs) -> Any:
+        """queue up a write and block until it's committed, returning its result"""
+        return self.submit(func, *args, **kwargs).result()
+
+    def flush(self) -> None:
+        """block until every write queued so far is committed"""
+        if self.thread is not None:
+            self.write(lambda: None)
+
+    def runs_in_background(self) -> bool:
+        if threading.current_thread() is self.thread:
+            # nested write from inside a batch, it's already in the writer's transaction
+            return False
+        if connection.in_atomic_block:
+            # the caller's open transaction may hold the write lock already, queueing would deadlock
+            return False
+        if connection.settings_dict['NAME'] == ':memory:':
+            # each thread gets its own separate in-memory db
+            return False
+        return True
+
+    def run_inline(self, future: Future, func: Callable, *args, **kwargs) -> None:
+        try:
+            future.set_result(func(*args, **kwargs))
+        except Exception as err:
+            future.set_exception(err)
+
+    def start(self) -> None:
+        with self.lock:
+            if self.thread is None:
+                atexit.register(self.shutdown)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='SQLWriter', daemon=True)
+                self.thread.start()
+
+    def run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            # group commit: take whatever else got queued while the last batch was committing
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.commit(batch)
+
+    def commit(self, batch: list) -> None:
+        start_ts = time.monotonic()
+        results = []
+        try:
+            with transaction.atomic():
+                for queued_ts, future, func, args, kwargs in batch:
+                    queue_wait = time.monotonic() - queued_ts
+                    self.stats.total_queue_wait += queue_wait
+                    self.stats.max_queue_wait = max(self.stats.max_queue_wait, queue_wait)
+                    try:
+                        # savepoint per write, so that one failed write doesn't roll back the rest of the batch
+                        with transaction.atomic():
+                            results.append((future, func(*args, **kwargs), None))
+                    except BaseException as err:
+                        # including SystemExit, it's re-raised in the caller waiting on the future instead
+                        # of killing the writer thread and leaving every other caller waiting forever
+                        results.append((future, None, err))
+        except BaseException as err:
+            # the commit itself failed, so none of the writes in this batch were saved
+            results = [(future, None, err) for _, future, _, _, _ in batch]
+
+        self.stats.batches += 1
+        self.stats.total_commit_time += time.monotonic() - start_ts
+        for future, result, err in results:
+            self.stats.writes += 1
+            if err is None:
+                future.set_result(result)
+            else:
+                self.stats.failed += 1
+                future.set_exception(err)
+
+    def shutdown(self) -> None:
+        """commit any remaining writes and, when debugging, log the stats before exiting"""
+        self.flush()
+        try:
+            from django.conf import settings
+            if not settings.DEBUG:
+                return
+            with open(settings.ERROR_LOG, 'a+', encoding='utf-8') as f:
+                f.write(f'  {self.stats.summary()}\n')
+        except Exception:
+            pass
+
+
+sql_writer = SQLWriter()
+
+
 ### Main Links Index
 
 @enforce_types
@@ -27,7 +180,7 @@ def remove_from_sql_main_index(snapshots: QuerySet, atomic: bool=False, out_dir:
     if atomic:
         with transaction.atomic():
             return snapshots.delete()
-    return snapshots.delete()
+    return sql_writer.write(snapshots.delete)
 
 @enforce_types
 def write_link_to_sql_index(link: Link):
@@ -82,14 +235,17 @@ def write_link_to_sql_index(link: Link):
 
 @enforce_types
 def write_sql_main_index(links: List[Link], out_dir: Path=OUTPUT_DIR) -> None:
-    for link in links:
-        # with transaction.atomic():
-            # write_link_to_sql_index(link)
-        write_link_to_sql_index(link)
-            
+    # queue them all up first so they get group-committed in big batches
+    pending_writes = [sql_writer.submit(write_link_to_sql_index, link) for link in links]
+    for pending_write in pending_writes:
+        pending_write.result()
+
 
 @enforce_types
 def write_sql_link_details(link: Link, out_dir: Path=OUTPUT_DIR) -> None:
+    sql_writer.write(write_link_details_to_sql_index, link)
+
+def write_link_details_to_sql_index(link: Link) -> None:
     from core.models import Snapshot
 
     # with transaction.atomic():
@@ -113,6 +269,386 @@ def write_sql_link_details(link: Link, out_dir: Path=OUTPUT_DIR) -> None:
     snap.save_tags(tag_list)
 
 
+### Bulk Tagging
+
+# tags are added/removed with a few set-based queries per batch of this many snapshots,
+# instead of a get_or_create + add() per snapshot per tag (keeps each IN (...) well under sqlite's variable limit)
+TAG_BATCH_SIZE = 500
+
+def get_or_create_tag_ids(names: List[str]) -> Dict[str, int]:
+    """map each tag name to its Tag id, looking up all the existing ones in a single query"""
+    from core.models import Tag
+
+    names = list(dict.fromkeys(name.strip() for name in names if name.strip()))
+    tag_ids = dict(Tag.objects.filter(name__in=names).values_list('name', 'id'))
+    for name in names:
+        if name not in tag_ids:
+            # new tags go through save() so they get a unique slug
+            tag_ids[name] = Tag.objects.get_or_create(name=name)[0].id
+    return tag_ids
+
+def iter_batches(items: List[Any], size: int=TAG_BATCH_SIZE) -> Iterator[List[Any]]:
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def touch_snapshots(snapshot_ids: List[Any]) -> None:
+    """bump updated on the given snapshots so their cached pages (keyed on it) get re-rendered"""
+    from core.models import Snapshot
+    from django.utils import timezone
+
+    Snapshot.objects.filter(id__in=snapshot_ids).update(updated=timezone.now())
+
+def add_tag_ids_to_snapshots(snapshot_ids: List[Any], tag_ids: List[int]) -> int:
+    """tag every given snapshot with every given tag, returns the number of tags newly added"""
+    from core.models import Snapshot
+
+    SnapshotTag = Snapshot.tags.through
+    tag_ids = list(dict.fromkeys(int(tag_id) for tag_id in tag_ids))
+    num_added = 0
+    for batch in iter_batches(snapshot_ids):
+        if not tag_ids:
+            break
+        existing = set(
+            SnapshotTag.objects
+                .filter(snapshot_id__in=batch, tag_id__in=tag_ids)
+                .values_list('snapshot_id', 'tag_id')
+        )
+        found_ids = Snapshot.objects.filter(id__in=batch).values_list('id', flat=True)
+        new_rows = [
+            SnapshotTag(snapshot_id=snapshot_id, tag_id=tag_id)
+            for snapshot_id in found_ids
+            for tag_id in tag_ids
+            if (snapshot_id, tag_id) not in existing
+        ]
+        SnapshotTag.objects.bulk_create(new_rows, batch_size=TAG_BATCH_SIZE, ignore_conflicts=True)
+        touch_snapshots({row.snapshot_id for row in new_rows})
+        num_added += len(new_rows)
+    return num_added
+
+def remove_tag_ids_from_snapshots(snapshot_ids: List[Any], tag_ids: List[int]) -> int:
+    """untag every given snapshot, returns the number of tags removed"""
+    from core.models import Snapshot
+
+    SnapshotTag = Snapshot.tags.through
+    num_removed = 0
+    for batch in iter_batches(snapshot_ids):
+        rows = SnapshotTag.objects.filter(snapshot_id__in=batch, tag_id__in=list(tag_ids))
+        touched = set(rows.values_list('snapshot_id', flat=True))
+        if touched:
+            num_removed += rows.delete()[0]
+            touch_snapshots(touched)
+    return num_removed
+
+def add_tags_to_snapshots(snapshot_ids: List[Any], tag_names: List[str]) -> int:
+    """tag every given snapshot with every given tag name (creating missing Tags), returns the number of tags newly added"""
+    return add_tag_ids_to_snapshots(snapshot_ids, list(get_or_create_tag_ids(tag_names).values()))
+
+def remove_tags_from_snapshots(snapshot_ids: List[Any], tag_names: List[str]) -> int:
+    """untag every given snapshot by tag name, returns the number of tags removed"""
+    from core.models import Tag
+
+    names = [name.strip() for name in tag_names if name.strip()]
+    return remove_tag_ids_from_snapshots(snapshot_ids, list(Tag.objects.filter(name__in=names).values_list('id', flat=True)))
+
+def update_snapshot_tags(snapshot_ids: List[Any], add: List[str], remove: List[str]) -> Tuple[int, int]:
+    """remove and then add tags by name on every given snapshot, returns the number of tags (added, removed)"""
+    # one function so that it's one sql_writer.write(), i.e. either all of it is saved or none of it
+    num_removed = remove_tags_from_snapshots(snapshot_ids, remove) if remove else 0
+    num_added = add_tags_to_snapshots(snapshot_ids, add) if add else 0
+    return num_added, num_removed
+
+def set_snapshot_tags(snapshot_id: Any, tag_names: List[str]) -> None:
+    """make the snapshot's tags exactly the given names, only touching the rows that differ"""
+    from core.models import Snapshot
+
+    wanted = set(get_or_create_tag_ids(tag_names).values())
+    current = set(Snapshot.tags.through.objects.filter(snapshot_id=snapshot_id).values_list('tag_id', flat=True))
+    if current - wanted:
+        remove_tag_ids_from_snapshots([snapshot_id], list(current - wanted))
+    if wanted - current:
+        add_tag_ids_to_snapshots([snapshot_id], list(wanted - current))
+
+
+# comma-separated, sorted names of the snapshot's tags, kept denormalized in core_snapshot.tag_names
+# by these triggers so that listing pages can show tags without joining core_tag for every row
+SNAPSHOT_TAG_NAMES_SQL = """COALESCE((
+    SELECT group_concat(name, ',') FROM (
+        SELECT core_tag.name AS name FROM core_tag
+        JOIN core_snapshot_tags ON core_snapshot_tags.tag_id = core_tag.id
+        WHERE core_snapshot_tags.snapshot_id = {snapshot_id}
+        ORDER BY core_tag.name
+    )
+), '')"""
+
+SNAPSHOT_TAG_NAMES_TRIGGERS = {
+    'core_snapshot_tags_tag_names_insert': f"""AFTER INSERT ON core_snapshot_tags BEGIN
+        UPDATE core_snapshot SET tag_names = {SNAPSHOT_TAG_NAMES_SQL.format(snapshot_id='new.snapshot_id')}
+        WHERE id = new.snapshot_id;
+    END""",
+    'core_snapshot_tags_tag_names_delete': f"""AFTER DELETE ON core_snapshot_tags BEGIN
+        UPDATE core_snapshot SET tag_names = {SNAPSHOT_TAG_NAMES_SQL.format(snapshot_id='old.snapshot_id')}
+        WHERE id = old.snapshot_id;
+    END""",
+    'core_tag_tag_names_update': f"""AFTER UPDATE OF name ON core_tag BEGIN
+        UPDATE core_snapshot SET tag_names = {SNAPSHOT_TAG_NAMES_SQL.format(snapshot_id='core_snapshot.id')}
+        WHERE id IN (SELECT snapshot_id FROM core_snapshot_tags WHERE tag_id = new.id);
+    END""",
+    # Snapshot.save() writes back whatever tag_names it loaded, which may be stale by then
+    'core_snapshot_tag_names_keep': f"""AFTER UPDATE OF tag_names ON core_snapshot WHEN new.tag_names IS NOT old.tag_names BEGIN
+        UPDATE core_snapshot SET tag_names = {SNAPSHOT_TAG_NAMES_SQL.format(snapshot_id='new.id')}
+        WHERE id = new.id;
+    END""",
+}
+
+def setup_snapshot_tag_names() -> None:
+    """
+    create the triggers that keep core_snapshot.tag_names up-to-date if any are missing
+    (they're dropped while migrating), and refill it if so
+    """
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        existing = {
+            name for (name,) in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'core_%tag_names%'")
+        }
+        missing_triggers = [name for name in SNAPSHOT_TAG_NAMES_TRIGGERS if name not in existing]
+        if not missing_triggers:
+            return
+
+        for name in missing_triggers:
+            cursor.execute(f'CREATE TRIGGER {name} {SNAPSHOT_TAG_NAMES_TRIGGERS[name]}')
+        cursor.execute(f"UPDATE core_snapshot SET tag_names = {SNAPSHOT_TAG_NAMES_SQL.format(snapshot_id='core_snapshot.id')}")
+
+def teardown_snapshot_tag_names() -> None:
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        for name in SNAPSHOT_TAG_NAMES_TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+### Title/URL/Tag Search Index
+
+# trigram tokenized FTS5 table over the snapshot title, url, and tag names, used for substring
+# search in the public index + admin, its rowid is kept equal to core_snapshot.rowid by triggers
+# (a migration that rebuilds core_snapshot renumbers its rowids, so apply_migrations() drops the
+# index beforehand and it gets rebuilt from scratch afterwards)
+SNAPSHOT_FTS_TABLE = 'core_snapshot_fts'
+FTS_TRIGRAM_MIN_LENGTH = 3
+
+SNAPSHOT_TAGS_STR_SQL = """(
+    SELECT group_concat(core_tag.name, ',') FROM core_tag
+    JOIN core_snapshot_tags ON core_snapshot_tags.tag_id = core_tag.id
+    WHERE core_snapshot_tags.snapshot_id = {snapshot_id}
+)"""
+
+SNAPSHOT_FTS_TRIGGERS = {
+    'core_snapshot_fts_insert': f"""AFTER INSERT ON core_snapshot BEGIN
+        INSERT INTO {SNAPSHOT_FTS_TABLE}(rowid, snapshot_id, title, url, tags) VALUES (new.rowid, new.id, new.title, new.url, NULL);
+    END""",
+    'core_snapshot_fts_update': f"""AFTER UPDATE OF title, url ON core_snapshot BEGIN
+        UPDATE {SNAPSHOT_FTS_TABLE} SET title = new.title, url = new.url WHERE rowid = new.rowid;
+    END""",
+    'core_snapshot_fts_delete': f"""AFTER DELETE ON core_snapshot BEGIN
+        DELETE FROM {SNAPSHOT_FTS_TABLE} WHERE rowid = old.rowid;
+    END""",
+    'core_snapshot_tags_fts_insert': f"""AFTER INSERT ON core_snapshot_tags BEGIN
+        UPDATE {SNAPSHOT_FTS_TABLE} SET tags = {SNAPSHOT_TAGS_STR_SQL.format(snapshot_id='new.snapshot_id')}
+        WHERE rowid = (SELECT rowid FROM core_snapshot WHERE id = new.snapshot_id);
+    END""",
+    'core_snapshot_tags_fts_delete': f"""AFTER DELETE ON core_snapshot_tags BEGIN
+        UPDATE {SNAPSHOT_FTS_TABLE} SET tags = {SNAPSHOT_TAGS_STR_SQL.format(snapshot_id='old.snapshot_id')}
+        WHERE rowid = (SELECT rowid FROM core_snapshot WHERE id = old.snapshot_id);
+    END""",
+    'core_tag_fts_update': f"""AFTER UPDATE OF name ON core_tag BEGIN
+        UPDATE {SNAPSHOT_FTS_TABLE} SET tags = {SNAPSHOT_TAGS_STR_SQL.format(snapshot_id=f'{SNAPSHOT_FTS_TABLE}.snapshot_id')}
+        WHERE rowid IN (
+            SELECT core_snapshot.rowid FROM core_snapshot
+            JOIN core_snapshot_tags ON core_snapshot_tags.snapshot_id = core_snapshot.id
+            WHERE core_snapshot_tags.tag_id = new.id
+        );
+    END""",
+}
+
+_snapshot_fts_available: Optional[bool] = None
+
+def setup_snapshot_fts() -> bool:
+    """
+    create the snapshot search index + the triggers that keep it in sync if any are missing,
+    (it's dropped while migrating, so this runs after every migrate and refills the index
+    from scratch if it had to recreate anything)
+    """
+    global _snapshot_fts_available
+
+    if connection.vendor != 'sqlite':
+        _snapshot_fts_available = False
+        return False
+
+    with connection.cursor() as cursor:
+        existing = {
+            name for (name,) in cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE 'core_%fts%'"
+            )
+        }
+        missing_triggers = [name for name in SNAPSHOT_FTS_TRIGGERS if name not in existing]
+        if SNAPSHOT_FTS_TABLE in existing and not missing_triggers:
+            _snapshot_fts_available = True
+            return True
+
+        try:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SNAPSHOT_FTS_TABLE} "
+                "USING fts5(snapshot_id UNINDEXED, title, url, tags, tokenize='trigram')"
+            )
+        except OperationalError:
+            # sqlite was built without FTS5 or is older than 3.34 (no trigram tokenizer),
+            # searching falls back to LIKE queries over the main index in that case
+            _snapshot_fts_available = False
+            return False
+
+        for name in missing_triggers:
+            cursor.execute(f'CREATE TRIGGER {name} {SNAPSHOT_FTS_TRIGGERS[name]}')
+
+        cursor.execute(f'DELETE FROM {SNAPSHOT_FTS_TABLE}')
+        cursor.execute(
+            f"""INSERT INTO {SNAPSHOT_FTS_TABLE}(rowid, snapshot_id, title, url, tags)
+                SELECT rowid, id, title, url, {SNAPSHOT_TAGS_STR_SQL.format(snapshot_id='core_snapshot.id')}
+                FROM core_snapshot"""
+        )
+
+    _snapshot_fts_available = True
+    return True
+
+def teardown_snapshot_fts() -> None:
+    global _snapshot_fts_available
+
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        for name in SNAPSHOT_FTS_TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'DROP TABLE IF EXISTS {SNAPSHOT_FTS_TABLE}')
+    _snapshot_fts_available = False
+
+def snapshot_fts_available() -> bool:
+    global _snapshot_fts_available
+
+    if _snapshot_fts_available is None:
+        _snapshot_fts_available = (
+            connection.vendor == 'sqlite'
+            and SNAPSHOT_FTS_TABLE in connection.introspection.table_names()
+        )
+    return _snapshot_fts_available
+
+def q_snapshot_search(query: str) -> Q:
+    """
+    match snapshots whose title, url, or tag names contain every whitespace-separated term in
+    the query (or whose timestamp starts with it), using the FTS index when it's available
+    """
+    terms = query.split()
+    if not terms:
+        return Q()
+
+    if not snapshot_fts_available():
+        q = Q()
+        for term in terms:
+            q &= Q(title__icontains=term) | Q(url__icontains=term) | Q(tags__name__icontains=term)
+        return q | q_snapshot_id_or_timestamp(query)
+
+    # the trigram index can only match terms of 3+ chars, shorter ones are LIKE-scanned over the (narrow) index table
+    where, params = [], []
+    fts_terms = [term for term in terms if len(term) >= FTS_TRIGRAM_MIN_LENGTH]
+    if fts_terms:
+        where.append(f'{SNAPSHOT_FTS_TABLE} MATCH %s')
+        params.append(' '.join('"{}"'.format(term.replace('"', '""')) for term in fts_terms))
+    for term in terms:
+        if len(term) < FTS_TRIGRAM_MIN_LENGTH:
+            like = '%{}%'.format(term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_'))
+            where.append("(title LIKE %s ESCAPE '\\' OR url LIKE %s ESCAPE '\\' OR tags LIKE %s ESCAPE '\\')")
+            params += [like, like, like]
+
+    matches = RawSQL(f'SELECT snapshot_id FROM {SNAPSHOT_FTS_TABLE} WHERE {" AND ".join(where)}', params)
+    return Q(id__in=matches) | q_snapshot_id_or_timestamp(query)
+
+def q_snapshot_id_or_timestamp(query: str) -> Q:
+    query = query.strip()
+    q = Q(timestamp__gte=query, timestamp__lt=query + '\U0010ffff')
+    if len(query) >= 8 and all(char in '0123456789abcdefABCDEF-' for char in query):
+        q |= Q(id__startswith=query.replace('-', ''))
+    return q
+
+
+### Ranked Search Results
+
+# the ranked snapshot ids from a search backend are passed to sqlite as a single json array
+# parameter and read back with json_each(), whose key column is each id's position in the array,
+# so matching them is one subquery no matter how many there are (instead of an IN (...) with a
+# parameter per id, which has to be split up to stay under sqlite's variable limit), and
+# the rank order can be joined back onto the snapshots.
+# sqlite builds without the JSON1 extension (optional before 3.38) get the ids inlined instead.
+
+_json1_available: Optional[bool] = None
+
+def json1_available() -> bool:
+    global _json1_available
+
+    if _json1_available is None:
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT json_array_length('[]')")
+            _json1_available = True
+        except OperationalError:
+            _json1_available = False
+    return _json1_available
+
+def ranked_hex_ids(snapshot_ids: List[str]) -> List[str]:
+    """the given snapshot ids in the form they're stored in the db (uuid hex), skipping invalid ones"""
+    hex_ids = []
+    for snapshot_id in snapshot_ids:
+        try:
+            hex_ids.append(uuid.UUID(str(snapshot_id)).hex)
+        except ValueError:
+            pass
+    return hex_ids
+
+def ranked_ids_json(snapshot_ids: List[str]) -> str:
+    return json.dumps(ranked_hex_ids(snapshot_ids))
+
+def ranked_ids_literals(snapshot_ids: List[str]) -> List[str]:
+    # only ever uuid hex (see ranked_hex_ids), so they're safe to put in the sql as literals,
+    # without a parameter per id that could go over sqlite's variable limit
+    return [f"'{hex_id}'" for hex_id in ranked_hex_ids(snapshot_ids)]
+
+def q_snapshot_ids(snapshot_ids: List[str]) -> Q:
+    if json1_available():
+        return Q(id__in=RawSQL('SELECT value FROM json_each(%s)', [ranked_ids_json(snapshot_ids)]))
+    return Q(id__in=RawSQL(', '.join(ranked_ids_literals(snapshot_ids)) or 'NULL', []))
+
+def snapshot_rank(snapshot_ids: List[str]) -> RawSQL:
+    """position of each snapshot in the given list of ranked ids, NULL for the ones not in it"""
+    if json1_available():
+        return RawSQL(
+            '(SELECT key FROM json_each(%s) WHERE value = core_snapshot.id)',
+            [ranked_ids_json(snapshot_ids)],
+            output_field=IntegerField(),
+        )
+    whens = ' '.join(f'WHEN {literal} THEN {rank}' for rank, literal in enumerate(ranked_ids_literals(snapshot_ids)))
+    return RawSQL(f'(CASE core_snapshot.id {whens} END)' if whens else 'NULL', [], output_field=IntegerField())
+
+def order_by_search_rank(queryset: QuerySet, snapshot_ids: List[str]) -> QuerySet:
+    """put the given ranked search results first in rank order, followed by the rest of the snapshots newest first"""
+    if not snapshot_ids:
+        return queryset
+    return queryset.annotate(search_rank=snapshot_rank(snapshot_ids)).order_by(
+        F('search_rank').asc(nulls_last=True),
+        '-added',
+        '-pk',
+    )
+
 
 @enforce_types
 def list_migrations(out_dir: Path=OUTPUT_DIR) -> List[Tuple[bool, str]]:
@@ -133,9 +669,21 @@ def list_migrations(out_dir: Path=OUTPUT_DIR) -> List[Tuple[bool, str]]:
 @enforce_types
 def apply_migrations(out_dir: Path=OUTPUT_DIR) -> List[str]:
     from django.core.management import call_command
+    from django.db.migrations.executor import MigrationExecutor
     null, out = StringIO(), StringIO()
     call_command("makemigrations", interactive=False, stdout=null)
+
+    executor = MigrationExecutor(connection)
+    if executor.migration_plan(executor.loader.graph.leaf_nodes()):
+        # django alters a sqlite table by copying it into a new one, which fails on triggers that
+        # reference it and renumbers its rowids, so drop the triggers + search index while migrating
+        teardown_snapshot_fts()
+        teardown_snapshot_tag_names()
+
     call_command("migrate", interactive=False, stdout=out)
+    if not setup_snapshot_fts():
+        out.write('[!] Skipping title/url/tag search index, sqlite FTS5 trigram tokenizer is unavailable\n')
+    setup_snapshot_tag_names()
     out.seek(0)
 
     return [line.strip() for line in out.readlines() if line.strip()]
@@ -12,7 +12,7 @@ from pathlib import Path
 
 from datetime import datetime, timezone
 from dataclasses import dataclass
-from typing import Any, Optional, List, Dict, Union, IO, TYPE_CHECKING
+from typing import Any, Optional, List, Dict, Tuple, Iterable, Iterator, Union, IO, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from .index.schema import Link, ArchiveResult
@@ -546,10 +546,13 @@ def printable_filesize(num_bytes: Union[int, float]) -> str:
 @enforce_types
 def printable_folders(folders: Dict[str, Optional["Link"]],
                       with_headers: bool=False) -> str:
-    return '\n'.join(
-        f'{folder} {link and link.url} "{link and link.title}"'
-        for folder, link in folders.items()
-    )
+    return ''.join(iter_printable_folders(folders.items(), with_headers=with_headers))
+
+
+def iter_printable_folders(folders: Iterable[Tuple[str, Optional["Link"]]],
+                           with_headers: bool=False) -> Iterator[str]:
+    for i, (folder, link) in enumerate(folders):
+        yield ('\n' if i else '') + f'{folder} {link and link.url} "{link and link.title}"'
 
 
 
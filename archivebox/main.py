@@ -9,7 +9,7 @@ from datetime import date
 
 from typing import Dict, List, Optional, Iterable, IO, Union
 from crontab import CronTab, CronSlices
-from django.db.models import QuerySet
+from django.db.models import QuerySet, Sum
 
 from .cli import (
     list_subcommands,
@@ -34,6 +34,10 @@ from .index import (
     dedupe_links,
     write_main_index,
     snapshot_filter,
+    scan_archive_folders,
+    iter_archive_folders,
+    recount_archive_sizes,
+    FOLDER_STATUSES,
     get_indexed_folders,
     get_archived_folders,
     get_unarchived_folders,
@@ -49,18 +53,21 @@ from .index import (
 )
 from .index.json import (
     parse_json_main_index,
-    parse_json_links_details,
-    generate_json_index_from_links,
+    parse_json_link_details,
+    iter_json_index_from_links,
 )
 from .index.sql import (
     get_admins,
     apply_migrations,
     remove_from_sql_main_index,
+    add_tags_to_snapshots,
+    iter_batches,
+    sql_writer,
 )
 from .index.html import (
-    generate_index_from_links,
+    iter_index_from_links,
 )
-from .index.csv import links_to_csv
+from .index.csv import iter_links_csv, iter_snapshot_rows_csv, SNAPSHOT_CSV_COLS, SNAPSHOT_CSV_CHUNK_SIZE
 from .extractors import archive_links, archive_link, ignore_methods
 from .config import (
     stderr,
@@ -70,6 +77,11 @@ from .config import (
     IS_TTY,
     DEBUG,
     IN_DOCKER,
+    BIND_ADDR,
+    SERVER_WORKERS,
+    SERVER_THREADS,
+    SERVER_MAX_REQUESTS,
+    SERVER_TIMEOUT,
     USER,
     PYTHON_BINARY,
     ARCHIVEBOX_BINARY,
@@ -118,7 +130,7 @@ from .logging_util import (
     log_list_started,
     log_list_finished,
     printable_config,
-    printable_folders,
+    iter_printable_folders,
     printable_filesize,
     printable_folder_status,
     printable_dependency_version,
@@ -366,10 +378,16 @@ def init(force: bool=False, quick: bool=False, setup: bool=False, out_dir: Path=
                 print('    {lightyellow}√ Added {} orphaned links from existing JSON index...{reset}'.format(len(orphaned_json_links), **ANSI))
 
             # Links in data dir indexes but not in main index
+            folders = scan_archive_folders(all_links, out_dir=out_dir, statuses=('present', 'invalid'), with_details=False)
+            indexed_urls = set(all_links.values_list('url', flat=True))
             orphaned_data_dir_links = {
                 link.url: link
-                for link in parse_json_links_details(out_dir)
-                if not all_links.filter(url=link.url).exists()
+                for link in (
+                    parse_json_link_details(str(out_dir / ARCHIVE_DIR_NAME / name))
+                    for name, folder_link in folders['present'].items()
+                    if folder_link and folder_link.url not in indexed_urls
+                )
+                if link
             }
             if orphaned_data_dir_links:
                 pending_links.update(orphaned_data_dir_links)
@@ -378,7 +396,7 @@ def init(force: bool=False, quick: bool=False, setup: bool=False, out_dir: Path=
             # Links in invalid/duplicate data dirs
             invalid_folders = {
                 folder: link
-                for folder, link in get_invalid_folders(all_links, out_dir=out_dir).items()
+                for folder, link in folders['invalid'].items()
             }
             if invalid_folders:
                 print('    {lightyellow}! Skipped adding {} invalid link data directories.{reset}'.format(len(invalid_folders), **ANSI))
@@ -433,7 +451,7 @@ def init(force: bool=False, quick: bool=False, setup: bool=False, out_dir: Path=
         print('        archivebox help')
 
 @enforce_types
-def status(out_dir: Path=OUTPUT_DIR) -> None:
+def status(recount: bool=False, out_dir: Path=OUTPUT_DIR) -> None:
     """Print out some info and statistics about the archive collection"""
 
     check_data_folder(out_dir=out_dir)
@@ -451,34 +469,40 @@ def status(out_dir: Path=OUTPUT_DIR) -> None:
 
     links = load_main_index(out_dir=out_dir)
     num_sql_links = links.count()
-    num_link_details = sum(1 for link in parse_json_links_details(out_dir=out_dir))
+    # classify every folder in a single pass over archive/ instead of re-walking it for each status
+    folders = scan_archive_folders(links, out_dir=out_dir, with_details=False)
+    num_link_details = sum(1 for link in folders['present'].values() if link)
     print(f'    > SQL Main Index: {num_sql_links} links'.ljust(36), f'(found in {SQL_INDEX_FILENAME})')
     print(f'    > JSON Link Details: {num_link_details} links'.ljust(36), f'(found in {ARCHIVE_DIR_NAME}/*/index.json)')
     print()
     print('{green}[*] Scanning archive data directories...{reset}'.format(**ANSI))
     print(ANSI['lightyellow'], f'   {ARCHIVE_DIR}/*', ANSI['reset'])
-    num_bytes, num_dirs, num_files = get_dir_size(ARCHIVE_DIR)
+    if recount:
+        num_bytes = recount_archive_sizes(links, out_dir=out_dir)
+    else:
+        # sizes are recorded as each snapshot is archived, so there's no need to walk the whole archive/ dir
+        num_bytes = links.aggregate(total_size=Sum('archive_size'))['total_size'] or 0
     size = printable_filesize(num_bytes)
-    print(f'    Size: {size} across {num_files} files in {num_dirs} directories')
+    print(f'    Size: {size} across {num_sql_links} snapshot directories')
     print(ANSI['black'])
-    num_indexed = len(get_indexed_folders(links, out_dir=out_dir))
-    num_archived = len(get_archived_folders(links, out_dir=out_dir))
-    num_unarchived = len(get_unarchived_folders(links, out_dir=out_dir))
+    num_indexed = len(folders['indexed'])
+    num_archived = len(folders['archived'])
+    num_unarchived = len(folders['unarchived'])
     print(f'    > indexed: {num_indexed}'.ljust(36), f'({get_indexed_folders.__doc__})')
     print(f'      > archived: {num_archived}'.ljust(36), f'({get_archived_folders.__doc__})')
     print(f'      > unarchived: {num_unarchived}'.ljust(36), f'({get_unarchived_folders.__doc__})')
     
-    num_present = len(get_present_folders(links, out_dir=out_dir))
-    num_valid = len(get_valid_folders(links, out_dir=out_dir))
+    num_present = len(folders['present'])
+    num_valid = len(folders['valid'])
     print()
     print(f'    > present: {num_present}'.ljust(36), f'({get_present_folders.__doc__})')
     print(f'      > valid: {num_valid}'.ljust(36), f'({get_valid_folders.__doc__})')
     
-    duplicate = get_duplicate_folders(links, out_dir=out_dir)
-    orphaned = get_orphaned_folders(links, out_dir=out_dir)
-    corrupted = get_corrupted_folders(links, out_dir=out_dir)
-    unrecognized = get_unrecognized_folders(links, out_dir=out_dir)
-    num_invalid = len({**duplicate, **orphaned, **corrupted, **unrecognized})
+    duplicate = folders['duplicate']
+    orphaned = folders['orphaned']
+    corrupted = folders['corrupted']
+    unrecognized = folders['unrecognized']
+    num_invalid = len(folders['invalid'])
     print(f'      > invalid: {num_invalid}'.ljust(36), f'({get_invalid_folders.__doc__})')
     print(f'        > duplicate: {len(duplicate)}'.ljust(36), f'({get_duplicate_folders.__doc__})')
     print(f'        > orphaned: {len(orphaned)}'.ljust(36), f'({get_orphaned_folders.__doc__})')
@@ -564,7 +588,7 @@ def add(urls: Union[str, List[str]],
         out_dir: Path=OUTPUT_DIR) -> List[Link]:
     """Add a new URL or list of URLs to your archive"""
 
-    from core.models import Tag
+    from core.models import Snapshot
 
     assert depth in (0, 1), 'Depth must be 0 or 1 (depth >1 is not supported yet)'
 
@@ -626,19 +650,20 @@ def add(urls: Union[str, List[str]],
             archive_links(new_links, overwrite=False, **archive_kwargs)
 
 
-    # add any tags to imported links
-    tags = [
-        Tag.objects.get_or_create(name=name.strip())[0]
-        for name in tag.split(',')
-        if name.strip()
-    ]
-    if tags:
-        for link in imported_links:
-            snapshot = link.as_snapshot()
-            snapshot.tags.add(*tags)
-            snapshot.tags_str(nocache=True)
-            snapshot.save()
-        # print(f'    √ Tagged {len(imported_links)} Snapshots with {len(tags)} tags {tags_str}')
+    # add any tags to imported links, with a few bulk queries instead of several per link
+    tag_names = [name.strip() for name in tag.split(',') if name.strip()]
+    if tag_names and imported_links:
+        snapshot_ids = [
+            snapshot_id
+            for urls in iter_batches([link.url for link in imported_links])
+            for snapshot_id in Snapshot.objects.filter(url__in=urls).values_list('id', flat=True)
+        ]
+        sql_writer.write(add_tags_to_snapshots, snapshot_ids, tag_names)
+
+        # tagging bumped Snapshot.updated, which the summaries cached while archiving were keyed on
+        for batch in iter_batches(snapshot_ids):
+            for snapshot in Snapshot.objects.filter(pk__in=batch).prefetch_related('archiveresult_set'):
+                snapshot.icons()
 
 
     return all_links
@@ -800,7 +825,7 @@ def list_all(filter_patterns_str: Optional[str]=None,
              json: bool=False,
              html: bool=False,
              with_headers: bool=False,
-             out_dir: Path=OUTPUT_DIR) -> Iterable[Link]:
+             out_dir: Path=OUTPUT_DIR) -> int:
     """List, filter, and export information about archive entries"""
     
     check_data_folder(out_dir=out_dir)
@@ -825,22 +850,44 @@ def list_all(filter_patterns_str: Optional[str]=None,
     if sort:
         snapshots = snapshots.order_by(sort)
 
-    folders = list_folders(
-        links=snapshots,
-        status=status,
-        out_dir=out_dir,
-    )
+    if status not in FOLDER_STATUSES:
+        raise ValueError('Status not recognized.')
+
+    # folders are scanned and written out a chunk at a time instead of building the whole output in memory
+    num_folders = 0
+    def counted(folders):
+        nonlocal num_folders
+        for folder in folders:
+            num_folders += 1
+            yield folder
+
+    folders = counted(iter_archive_folders(snapshots, status=status, out_dir=out_dir))
+    links = (link for _, link in folders)
 
     if json: 
-        output = generate_json_index_from_links(folders.values(), with_headers)
+        output = iter_json_index_from_links(links, with_headers)
     elif html:
-        output = generate_index_from_links(folders.values(), with_headers)
+        if status == 'indexed':
+            num_links = snapshots.count()
+        else:
+            # the row count is rendered above the rows, so the links have to be loaded first
+            links = list(links)
+            num_links = len(links)
+        output = iter_index_from_links(links, with_headers, num_links=num_links)
+    elif csv and status == 'indexed' and set(csv.split(',')) <= set(SNAPSHOT_CSV_COLS):
+        # only plain db columns were requested, no need to look at the data dirs at all
+        rows = counted(snapshots.values_list(*csv.split(',')).iterator(chunk_size=SNAPSHOT_CSV_CHUNK_SIZE))
+        output = iter_snapshot_rows_csv(rows, cols=csv.split(','), header=with_headers)
     elif csv:
-        output = links_to_csv(folders.values(), cols=csv.split(','), header=with_headers)
+        output = iter_links_csv(links, cols=csv.split(','), header=with_headers)
     else:
-        output = printable_folders(folders, with_headers=with_headers)
-    print(output)
-    return folders
+        output = iter_printable_folders(folders, with_headers=with_headers)
+
+    for chunk in output:
+        sys.stdout.write(chunk)
+    sys.stdout.write('\n')
+    sys.stdout.flush()
+    return num_folders
 
 
 @enforce_types
@@ -853,7 +900,7 @@ def list_links(snapshots: Optional[QuerySet]=None,
     
     check_data_folder(out_dir=out_dir)
 
-    if snapshots:
+    if snapshots is not None:
         all_snapshots = snapshots
     else:
         all_snapshots = load_main_index(out_dir=out_dir)
@@ -865,7 +912,7 @@ def list_links(snapshots: Optional[QuerySet]=None,
     if filter_patterns:
         all_snapshots = snapshot_filter(all_snapshots, filter_patterns, filter_type)
 
-    if not all_snapshots:
+    if not all_snapshots.exists():
         stderr('[!] No Snapshots matched your filters:', filter_patterns, f'({filter_type})', color='lightyellow')
 
     return all_snapshots
@@ -877,24 +924,11 @@ def list_folders(links: List[Link],
     
     check_data_folder(out_dir=out_dir)
 
-    STATUS_FUNCTIONS = {
-        "indexed": get_indexed_folders,
-        "archived": get_archived_folders,
-        "unarchived": get_unarchived_folders,
-        "present": get_present_folders,
-        "valid": get_valid_folders,
-        "invalid": get_invalid_folders,
-        "duplicate": get_duplicate_folders,
-        "orphaned": get_orphaned_folders,
-        "corrupted": get_corrupted_folders,
-        "unrecognized": get_unrecognized_folders,
-    }
-
-    try:
-        return STATUS_FUNCTIONS[status](links, out_dir=out_dir)
-    except KeyError:
+    if status not in FOLDER_STATUSES:
         raise ValueError('Status not recognized.')
 
+    return scan_archive_folders(links, out_dir=out_dir, statuses=(status,))[status]
+
 @enforce_types
 def setup(out_dir: Path=OUTPUT_DIR) -> None:
     """Automatically install all ArchiveBox dependencies and extras"""
@@ -1232,6 +1266,9 @@ def server(runserver_args: Optional[List[str]]=None,
            init: bool=False,
            quick_init: bool=False,
            createsuperuser: bool=False,
+           workers: int=SERVER_WORKERS,
+           threads: int=SERVER_THREADS,
+           max_requests: int=SERVER_MAX_REQUESTS,
            out_dir: Path=OUTPUT_DIR) -> None:
     """Run the ArchiveBox HTTP server"""
 
@@ -1267,6 +1304,32 @@ def server(runserver_args: Optional[List[str]]=None,
         print('        archivebox manage createsuperuser')
         print()
 
+    if workers > 0:
+        # production mode: prefork gunicorn server instead of the single-process dev server
+        try:
+            from .core.server import ArchiveBoxServer
+        except ImportError:
+            stderr('[X] Running the server with --workers requires gunicorn, but it is not installed.', color='red')
+            hint('Install it with:  pip install gunicorn')
+            raise SystemExit(2)
+
+        bind = ([arg for arg in runserver_args if not arg.startswith('-')] or [BIND_ADDR])[0]
+        if ':' not in bind:
+            # a bare port, same as runserver
+            bind = f'127.0.0.1:{bind}'
+
+        print(f'    > Running {workers} worker processes with {threads} threads each on http://{bind}')
+        print('    > Send SIGHUP to the master process to gracefully restart the workers')
+        ArchiveBoxServer(
+            bind=bind,
+            workers=workers,
+            threads=threads,
+            max_requests=max_requests,
+            timeout=SERVER_TIMEOUT,
+            debug=config.DEBUG,
+        ).run()
+        return
+
     # fallback to serving staticfiles insecurely with django when DEBUG=False
     if not config.DEBUG:
         runserver_args.append('--insecure')  # TODO: serve statics w/ nginx instead
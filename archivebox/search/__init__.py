@@ -1,14 +1,18 @@
-from typing import List, Union
+from typing import List, Dict, Iterable, Union, Optional
 from pathlib import Path
 from importlib import import_module
+from concurrent.futures import ThreadPoolExecutor
 
 from django.db.models import QuerySet
+from django.utils.html import mark_safe
 
 from archivebox.index.schema import Link
 from archivebox.util import enforce_types
-from archivebox.config import stderr, OUTPUT_DIR, USE_INDEXING_BACKEND, USE_SEARCHING_BACKEND, SEARCH_BACKEND_ENGINE
+from archivebox.config import stderr, OUTPUT_DIR, USE_INDEXING_BACKEND, USE_SEARCHING_BACKEND, SEARCH_BACKEND_ENGINE, SEARCH_BACKEND_THREADS
+from archivebox.system import atomic_write
+from archivebox.index.sql import q_snapshot_ids, order_by_search_rank, iter_batches
 
-from .utils import get_indexable_content, log_index_started
+from .utils import SEARCH_TEXT_FILENAME, get_search_text, log_index_started
 
 def indexing_enabled():
     return USE_INDEXING_BACKEND
@@ -27,6 +31,18 @@ def import_backend():
         raise Exception("Could not load '%s' as a backend: %s" % (backend_string, err))
     return backend
 
+@enforce_types
+def write_search_text(link: Link, out_dir: Optional[Path]=None) -> str:
+    """(re)write the snapshot's search.txt from its extractor outputs, returns the text"""
+    out_dir = Path(out_dir or link.link_dir)
+    text = get_search_text(link, out_dir)
+    path = out_dir / SEARCH_TEXT_FILENAME
+    if text:
+        atomic_write(path, text)
+    elif path.exists():
+        path.unlink()
+    return text
+
 @enforce_types
 def write_search_index(link: Link, texts: Union[List[str], None]=None, out_dir: Path=OUTPUT_DIR, skip_text_index: bool=False) -> None:
     if not indexing_enabled():
@@ -48,26 +64,57 @@ def write_search_index(link: Link, texts: Union[List[str], None]=None, out_dir:
                 )
 
 @enforce_types
-def query_search_index(query: str, out_dir: Path=OUTPUT_DIR) -> QuerySet:
+def search_index_ids(query: str, limit: Optional[int]=None, offset: int=0) -> List[str]:
+    """ids of the snapshots matching the query in the search backend, best matches first"""
+    if not search_backend_enabled():
+        return []
+
+    backend = import_backend()
+    try:
+        return list(backend.search(query, limit=limit, offset=offset))
+    except Exception as err:
+        stderr()
+        stderr(
+                f'[X] The search backend threw an exception={err}:',
+            color='red',
+            )
+        raise
+
+def search_snippets(query: str, snapshot_ids: List[str]) -> Dict[str, str]:
+    """html excerpts of the text matching the query for each of the given snapshots, if the backend can make them"""
+    if not search_backend_enabled() or not query.strip() or not snapshot_ids:
+        return {}
+
+    backend = import_backend()
+    if not hasattr(backend, 'snippets'):
+        return {}
+    try:
+        return backend.snippets(query, [str(snapshot_id) for snapshot_id in snapshot_ids])
+    except Exception as err:
+        stderr()
+        stderr(
+            f'[X] The search backend threw an exception={err}:',
+        color='red',
+        )
+        return {}
+
+def add_search_snippets(snapshots: Iterable, query: str) -> None:
+    """set .search_snippet on each of the snapshots being shown to the excerpt of its text matching the query"""
+    snapshots = list(snapshots)
+    snippets = search_snippets(query, [str(snapshot.pk) for snapshot in snapshots])
+    for snapshot in snapshots:
+        snippet = snippets.get(str(snapshot.pk))
+        snapshot.search_snippet = mark_safe(snippet) if snippet else None   # already escaped by the backend
+
+@enforce_types
+def query_search_index(query: str, limit: Optional[int]=None, offset: int=0, out_dir: Path=OUTPUT_DIR) -> QuerySet:
+    """the snapshots matching the query in the search backend, ordered by rank, only fetching the given page of them"""
     from core.models import Snapshot
 
-    if search_backend_enabled():
-        backend = import_backend()
-        try:
-            snapshot_ids = backend.search(query)
-        except Exception as err:
-            stderr()
-            stderr(
-                    f'[X] The search backend threw an exception={err}:',
-                color='red',
-                )
-            raise
-        else:
-            # TODO preserve ordering from backend
-            qsearch = Snapshot.objects.filter(pk__in=snapshot_ids)
-            return qsearch
-    
-    return Snapshot.objects.none()
+    snapshot_ids = search_index_ids(query, limit=limit, offset=offset)
+    if not snapshot_ids:
+        return Snapshot.objects.none()
+    return order_by_search_rank(Snapshot.objects.filter(q_snapshot_ids(snapshot_ids)), snapshot_ids)
 
 @enforce_types
 def flush_search_index(snapshots: QuerySet):
@@ -84,25 +131,44 @@ def flush_search_index(snapshots: QuerySet):
         color='red',
         )
 
+@enforce_types
+def index_link(link: Link, snapshot_id: Optional[str]) -> None:
+    log_index_started(link.url)
+    try:
+        text = write_search_text(link)
+    except Exception as err:
+        stderr()
+        stderr(
+            f'[X] An Exception ocurred reading the indexable content={err}:',
+            color='red',
+            )
+        return
+
+    if not (indexing_enabled() and snapshot_id):
+        return
+    try:
+        import_backend().index(snapshot_id=snapshot_id, texts=[text])
+    except Exception as err:
+        stderr()
+        stderr(
+            f'[X] The search backend threw an exception={err}:',
+        color='red',
+        )
+
 @enforce_types
 def index_links(links: Union[List[Link],None], out_dir: Path=OUTPUT_DIR):
     if not links:
         return
 
-    from core.models import Snapshot, ArchiveResult
+    from core.models import Snapshot
 
-    for link in links:
-        snap = Snapshot.objects.filter(url=link.url).first()
-        if snap: 
-            results = ArchiveResult.objects.indexable().filter(snapshot=snap)
-            log_index_started(link.url)
-            try:
-                texts = get_indexable_content(results)
-            except Exception as err:
-                stderr()
-                stderr(
-                    f'[X] An Exception ocurred reading the indexable content={err}:',
-                    color='red',
-                    ) 
-            else:
-                write_search_index(link, texts, out_dir=out_dir)
+    # reading the outputs and sending them to the backend is all file and network io,
+    # so index several snapshots at a time (the threads dont touch the db, ids are looked up here)
+    with ThreadPoolExecutor(max_workers=max(SEARCH_BACKEND_THREADS, 1)) as executor:
+        for batch in iter_batches(links):
+            snapshot_ids = {
+                url: str(pk)
+                for url, pk in Snapshot.objects.filter(url__in=[link.url for link in batch]).values_list('url', 'pk')
+            }
+            for _ in executor.map(lambda link: index_link(link, snapshot_ids.get(link.url)), batch):
+                pass
@@ -1,15 +1,15 @@
 import re
 from subprocess import run, PIPE
-from typing import List, Generator
+from typing import List, Generator, Optional
 
 from archivebox.config import ARCHIVE_DIR, RIPGREP_VERSION, SEARCH_BACKEND_TIMEOUT
 from archivebox.util import enforce_types
+from archivebox.search.utils import SEARCH_TEXT_FILENAME
 
-RG_IGNORE_EXTENSIONS = ('css','js','orig','svg')
-
-RG_ADD_TYPE = '--type-add'
-RG_IGNORE_ARGUMENTS = f"ignore:*.{{{','.join(RG_IGNORE_EXTENSIONS)}}}"
-RG_DEFAULT_ARGUMENTS = "-ilTignore" # Case insensitive(i), matching files results(l)
+# only search the plain text search.txt of each snapshot (archive/<timestamp>/search.txt),
+# not the raw html/js/css outputs, which are way bigger and full of markup that gives false matches
+RG_GLOB_ARGUMENTS = ('--glob', SEARCH_TEXT_FILENAME, '--max-depth', '2')
+RG_DEFAULT_ARGUMENTS = "-il" # Case insensitive(i), matching files results(l)
 RG_REGEX_ARGUMENT = '-e'
 
 TIMESTAMP_REGEX = r'\/([\d]+\.[\d]+)\/'
@@ -25,13 +25,13 @@ def flush(snapshot_ids: Generator[str, None, None]):
     return
 
 @enforce_types
-def search(text: str) -> List[str]:
+def search(text: str, limit: Optional[int]=None, offset: int=0) -> List[str]:
     if not RIPGREP_VERSION:
         raise Exception("ripgrep binary not found, install ripgrep to use this search backend")
 
     from core.models import Snapshot
 
-    rg_cmd = ['rg', RG_ADD_TYPE, RG_IGNORE_ARGUMENTS, RG_DEFAULT_ARGUMENTS, RG_REGEX_ARGUMENT, text, str(ARCHIVE_DIR)]
+    rg_cmd = ['rg', *RG_GLOB_ARGUMENTS, RG_DEFAULT_ARGUMENTS, RG_REGEX_ARGUMENT, text, str(ARCHIVE_DIR)]
     rg = run(rg_cmd, stdout=PIPE, stderr=PIPE, timeout=SEARCH_BACKEND_TIMEOUT)
     file_paths = [p.decode() for p in rg.stdout.splitlines()]
     timestamps = set()
@@ -40,6 +40,10 @@ def search(text: str) -> List[str]:
         if ts:
             timestamps.add(ts[0])
     
-    snap_ids = [str(id) for id in Snapshot.objects.filter(timestamp__in=timestamps).values_list('pk', flat=True)]
-
-    return snap_ids
+    # ripgrep has no notion of relevance, so just list the most recently added matches first
+    snapshots = Snapshot.objects.filter(timestamp__in=timestamps).order_by('-added', '-pk')
+    if limit is not None:
+        snapshots = snapshots[offset:offset + limit]
+    elif offset:
+        snapshots = snapshots[offset:]
+    return [str(id) for id in snapshots.values_list('pk', flat=True)]
@@ -1,44 +1,186 @@
-from typing import List, Generator
+import time
+import queue
+import select
 
-from sonic import IngestClient, SearchClient
+from contextlib import contextmanager
+from typing import List, Generator, Optional, Iterator, Callable, Any
+
+from sonic.client import SonicConnection, SonicServerError, quote_text, raise_for_error, pythonify_result
 
 from archivebox.util import enforce_types
-from archivebox.config import SEARCH_BACKEND_HOST_NAME, SEARCH_BACKEND_PORT, SEARCH_BACKEND_PASSWORD, SONIC_BUCKET, SONIC_COLLECTION
+from archivebox.config import (
+    SEARCH_BACKEND_HOST_NAME,
+    SEARCH_BACKEND_PORT,
+    SEARCH_BACKEND_PASSWORD,
+    SEARCH_BACKEND_TIMEOUT,
+    SEARCH_BACKEND_THREADS,
+    SONIC_BUCKET,
+    SONIC_COLLECTION,
+)
 
 MAX_SONIC_TEXT_TOTAL_LENGTH = 100000000     # dont index more than 100 million characters per text
-MAX_SONIC_TEXT_CHUNK_LENGTH = 2000          # dont index more than 2000 characters per chunk
 MAX_SONIC_ERRORS_BEFORE_ABORT = 5
+SONIC_PIPELINE_SIZE = 64                    # send this many commands at a time before reading their responses
+SONIC_IDLE_TIMEOUT = 240                    # dont reuse connections idle for longer than this (sonic drops them after tcp_timeout=300)
+SONIC_POOL_SIZE = max(SEARCH_BACKEND_THREADS, 1)
+
+
+class SonicChannel(SonicConnection):
+    """
+    a connection to one of sonic's channels (ingest or search) that can pipeline commands,
+    i.e. send a batch of them in one write and then read all their responses, instead of
+    waiting for a round trip per command (or two, sonic.IngestClient PINGs after each one)
+
+    (builds on sonic-client's SonicConnection internals, see the version pinned in setup.py)
+    """
+
+    def __init__(self, channel: str):
+        super().__init__(SEARCH_BACKEND_HOST_NAME, SEARCH_BACKEND_PORT, SEARCH_BACKEND_PASSWORD, channel, timeout=SEARCH_BACKEND_TIMEOUT)
+        self.connect()
+        self.last_used = time.monotonic()
+        self.has_sent = False
+
+    def _get_response(self):
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionResetError('Sonic closed the connection')
+        return pythonify_result(raise_for_error(line).strip())
+
+    @property
+    def max_command_size(self) -> int:
+        # sonic rejects commands longer than the buffer size it announced when the channel was started
+        return int(self.bufsize)
+
+    def is_alive(self) -> bool:
+        # there's nothing to read on an idle connection, unless sonic closed it (or ENDED it)
+        readable, _, _ = select.select([self._socket], [], [], 0)
+        return not readable
+
+    def send(self, data: str) -> None:
+        self._writer.write(data)
+        self._writer.flush()
+        self.has_sent = True
+
+    def query(self, *args) -> List[str]:
+        self.send(self._format_command('QUERY', *args))
+        self._get_response()                      # PENDING <id>
+        return self._get_response()               # EVENT QUERY <id> <results...>
+
+    def pipeline(self, cmd: str, args_list: List[tuple]) -> None:
+        errors = []
+        for start in range(0, len(args_list), SONIC_PIPELINE_SIZE):
+            batch = args_list[start:start + SONIC_PIPELINE_SIZE]
+            self.send(''.join(self._format_command(cmd, *args) for args in batch))
+            for _ in batch:
+                try:
+                    self._get_response()
+                except SonicServerError as err:
+                    print(f'[!] Sonic search backend threw an error: {err.__class__.__name__} {err}')
+                    errors.append(err)
+                    if len(errors) > MAX_SONIC_ERRORS_BEFORE_ABORT:
+                        raise
+
+
+_pools = {
+    'ingest': queue.LifoQueue(),
+    'search': queue.LifoQueue(),
+}
+
+@contextmanager
+def sonic_channel(channel: str) -> Iterator[SonicChannel]:
+    """borrow an open connection to the given channel from the pool, or open a new one if none are free"""
+    pool = _pools[channel]
+    conn = None
+    while conn is None:
+        try:
+            conn = pool.get_nowait()
+        except queue.Empty:
+            conn = SonicChannel(channel)
+        else:
+            if time.monotonic() - conn.last_used > SONIC_IDLE_TIMEOUT or not conn.is_alive():
+                conn.close()
+                conn = None
+    conn.has_sent = False
+
+    try:
+        yield conn
+    except BaseException:
+        # it may be halfway through a response, never give it back to the pool
+        conn.close()
+        raise
+
+    conn.last_used = time.monotonic()
+    if pool.qsize() < SONIC_POOL_SIZE:
+        pool.put(conn)
+    else:
+        conn.close()
+
+def run_on_channel(channel: str, func: Callable[[SonicChannel], Any]) -> Any:
+    """
+    run func with a pooled connection, retrying once on a new one if the pooled one turns out to be
+    dead before anything was sent on it (after that, retrying could e.g. PUSH some chunks twice)
+    """
+    conn = None
+    try:
+        with sonic_channel(channel) as conn:
+            return func(conn)
+    except (ConnectionError, BrokenPipeError):
+        if conn is None or conn.has_sent:
+            raise
+        # sonic was probably restarted, so the rest of the pooled connections are dead too
+        pool = _pools[channel]
+        while not pool.empty():
+            pool.get_nowait().close()
+        with sonic_channel(channel) as conn:
+            return func(conn)
+
+def chunk_text(text: str, max_size: int) -> Iterator[str]:
+    """split text into chunks of at most max_size bytes once quoted, only ever breaking it between words"""
+    # sonic's quoting only escapes ", a trailing backslash would escape the closing quote
+    text = ' '.join(text.replace('\\', ' ').split())
+    start = 0
+    while start < len(text):
+        chunk = text[start:start + max_size]
+        overflow = len(chunk.encode('utf-8')) + chunk.count('"') + 2 - max_size
+        if overflow > 0:
+            # every character is at least a byte, so this is always enough to make it fit
+            chunk = chunk[:len(chunk) - overflow]
+        end = start + len(chunk)
+        if end < len(text) and text[end] != ' ':
+            last_space = chunk.rfind(' ')
+            if last_space == -1:
+                # a single word longer than a chunk (base64 data, a minified blob, etc.), skip it
+                start = (text.find(' ', end) + 1) or len(text)
+                continue
+            chunk = chunk[:last_space]
+        if chunk:
+            yield chunk
+        start += len(chunk) + 1
 
 @enforce_types
 def index(snapshot_id: str, texts: List[str]):
-    error_count = 0
-    with IngestClient(SEARCH_BACKEND_HOST_NAME, SEARCH_BACKEND_PORT, SEARCH_BACKEND_PASSWORD) as ingestcl:
-        for text in texts:
-            chunks = (
-                text[i:i+MAX_SONIC_TEXT_CHUNK_LENGTH]
-                for i in range(
-                    0,
-                    min(len(text), MAX_SONIC_TEXT_TOTAL_LENGTH),
-                    MAX_SONIC_TEXT_CHUNK_LENGTH,
-                )
-            )
-            try:
-                for chunk in chunks:
-                    ingestcl.push(SONIC_COLLECTION, SONIC_BUCKET, snapshot_id, str(chunk))
-            except Exception as err:
-                print(f'[!] Sonic search backend threw an error while indexing: {err.__class__.__name__} {err}')
-                error_count += 1
-                if error_count > MAX_SONIC_ERRORS_BEFORE_ABORT:
-                    raise
+    text = '\n'.join(texts)[:MAX_SONIC_TEXT_TOTAL_LENGTH]
+
+    def push_chunks(conn: SonicChannel):
+        header_size = len(conn._format_command('PUSH', SONIC_COLLECTION, SONIC_BUCKET, snapshot_id, '').encode('utf-8'))
+        conn.pipeline('PUSH', [
+            (SONIC_COLLECTION, SONIC_BUCKET, snapshot_id, quote_text(chunk))
+            for chunk in chunk_text(text, conn.max_command_size - header_size - 16)
+        ])
+
+    run_on_channel('ingest', push_chunks)
 
 @enforce_types
-def search(text: str) -> List[str]:
-    with SearchClient(SEARCH_BACKEND_HOST_NAME, SEARCH_BACKEND_PORT, SEARCH_BACKEND_PASSWORD) as querycl:
-        snap_ids = querycl.query(SONIC_COLLECTION, SONIC_BUCKET, text)
-    return snap_ids
+def search(text: str, limit: Optional[int]=None, offset: int=0) -> List[str]:
+    # sonic returns its results ranked, without a limit it returns query_limit_default of them (see etc/sonic.cfg)
+    args = [SONIC_COLLECTION, SONIC_BUCKET, quote_text(text)]
+    if limit:
+        args.append(f'LIMIT({limit})')
+    if offset:
+        args.append(f'OFFSET({offset})')
+    return run_on_channel('search', lambda conn: conn.query(*args))
 
 @enforce_types
 def flush(snapshot_ids: Generator[str, None, None]):
-    with IngestClient(SEARCH_BACKEND_HOST_NAME, SEARCH_BACKEND_PORT, SEARCH_BACKEND_PASSWORD) as ingestcl:
-        for id in snapshot_ids:
-            ingestcl.flush_object(SONIC_COLLECTION, SONIC_BUCKET, str(id))
+    args_list = [(SONIC_COLLECTION, SONIC_BUCKET, str(snapshot_id)) for snapshot_id in snapshot_ids]
+    run_on_channel('ingest', lambda conn: conn.pipeline('FLUSHO', args_list))
@@ -0,0 +1,143 @@
+import html
+import sqlite3
+import hashlib
+import threading
+
+from time import time
+from typing import List, Dict, Generator, Optional
+
+from archivebox.util import enforce_types
+from archivebox.config import OUTPUT_DIR, SEARCH_INDEX_FILENAME, SEARCH_BACKEND_TIMEOUT
+
+# Full-text search index in its own sqlite3 file (search.sqlite3 next to index.sqlite3), so that
+# indexing big pages never holds up writes to the main index, and it can be deleted + rebuilt
+# with `archivebox update --index-only` at any time.
+#
+# snapshot_texts maps each Snapshot id to the rowid of its text in the snapshot_fts FTS5 table,
+# along with a hash of the text so that re-indexing an unchanged snapshot is a no-op.
+
+MAX_FTS_TEXT_LENGTH = 10_000_000     # dont index more than 10 million characters per snapshot
+FTS_SNIPPET_TOKENS = 24              # number of words of context around the matches in snippets
+FTS_BATCH_SIZE = 500                 # number of snapshot ids per IN (...) when flushing
+
+_local = threading.local()
+
+def get_connection() -> sqlite3.Connection:
+    path = str(OUTPUT_DIR / SEARCH_INDEX_FILENAME)
+    connection = getattr(_local, 'connection', None)
+    if connection is None or getattr(_local, 'path', None) != path:
+        connection = sqlite3.connect(path, timeout=SEARCH_BACKEND_TIMEOUT, isolation_level=None, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=wal')
+        connection.execute('PRAGMA synchronous=normal')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS snapshot_texts ('
+            '    id INTEGER PRIMARY KEY,'
+            '    snapshot_id TEXT NOT NULL UNIQUE,'
+            '    content_hash TEXT NOT NULL,'
+            '    indexed_at REAL NOT NULL'
+            ')'
+        )
+        connection.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS snapshot_fts "
+            "USING fts5(content, tokenize='porter unicode61 remove_diacritics 2')"
+        )
+        _local.connection, _local.path = connection, path
+    return connection
+
+def fts_query(text: str) -> Optional[str]:
+    """
+    turn a search box query into an FTS5 query that matches snapshots containing all
+    of the words, quoting each one so that punctuation is never parsed as FTS5 syntax
+    (a trailing * is kept to allow prefix searches, e.g. archiv*)
+    """
+    terms = []
+    for word in text.split():
+        is_prefix = word.endswith('*')
+        word = word.rstrip('*').replace('"', '""')
+        if word:
+            terms.append(f'"{word}"*' if is_prefix else f'"{word}"')
+    return ' '.join(terms) or None
+
+@enforce_types
+def index(snapshot_id: str, texts: List[str]):
+    content = '\n\n'.join(text for text in texts if text)[:MAX_FTS_TEXT_LENGTH]
+    if not content.strip():
+        delete_snapshot_texts([snapshot_id])
+        return
+
+    content_hash = hashlib.sha256(content.encode('utf-8', errors='replace')).hexdigest()
+    connection = get_connection()
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        row = connection.execute('SELECT id, content_hash FROM snapshot_texts WHERE snapshot_id = ?', (snapshot_id,)).fetchone()
+        if row and row[1] == content_hash:
+            # already indexed with the exact same text, nothing to do
+            connection.execute('COMMIT')
+            return
+
+        if row:
+            rowid = row[0]
+            connection.execute('DELETE FROM snapshot_fts WHERE rowid = ?', (rowid,))
+            connection.execute('UPDATE snapshot_texts SET content_hash = ?, indexed_at = ? WHERE id = ?', (content_hash, time(), rowid))
+        else:
+            rowid = connection.execute(
+                'INSERT INTO snapshot_texts (snapshot_id, content_hash, indexed_at) VALUES (?, ?, ?)',
+                (snapshot_id, content_hash, time()),
+            ).lastrowid
+        connection.execute('INSERT INTO snapshot_fts (rowid, content) VALUES (?, ?)', (rowid, content))
+        connection.execute('COMMIT')
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+
+@enforce_types
+def search(text: str, limit: Optional[int]=None, offset: int=0) -> List[str]:
+    """ids of the snapshots matching every word of the query, best matches (by BM25) first"""
+    query = fts_query(text)
+    if query is None:
+        return []
+    rows = get_connection().execute(
+        'SELECT snapshot_texts.snapshot_id FROM snapshot_fts '
+        'JOIN snapshot_texts ON snapshot_texts.id = snapshot_fts.rowid '
+        'WHERE snapshot_fts MATCH ? ORDER BY bm25(snapshot_fts) LIMIT ? OFFSET ?',
+        (query, -1 if limit is None else limit, offset),
+    )
+    return [snapshot_id for (snapshot_id,) in rows]
+
+@enforce_types
+def snippets(text: str, snapshot_ids: List[str]) -> Dict[str, str]:
+    """html excerpts of the matched text for each of the given snapshots, with the matching words in <mark>s"""
+    query = fts_query(text)
+    if query is None or not snapshot_ids:
+        return {}
+    results = {}
+    for start in range(0, len(snapshot_ids), FTS_BATCH_SIZE):
+        batch = snapshot_ids[start:start + FTS_BATCH_SIZE]
+        rows = get_connection().execute(
+            "SELECT snapshot_texts.snapshot_id, snippet(snapshot_fts, 0, char(2), char(3), '…', ?) FROM snapshot_fts "
+            "JOIN snapshot_texts ON snapshot_texts.id = snapshot_fts.rowid "
+            f"WHERE snapshot_fts MATCH ? AND snapshot_texts.snapshot_id IN ({','.join('?' * len(batch))})",
+            (FTS_SNIPPET_TOKENS, query, *batch),
+        )
+        # the indexed text is escaped here, so the matches are wrapped in control chars until then
+        for snapshot_id, snippet in rows:
+            results[snapshot_id] = html.escape(snippet).replace('\x02', '<mark>').replace('\x03', '</mark>')
+    return results
+
+def delete_snapshot_texts(snapshot_ids: List[str]) -> None:
+    connection = get_connection()
+    for start in range(0, len(snapshot_ids), FTS_BATCH_SIZE):
+        batch = snapshot_ids[start:start + FTS_BATCH_SIZE]
+        placeholders = ','.join('?' * len(batch))
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(f'DELETE FROM snapshot_fts WHERE rowid IN (SELECT id FROM snapshot_texts WHERE snapshot_id IN ({placeholders}))', batch)
+            connection.execute(f'DELETE FROM snapshot_texts WHERE snapshot_id IN ({placeholders})', batch)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+@enforce_types
+def flush(snapshot_ids: Generator[str, None, None]):
+    delete_snapshot_texts(list(snapshot_ids))
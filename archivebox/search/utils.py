@@ -1,45 +1,119 @@
-from django.db.models import QuerySet
+import re
 
+from pathlib import Path
+from html.parser import HTMLParser
+from typing import List, Optional
+
+from archivebox.index.schema import Link
 from archivebox.util import enforce_types
 from archivebox.config import ANSI
 
+# plain visible text of each snapshot, written next to its other outputs once the extractors are
+# done, this is what every search backend indexes (instead of megabytes of inlined images/css/js)
+SEARCH_TEXT_FILENAME = 'search.txt'
+MAX_SEARCH_TEXT_LENGTH = 1_000_000      # dont keep more than 1 million characters of text per snapshot
+
+# where to find each extractor's output text, in order of preference
+SEARCH_TEXT_SOURCES = (
+    ('readability', 'content.txt'),
+    ('singlefile', None),
+    ('dom', None),
+    ('wget', None),
+)
+MEDIA_TEXT_PATTERNS = ('*.description', '*.srt', '*.vtt', '*.lrc')
+
+HIDDEN_TAGS = {'script', 'style', 'noscript', 'template', 'svg', 'math', 'iframe', 'object'}
+BLOCK_TAGS = {
+    'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'details', 'div', 'dl', 'dt', 'figcaption',
+    'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav',
+    'ol', 'p', 'pre', 'section', 'summary', 'table', 'td', 'th', 'title', 'tr', 'ul',
+}
+HTML_READ_CHUNK_SIZE = 256 * 1024
+
 def log_index_started(url):
     print('{green}[*] Indexing url: {} in the search index {reset}'.format(url, **ANSI))
     print( )
 
-def get_file_result_content(res, extra_path, use_pwd=False):
-    if use_pwd: 
-        fpath = f'{res.pwd}/{res.output}'
-    else:
-        fpath = f'{res.output}'
-    
-    if extra_path:
-        fpath = f'{fpath}/{extra_path}'
 
-    with open(fpath, 'r', encoding='utf-8') as file:
-        data = file.read()
-    if data:
-        return [data]
-    return []
+class VisibleTextParser(HTMLParser):
+    """collects the text a browser would show, skipping scripts, styles, inline svgs, etc."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.hidden_depth = 0
+        self.parts: List[str] = []
+        self.length = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in HIDDEN_TAGS:
+            self.hidden_depth += 1
+        if tag in BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in HIDDEN_TAGS and self.hidden_depth:
+            self.hidden_depth -= 1
+        if tag in BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if not self.hidden_depth:
+            self.parts.append(data)
+            self.length += len(data)
+
+
+def normalize_text(text: str) -> str:
+    """collapse runs of whitespace and drop empty lines"""
+    lines = (re.sub(r'\s+', ' ', line).strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line)
+
+
+@enforce_types
+def html_file_to_text(path: Path, max_length: int=MAX_SEARCH_TEXT_LENGTH) -> str:
+    parser = VisibleTextParser()
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        # stop reading once there's enough text, no need to parse the rest of a huge page
+        while parser.length < max_length * 2:
+            chunk = f.read(HTML_READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            parser.feed(chunk)
+    parser.close()
+    return normalize_text(''.join(parser.parts))
+
+
+def latest_output(link: Link, method: str) -> Optional[str]:
+    for result in reversed(link.history.get(method, [])):
+        if isinstance(result, dict):
+            status, output = result.get('status'), result.get('output')
+        else:
+            status, output = result.status, result.output
+        if status == 'succeeded' and isinstance(output, str):
+            return output
+    return None
 
 
-# This should be abstracted by a plugin interface for extractors
 @enforce_types
-def get_indexable_content(results: QuerySet):
-    if not results:
-        return []
-    # Only use the first method available
-    res, method = results.first(), results.first().extractor
-    if method not in ('readability', 'singlefile', 'dom', 'wget'):
-        return []
-    # This should come from a plugin interface
-
-    # TODO: banish this duplication and get these from the extractor file
-    if method == 'readability':
-        return get_file_result_content(res, 'content.txt', use_pwd=True)
-    elif method == 'singlefile':
-        return get_file_result_content(res, '', use_pwd=True)
-    elif method == 'dom':
-        return get_file_result_content(res, '', use_pwd=True)
-    elif method == 'wget':
-        return get_file_result_content(res, '', use_pwd=True)
+def get_search_text(link: Link, out_dir: Path) -> str:
+    """the visible text of the best available extractor output, plus any media descriptions/subtitles"""
+    texts = []
+    for method, text_file in SEARCH_TEXT_SOURCES:
+        output = latest_output(link, method)
+        path = out_dir / output if output else None
+        if path and text_file:
+            path = path / text_file
+        if not (path and path.is_file()):
+            continue
+        if text_file:
+            texts.append(normalize_text(path.read_text(encoding='utf-8', errors='replace')[:MAX_SEARCH_TEXT_LENGTH * 2]))
+        else:
+            texts.append(html_file_to_text(path))
+        break
+
+    media_dir = out_dir / 'media'
+    if latest_output(link, 'media') and media_dir.is_dir():
+        for pattern in MEDIA_TEXT_PATTERNS:
+            for text_file in sorted(media_dir.glob(pattern)):
+                texts.append(normalize_text(text_file.read_text(encoding='utf-8', errors='replace')))
+
+    return '\n\n'.join(text for text in texts if text)[:MAX_SEARCH_TEXT_LENGTH]
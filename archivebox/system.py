@@ -163,6 +163,26 @@ def get_dir_size(path: Union[str, Path], recursive: bool=True, pattern: Optional
     return num_bytes, num_dirs, num_files
 
 
+def get_output_size(out_dir: Union[str, Path], output: Optional[str]) -> Optional[int]:
+    """get the disk size of an archive method output, measured from its
+       top-level file or folder in the snapshot dir (e.g. example.com/ for wget)
+    """
+    if not isinstance(output, str) or not output.strip() or Path(output).is_absolute():
+        return None
+
+    top_level = Path(output).parts[0]
+    if top_level in ('.', '..'):
+        return None
+
+    output_path = Path(out_dir) / top_level
+    try:
+        if output_path.is_dir():
+            return get_dir_size(output_path)[0]
+        return output_path.stat().st_size
+    except OSError:
+        return None
+
+
 CRON_COMMENT = 'archivebox_schedule'
 
 
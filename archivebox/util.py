@@ -18,6 +18,11 @@ from requests.exceptions import RequestException, ReadTimeout
 from .vendor.base32_crockford import encode as base32_encode                            # type: ignore
 from w3lib.encoding import html_body_declared_encoding, http_content_type_encoding
 
+try:
+    from re import _parser as sre_parse                                                 # python >= 3.11
+except ImportError:
+    import sre_parse                                                                    # type: ignore
+
 try:
     import chardet
     detect_encoding = lambda rawdata: chardet.detect(rawdata)["encoding"]
@@ -68,6 +73,38 @@ URL_REGEX = re.compile(
 
 COLOR_REGEX = re.compile(r'\[(?P<arg_1>\d+)(;(?P<arg_2>\d+)(;(?P<arg_3>\d+))?)?m')
 
+def regex_literals(pattern: str, min_length: int=2) -> List[str]:
+    r"""
+    Get the literal substrings that every match of a regex must contain, e.g.
+    r'^https?://(www\.)?example\.com/\d+' -> ['http', '://', 'example.com/']
+    (best-effort and conservative: anything that can vary splits or drops a literal)
+    """
+    literals = []
+
+    def flush(run):
+        if len(run) >= min_length:
+            literals.append(''.join(run))
+        return []
+
+    def walk(items, run):
+        for op, arg in items:
+            if op == sre_parse.LITERAL and arg < 128:
+                run.append(chr(arg))
+            elif op == sre_parse.AT:
+                # anchors are zero-width, they don't split a literal
+                continue
+            elif op == sre_parse.SUBPATTERN:
+                run = walk(arg[-1], run)
+            else:
+                run = flush(run)
+                if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and arg[0] >= 1:
+                    flush(walk(arg[2], []))
+        return run
+
+    flush(walk(sre_parse.parse(pattern), []))
+    return literals
+
+
 def is_static_file(url: str):
     # TODO: the proper way is with MIME type detection + ext, not only extension
     from .config import STATICFILE_EXTENSIONS
@@ -80,36 +117,50 @@ def enforce_types(func):
     """
     # TODO: check return type as well
 
+    from .config import ENFORCE_TYPES
+    if not ENFORCE_TYPES:
+        # typechecking is disabled (e.g. in production), skip the wrapper entirely
+        return func
+
+    # resolve the signature once at decoration time instead of on every call,
+    # only plain class annotations are checked (typing generics, strings, etc. are skipped)
+    sig = signature(func)
+    arg_names = tuple(sig.parameters)
+    arg_types = {
+        arg_key: param.annotation
+        for arg_key, param in sig.parameters.items()
+        if param.annotation is not param.empty and param.annotation.__class__ is type
+    }
+
+    if not arg_types:
+        # nothing to check, avoid paying for the wrapper call
+        return func
+
+    def raise_type_error(arg_key, arg_val):
+        raise TypeError(
+            '{}(..., {}: {}) got unexpected {} argument {}={}'.format(
+                func.__name__,
+                arg_key,
+                arg_types[arg_key].__name__,
+                type(arg_val).__name__,
+                arg_key,
+                str(arg_val)[:64],
+            )
+        )
+
     @wraps(func)
     def typechecked_function(*args, **kwargs):
-        sig = signature(func)
-
-        def check_argument_type(arg_key, arg_val):
-            try:
-                annotation = sig.parameters[arg_key].annotation
-            except KeyError:
-                annotation = None
-
-            if annotation is not None and annotation.__class__ is type:
-                if not isinstance(arg_val, annotation):
-                    raise TypeError(
-                        '{}(..., {}: {}) got unexpected {} argument {}={}'.format(
-                            func.__name__,
-                            arg_key,
-                            annotation.__name__,
-                            type(arg_val).__name__,
-                            arg_key,
-                            str(arg_val)[:64],
-                        )
-                    )
-
         # check args
-        for arg_val, arg_key in zip(args, sig.parameters):
-            check_argument_type(arg_key, arg_val)
+        for arg_key, arg_val in zip(arg_names, args):
+            annotation = arg_types.get(arg_key)
+            if annotation is not None and not isinstance(arg_val, annotation):
+                raise_type_error(arg_key, arg_val)
 
         # check kwargs
         for arg_key, arg_val in kwargs.items():
-            check_argument_type(arg_key, arg_val)
+            annotation = arg_types.get(arg_key)
+            if annotation is not None and not isinstance(arg_val, annotation):
+                raise_type_error(arg_key, arg_val)
 
         return func(*args, **kwargs)
 
@@ -46,10 +46,12 @@ INSTALL_REQUIRES = [
     "croniter>=0.3.34",
     "w3lib>=1.22.0",
     "ipython>5.0.0",
+    "gunicorn>=20.0.4",
 ]
 EXTRAS_REQUIRE = {
     'sonic': [
-        "sonic-client>=0.0.5",
+        # search/backends/sonic.py pipelines commands using SonicConnection's internals
+        "sonic-client>=1.0.0,<1.1",
     ],
     'dev': [
         "setuptools",
@@ -1,5 +1,8 @@
 import os
+import json
+import tempfile
 import subprocess
+from pathlib import Path
 
 import pytest
 
@@ -26,3 +29,27 @@ def disable_extractors_dict():
         "SAVE_ARCHIVE_DOT_ORG": "false"
     })
     return env
+
+# prepended to the scripts run by run_shell_script(), they pass their results back with emit()
+# through a file, so that anything else archivebox or django print doesn't get in the way
+SHELL_SCRIPT_HEADER = '''
+def emit(value):
+    import os, json
+    with open(os.environ["ARCHIVEBOX_TEST_OUTPUT"], "w", encoding="utf-8") as f:
+        json.dump(value, f)
+'''
+
+def run_shell_script(script: str, env: dict=None):
+    """run a python script with django set up (via archivebox manage shell), returns the value it emit()s"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        script_path, output_path = Path(tmp_dir) / "script.py", Path(tmp_dir) / "output.json"
+        script_path.write_text(SHELL_SCRIPT_HEADER + script, encoding="utf-8")
+        # exec'd with its own globals, shell -c alone runs it in a function scope where its own functions can't see its imports
+        command = f'exec(compile(open({str(script_path)!r}).read(), {str(script_path)!r}, "exec"), {{"__name__": "__main__"}})'
+        shell_process = subprocess.run(
+            ["archivebox", "manage", "shell", "-c", command],
+            capture_output=True,
+            env={**(env or os.environ), "ARCHIVEBOX_TEST_OUTPUT": str(output_path)},
+        )
+        assert output_path.exists(), shell_process.stderr.decode("utf-8")
+        return json.loads(output_path.read_text(encoding="utf-8"))
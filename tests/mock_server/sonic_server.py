@@ -0,0 +1,177 @@
+"""
+A minimal in-memory stand-in for the Sonic search server, speaking enough of its protocol
+(START, PING, PUSH, QUERY, FLUSHO, COUNT, QUIT) for the sonic search backend to be tested
+and benchmarked without a real sonic binary.
+
+    python tests/mock_server/sonic_server.py [--port 1491] [--password SecretPassword]
+"""
+
+import re
+import socket
+import socketserver
+import threading
+
+from collections import Counter, defaultdict
+
+BUFFER_SIZE = 20000
+PUSH_RE = re.compile(r'^(\S+) (\S+) (\S+) "(.*)"(?: LANG\(\w+\))?$')
+QUERY_RE = re.compile(r'^(\S+) (\S+) "(.*)"((?: (?:LIMIT|OFFSET|LANG)\(\w+\))*)$')
+WORD_RE = re.compile(r'\w+')
+
+
+class SonicState:
+    def __init__(self, password: str):
+        self.password = password
+        self.lock = threading.Lock()
+        self.objects = defaultdict(dict)     # (collection, bucket) -> {object: Counter of words}
+        self.num_connections = 0
+        self.commands = Counter()
+        self.pushed_words = Counter()        # every word exactly as it was received, to check for split words
+        self.query_id = 0
+        self.connections = set()
+        self.drop_at_push = None             # close the connection instead of answering the nth PUSH, like sonic dying mid-pipeline
+
+
+class SonicHandler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def send(self, line: str):
+        self.wfile.write(f'{line}\r\n'.encode('utf-8'))
+
+    def handle(self):
+        state = self.server.state
+        with state.lock:
+            state.num_connections += 1
+            state.connections.add(self.connection)
+        try:
+            self.handle_commands()
+        finally:
+            with state.lock:
+                state.connections.discard(self.connection)
+
+    def handle_commands(self):
+        state = self.server.state
+        self.send('CONNECTED <sonic-server v1.3.0>')
+
+        channel = None
+        while True:
+            raw_line = self.rfile.readline()
+            if not raw_line:
+                return
+            if len(raw_line) > BUFFER_SIZE:
+                self.send('ERR buffer_overflow')
+                continue
+
+            cmd, _, args = raw_line.decode('utf-8').strip().partition(' ')
+            with state.lock:
+                state.commands[cmd] += 1
+
+            if cmd == 'START':
+                mode, _, password = args.partition(' ')
+                if password != state.password:
+                    self.send('ENDED authentication_failed')
+                    return
+                channel = mode
+                self.send(f'STARTED {mode} protocol(1) buffer({BUFFER_SIZE})')
+            elif cmd == 'QUIT':
+                self.send('ENDED quit')
+                return
+            elif channel is None:
+                self.send('ERR not_started')
+            elif cmd == 'PING':
+                self.send('PONG')
+            elif cmd == 'PUSH' and channel == 'ingest':
+                with state.lock:
+                    drop = state.commands['PUSH'] == state.drop_at_push
+                if drop:
+                    return
+                self.send(self.push(args))
+            elif cmd == 'FLUSHO' and channel == 'ingest':
+                collection, bucket, obj = args.split(' ')
+                with state.lock:
+                    removed = state.objects[(collection, bucket)].pop(obj, None)
+                self.send(f'RESULT {len(removed) if removed else 0}')
+            elif cmd == 'COUNT' and channel == 'ingest':
+                collection, bucket = args.split(' ')[:2]
+                self.send(f'RESULT {len(state.objects[(collection, bucket)])}')
+            elif cmd == 'QUERY' and channel == 'search':
+                for line in self.query(args):
+                    self.send(line)
+            else:
+                self.send('ERR unknown_command')
+
+    def push(self, args: str) -> str:
+        state = self.server.state
+        match = PUSH_RE.match(args)
+        if not match:
+            return 'ERR invalid_format(PUSH <collection> <bucket> <object> "<text>")'
+        collection, bucket, obj, text = match.groups()
+        text = text.replace('\\"', '"')
+        with state.lock:
+            state.pushed_words.update(text.split())
+            words = state.objects[(collection, bucket)].setdefault(obj, Counter())
+            words.update(WORD_RE.findall(text.lower()))
+        return 'OK'
+
+    def query(self, args: str):
+        state = self.server.state
+        match = QUERY_RE.match(args)
+        if not match:
+            return ['ERR invalid_format(QUERY <collection> <bucket> "<terms>")']
+        collection, bucket, terms, options = match.groups()
+        options = dict(re.findall(r'(\w+)\((\w+)\)', options))
+        limit, offset = int(options.get('LIMIT', 10)), int(options.get('OFFSET', 0))
+
+        terms = WORD_RE.findall(terms.replace('\\"', '"').lower())
+        with state.lock:
+            state.query_id += 1
+            query_id = f'Q{state.query_id}'
+            matches = [
+                (sum(words[term] for term in terms), obj)
+                for obj, words in state.objects[(collection, bucket)].items()
+                if terms and all(term in words for term in terms)
+            ]
+        results = [obj for _, obj in sorted(matches, key=lambda match: -match[0])][offset:offset + limit]
+        return [f'PENDING {query_id}', ' '.join(['EVENT', 'QUERY', query_id, *results])]
+
+
+class SonicServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str='127.0.0.1', port: int=0, password: str='SecretPassword'):
+        super().__init__((host, port), SonicHandler)
+        self.state = SonicState(password)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def drop_connections(self):
+        """close every open connection, like sonic being restarted"""
+        with self.state.lock:
+            connections = list(self.state.connections)
+        for connection in connections:
+            connection.shutdown(socket.SHUT_RDWR)
+
+
+def start_in_thread(**kwargs) -> SonicServer:
+    server = SonicServer(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Run an in-memory stand-in for the Sonic search server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1491)
+    parser.add_argument('--password', default='SecretPassword')
+    args = parser.parse_args()
+
+    server = SonicServer(host=args.host, port=args.port, password=args.password)
+    print(f'Fake sonic server listening on {args.host}:{server.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(dict(connections=server.state.num_connections, **server.state.commands))
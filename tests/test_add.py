@@ -91,3 +91,103 @@ def test_extract_input_uses_only_passed_extractors(tmp_path, process):
 
     assert (archived_item_path / "warc").exists()
     assert not (archived_item_path / "singlefile.html").exists()
+
+def test_add_logs_sql_writer_stats(tmp_path, process, disable_extractors_dict):
+    subprocess.run(
+        ["archivebox", "add", "--depth=0", "http://127.0.0.1:8080/static/example.com.html"],
+        capture_output=True,
+        env=disable_extractors_dict,
+    )
+    error_log = tmp_path / "logs" / "errors.log"
+    assert not error_log.exists() or "sql_writer writes=" not in error_log.read_text()
+
+    subprocess.run(
+        ["archivebox", "add", "--depth=1", "http://127.0.0.1:8080/static/example.com.html"],
+        capture_output=True,
+        env={**disable_extractors_dict, "DEBUG": "true"},
+    )
+
+    conn = sqlite3.connect("index.sqlite3")
+    c = conn.cursor()
+    num_snapshots = c.execute("SELECT COUNT(*) from core_snapshot").fetchone()[0]
+    conn.close()
+    assert num_snapshots > 1
+
+    error_log = error_log.read_text()
+    assert "sql_writer writes=" in error_log
+    assert "failed=0" in error_log
+
+WRITER_EXIT_SCRIPT = '''
+from core.models import Tag
+from archivebox.index.sql import sql_writer
+
+def exiting_write():
+    Tag.objects.create(name="rolled back", slug="rolled-back")
+    raise SystemExit(1)
+
+try:
+    sql_writer.submit(exiting_write).result(timeout=10)
+    exit_code = None
+except SystemExit as err:
+    exit_code = err.code
+sql_writer.submit(lambda: Tag.objects.create(name="saved", slug="saved")).result(timeout=10)
+emit([exit_code, list(Tag.objects.values_list("name", flat=True)), sql_writer.thread.is_alive()])
+'''
+
+def test_sql_writer_survives_writes_that_exit(process):
+    # the SystemExit is raised in the caller, and the writer thread keeps committing the writes after it
+    assert run_shell_script(WRITER_EXIT_SCRIPT) == [1, ["saved"], True]
+
+def test_add_updates_snapshot_search_index(tmp_path, process, disable_extractors_dict):
+    subprocess.run(["archivebox", "add", "--tag=searchtag", "http://127.0.0.1:8080/static/example.com.html", "--depth=0"],
+                                  capture_output=True, env=disable_extractors_dict)
+
+    conn = sqlite3.connect("index.sqlite3")
+    c = conn.cursor()
+    url_matches = c.execute("SELECT url FROM core_snapshot_fts WHERE core_snapshot_fts MATCH '\"static/example\"'").fetchall()
+    tag_matches = c.execute("SELECT url FROM core_snapshot_fts WHERE core_snapshot_fts MATCH 'tags:\"searchtag\"'").fetchall()
+    conn.close()
+
+    assert url_matches == [("http://127.0.0.1:8080/static/example.com.html",)]
+    assert tag_matches == [("http://127.0.0.1:8080/static/example.com.html",)]
+
+
+def test_add_bulk_tags_snapshots(tmp_path, process, disable_extractors_dict):
+    subprocess.run(["archivebox", "add", "--tag=zebra,apple", "--depth=1", "http://127.0.0.1:8080/static/example.com.html"],
+                                  capture_output=True, env=disable_extractors_dict)
+    subprocess.run(["archivebox", "manage", "shell", "-c", "from core.models import Tag; Tag.objects.filter(name='zebra').update(name='banana')"],
+                                  capture_output=True, env=disable_extractors_dict)
+
+    conn = sqlite3.connect("index.sqlite3")
+    c = conn.cursor()
+    tag_names = {row[0] for row in c.execute("SELECT tag_names FROM core_snapshot").fetchall()}
+    num_snapshots = c.execute("SELECT count(*) FROM core_snapshot").fetchone()[0]
+    num_tagged = c.execute("SELECT count(*) FROM core_snapshot_tags").fetchone()[0]
+    conn.close()
+
+    assert num_snapshots > 1
+    assert num_tagged == num_snapshots * 2
+    assert tag_names == {"apple,banana"}
+
+
+CACHED_ICONS_SCRIPT = '''
+from django.core.cache import cache
+from core.models import Snapshot
+
+emit({
+    snapshot.url: cache.get("%s-%s-snapshot-icons" % (snapshot.id, snapshot.updated.timestamp())) is not None
+    for snapshot in Snapshot.objects.all()
+})
+'''
+
+def test_add_prewarms_snapshot_cache(tmp_path, process, disable_extractors_dict):
+    subprocess.run(["archivebox", "add", "http://127.0.0.1:8080/static/example.com.html", "--depth=0"],
+                                  capture_output=True, env=disable_extractors_dict)
+    subprocess.run(["archivebox", "add", "--tag=prewarmed", "http://127.0.0.1:8080/static/iana.org.html", "--depth=0"],
+                                  capture_output=True, env=disable_extractors_dict)
+
+    # cached under the final Snapshot.updated, after the last save and the tagging bumped it
+    assert run_shell_script(CACHED_ICONS_SCRIPT) == {
+        "http://127.0.0.1:8080/static/example.com.html": True,
+        "http://127.0.0.1:8080/static/iana.org.html": True,
+    }
@@ -0,0 +1,107 @@
+import subprocess
+
+from .fixtures import *
+
+COUNT_QUERIES_SCRIPT = '''
+from django.test import Client
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+
+user = User.objects.filter(username="admin").first() or User.objects.create_superuser("admin", "", "admin")
+client = Client()
+client.force_login(user)
+num_queries = {}
+for url in ("/admin/core/snapshot/", "/admin/core/snapshot/grid/", "/admin/core/archiveresult/", "/public/"):
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url, HTTP_HOST="localhost")
+    assert response.status_code == 200, (url, response.status_code)
+    num_queries[url] = len(queries.captured_queries)
+emit(num_queries)
+'''
+
+def count_page_queries():
+    return run_shell_script(COUNT_QUERIES_SCRIPT)
+
+
+def test_changelist_queries_dont_grow_with_number_of_snapshots(process, disable_extractors_dict):
+    subprocess.run(["archivebox", "add", "--depth=0", "http://127.0.0.1:8080/static/example.com.html"],
+                   capture_output=True, env=disable_extractors_dict)
+    queries_for_one = count_page_queries()
+
+    for url in ("http://127.0.0.1:8080/static/iana.org.html", "http://127.0.0.1:8080/static/title_with_html.com.html"):
+        subprocess.run(["archivebox", "add", "--depth=0", url], capture_output=True, env=disable_extractors_dict)
+    queries_for_three = count_page_queries()
+
+    assert len(queries_for_one) == 4
+    assert queries_for_three == queries_for_one
+
+
+PAGINATION_SCRIPT = '''
+import re
+from datetime import datetime, timedelta, timezone
+from django.test import Client
+from django.test.utils import setup_test_environment
+from django.contrib.auth.models import User
+from core.models import Snapshot
+
+# 23 snapshots, added in pairs at the same time so that the pk has to break the ties
+start = datetime(2021, 1, 1, tzinfo=timezone.utc)
+for i in range(23):
+    snapshot = Snapshot.objects.create(url="http://example.com/%s" % i, timestamp=str(1000 + i))
+    Snapshot.objects.filter(pk=snapshot.pk).update(added=start + timedelta(minutes=i // 2))
+expected = [str(pk) for pk in Snapshot.objects.order_by("-added", "-pk").values_list("pk", flat=True)]
+
+setup_test_environment()    # so that the responses come with their template context
+client = Client(HTTP_HOST="localhost")
+client.force_login(User.objects.create_superuser("admin", "admin@example.com", "admin"))
+
+def walk_public(url, link_name):
+    pages = []
+    while url:
+        response = client.get(url)
+        page = response.context["page_obj"]
+        pages.append([page.number, [str(snapshot.pk) for snapshot in page.object_list]])
+        link = re.search(r'href="([^"]*)">%s' % link_name, response.content.decode())
+        url = link and link.group(1)
+    return pages
+
+def walk_admin(url, step):
+    pages = []
+    while url:
+        cl = client.get(url).context["cl"]
+        pages.append([cl.page_num, [str(snapshot.pk) for snapshot in cl.result_list]])
+        page_num = cl.page_num + step
+        url = "/admin/core/snapshot/" + cl.get_query_string({"p": page_num}) if 0 <= page_num < cl.paginator.num_pages else None
+    return pages
+
+public_page_2 = client.get("/public/?page=2").context["page_obj"]
+emit({
+    "expected": expected,
+    "public_forwards": walk_public("/public/", "next"),
+    "public_backwards": walk_public("/public/?page=last", "previous"),
+    "public_offset": [str(snapshot.pk) for snapshot in public_page_2.object_list],
+    "public_bad_cursor": [str(snapshot.pk) for snapshot in client.get("/public/?page=2&after=notanid").context["page_obj"].object_list],
+    "admin_forwards": walk_admin("/admin/core/snapshot/", 1),
+    "admin_backwards": walk_admin("/admin/core/snapshot/?p=4", -1),
+    "count_before": public_page_2.paginator.count,
+    "count_after": Snapshot.objects.create(url="http://example.com/new", timestamp="2000") and client.get("/public/").context["page_obj"].paginator.count,
+})
+'''
+
+def test_keyset_pagination_walks_every_page(process, disable_extractors_dict):
+    output = run_shell_script(PAGINATION_SCRIPT, env={**disable_extractors_dict, "SNAPSHOTS_PER_PAGE": "5"})
+    expected = output["expected"]
+    pages = [expected[i:i + 5] for i in range(0, 23, 5)]
+
+    assert output["public_forwards"] == [[number, page] for number, page in enumerate(pages, 1)]
+    assert output["public_backwards"] == [[number, page] for number, page in reversed(list(enumerate(pages, 1)))]
+    assert output["public_offset"] == pages[1]
+    assert output["public_bad_cursor"] == pages[1]
+
+    assert output["admin_forwards"] == [[number, page] for number, page in enumerate(pages)]
+    assert output["admin_backwards"] == [[number, page] for number, page in reversed(list(enumerate(pages)))]
+
+    # the cached count is invalidated as soon as a snapshot is added
+    assert output["count_before"] == 23
+    assert output["count_after"] == 24
@@ -0,0 +1,88 @@
+from .fixtures import *
+
+API_SCRIPT = '''
+import json
+import time
+from django.test import Client
+from django.contrib.auth.models import User
+from core.models import APIToken
+
+user = User.objects.create_superuser("admin", "admin@example.com", "admin")
+client = Client(HTTP_AUTHORIZATION="Bearer " + APIToken.objects.create(user=user).token, HTTP_HOST="localhost")
+output = {"unauthorized": Client().get("/api/v1/core/snapshot/", HTTP_HOST="localhost").status_code}
+
+added = client.post("/api/v1/core/snapshot/", json.dumps({
+    "urls": ["http://127.0.0.1:8080/static/example.com.html", "http://127.0.0.1:8080/static/iana.org.html"],
+    "tags": ["api"],
+}), content_type="application/json")
+output["add_status"] = added.status_code
+
+task_url = "/api/v1/core/task/%s/" % added.json()["task"]["id"]
+started = time.monotonic()
+while not client.get(task_url).json()["is_finished"] and time.monotonic() - started < 60:
+    time.sleep(0.5)
+output["task"] = client.get(task_url).json()
+
+first_page = client.get("/api/v1/core/snapshot/?fields=id,url,tags&limit=1").json()
+second_page = client.get("/api/v1/core/snapshot/?fields=id,url,tags&limit=1&after=" + first_page["next"]).json()
+output["pages"] = [first_page, second_page]
+
+snapshot_ids = [row["id"] for row in first_page["results"] + second_page["results"]]
+output["tagged"] = client.post("/api/v1/core/tag/", json.dumps({
+    "snapshot_ids": snapshot_ids, "add": ["bulk"], "remove": ["api"],
+}), content_type="application/json").json()
+output["tags"] = client.get("/api/v1/core/tag/?fields=name,num_snapshots").json()["results"]
+output["bad_field"] = client.get("/api/v1/core/snapshot/?fields=nope").status_code
+emit(output)
+'''
+
+def test_api_bulk_add_list_and_tag(process, disable_extractors_dict):
+    env = {**disable_extractors_dict, "USE_SEARCHING_BACKEND": "false"}
+    output = run_shell_script(API_SCRIPT, env=env)
+
+    assert output["unauthorized"] == 401
+    assert output["add_status"] == 202
+    assert output["task"]["status"] == "succeeded"
+
+    first_page, second_page = output["pages"]
+    assert len(first_page["results"]) == len(second_page["results"]) == 1
+    assert first_page["results"][0]["tags"] == ["api"]
+    assert second_page["next"] is None
+    urls = {row["url"] for row in first_page["results"] + second_page["results"]}
+    assert urls == {"http://127.0.0.1:8080/static/example.com.html", "http://127.0.0.1:8080/static/iana.org.html"}
+
+    assert output["tagged"] == {"added": 2, "removed": 2}
+    assert {"name": "bulk", "num_snapshots": 2} in output["tags"]
+    assert {"name": "api", "num_snapshots": 0} in output["tags"]
+    assert output["bad_field"] == 400
+
+
+FAILED_TAG_UPDATE_SCRIPT = '''
+import json
+from django.test import Client
+from django.contrib.auth.models import User
+from core.models import APIToken, Snapshot
+from archivebox.index import sql
+
+snapshot = Snapshot.objects.create(url="http://example.com", timestamp="1000")
+sql.set_snapshot_tags(snapshot.id, ["old"])
+
+def failing_add(*args, **kwargs):
+    raise RuntimeError("adding the tags failed")
+sql.add_tag_ids_to_snapshots = failing_add
+
+user = User.objects.create_superuser("admin", "admin@example.com", "admin")
+client = Client(HTTP_AUTHORIZATION="Bearer " + APIToken.objects.create(user=user).token, HTTP_HOST="localhost",
+                raise_request_exception=False)
+response = client.post("/api/v1/core/tag/", json.dumps({
+    "snapshot_ids": [str(snapshot.id)], "add": ["new"], "remove": ["old"],
+}), content_type="application/json")
+emit([response.status_code, list(snapshot.tags.values_list("name", flat=True))])
+'''
+
+def test_api_tag_update_is_all_or_nothing(process):
+    status_code, tags = run_shell_script(FAILED_TAG_UPDATE_SCRIPT)
+
+    # the add failed, so the removal in the same request was rolled back with it
+    assert status_code == 500
+    assert tags == ["old"]
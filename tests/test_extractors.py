@@ -1,5 +1,6 @@
 from .fixtures import *
 import json as pyjson
+import sqlite3
 from archivebox.extractors import ignore_methods, get_default_archive_methods, should_save_title
 
 def test_wget_broken_pipe(tmp_path, process, disable_extractors_dict):
@@ -113,3 +114,18 @@ def test_headers_400_plus(tmp_path, process, disable_extractors_dict):
     with open(output_file, 'r', encoding='utf-8') as f:
         headers = pyjson.load(f)
     assert headers["Status-Code"] == "200"
+
+def test_headers_summary_saved_on_snapshot(tmp_path, process, disable_extractors_dict):
+    disable_extractors_dict.update({"SAVE_HEADERS": "true"})
+    add_process = subprocess.run(['archivebox', 'add', 'http://127.0.0.1:8080/static/headers/example.com.html'],
+                                  capture_output=True, env=disable_extractors_dict)
+    conn = sqlite3.connect("index.sqlite3")
+    c = conn.cursor()
+    num_outputs, archive_size, headers, status_code = c.execute(
+        "SELECT num_outputs, archive_size, headers, status_code from core_snapshot"
+    ).fetchone()
+    conn.close()
+    assert num_outputs == 2   # title, headers
+    assert archive_size > 0
+    assert pyjson.loads(headers)['Content-Language'] == 'en'
+    assert status_code == 200
@@ -168,6 +168,13 @@ def test_tags_migration(tmp_path, disable_extractors_dict):
         JOIN core_tag on core_tag.id=core_snapshot_tags.tag_id
     """)
     tags = c.fetchall()
+    c.execute("SELECT id, tag_names from core_snapshot")
+    tag_names = {sn['id']: sn['tag_names'] for sn in c.fetchall()}
+    # the search index is rebuilt after the migrations that rebuilt core_snapshot, so its rowids still line up
+    num_fts_synced = c.execute("""
+        SELECT count(*) from core_snapshot
+        JOIN core_snapshot_fts on core_snapshot_fts.rowid=core_snapshot.rowid AND core_snapshot_fts.snapshot_id=core_snapshot.id
+    """).fetchone()[0]
     conn.commit()
     conn.close()
 
@@ -176,3 +183,9 @@ def test_tags_migration(tmp_path, disable_extractors_dict):
         tag_name = tag["name"]
         # Check each tag migrated is in the previous field
         assert tag_name in snapshots_dict[snapshot_id]
+
+    assert num_fts_synced == len(snapshots_dict)
+
+    # and the denormalized tag names got filled in for the existing snapshots
+    for snapshot_id, names in tag_names.items():
+        assert names == ','.join(sorted(tag["name"] for tag in tags if tag["id"] == snapshot_id))
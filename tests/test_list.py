@@ -1,4 +1,6 @@
+import re
 import json
+import sqlite3
 
 from .fixtures import *
 
@@ -65,3 +67,58 @@ def test_link_sort_by_url(process, disable_extractors_dict):
     list_process = subprocess.run(["archivebox", "list", "--sort=url"], capture_output=True)
     link_list = list_process.stdout.decode("utf-8").split("\n")
     assert "http://127.0.0.1:8080/static/example.com.html" in link_list[0]
+
+def test_list_domain_filter(process, disable_extractors_dict):
+    subprocess.run(["archivebox", "add", "http://127.0.0.1:8080/static/example.com.html", "--depth=0"],
+                                  capture_output=True, env=disable_extractors_dict)
+
+    conn = sqlite3.connect("index.sqlite3")
+    c = conn.cursor()
+    domain, base_url = c.execute("SELECT domain, base_url from core_snapshot").fetchone()
+    conn.close()
+    assert domain == "127.0.0.1:8080"
+    assert base_url == "127.0.0.1:8080/static/example.com.html"
+
+    list_process = subprocess.run(["archivebox", "list", "--filter-type=domain", "127.0.0.1"], capture_output=True)
+    assert "http://127.0.0.1:8080/static/example.com.html" in list_process.stdout.decode("utf-8")
+
+    list_process = subprocess.run(["archivebox", "list", "--filter-type=domain", "127.0.0.10"], capture_output=True)
+    assert "http://127.0.0.1:8080/static/example.com.html" not in list_process.stdout.decode("utf-8")
+
+def test_list_json_headers_counts_streamed_links(process, disable_extractors_dict):
+    subprocess.run(["archivebox", "add", "http://127.0.0.1:8080/static/example.com.html", "--depth=1"],
+                                  capture_output=True, env=disable_extractors_dict)
+    list_process = subprocess.run(["archivebox", "list", "--json", "--with-headers"], capture_output=True)
+    output_json = json.loads(list_process.stdout.decode("utf-8"))
+    assert output_json["num_links"] == len(output_json["links"]) > 1
+
+def test_list_html_streams_custom_templates(tmp_path, process, disable_extractors_dict):
+    templates_dir = tmp_path / "custom_templates"
+    templates_dir.mkdir()
+    (templates_dir / "page.html").write_text("<main>{% block body %}{% endblock %}</main>")
+    (templates_dir / "rows.html").write_text("<ul>{% for link in links %}<li>{{ link.url }}</li>{% endfor %}</ul>")
+    # the loop nested in a block and an if, under another name, using forloop and empty
+    (templates_dir / "static_index.html").write_text(
+        '{% extends "page.html" %}{% block body %}{% if version %}<ol>'
+        '{% for snapshot in links %}<li>{{ forloop.counter }} {{ forloop.first }} {{ forloop.last }} {{ snapshot.url }}</li>'
+        '{% empty %}<li>no snapshots</li>{% endfor %}'
+        '</ol>{% endif %}{% endblock %}'
+    )
+    # the loop is in the parent template, so it's rendered all at once instead
+    (templates_dir / "minimal_index.html").write_text('{% extends "rows.html" %}')
+
+    env = {**disable_extractors_dict, "CUSTOM_TEMPLATES_DIR": str(templates_dir)}
+    urls = [f"http://127.0.0.1:8080/static/example.com.html#{i}" for i in range(3)]
+    subprocess.run(["archivebox", "add", "--depth=0"], input="\n".join(urls).encode(), capture_output=True, env=env)
+
+    with_headers = subprocess.run(["archivebox", "list", "--html", "--with-headers"], capture_output=True, env=env).stdout.decode()
+    rows = re.findall(r"<li>(\d) (\w+) (\w+) (\S+)</li>", with_headers)
+    assert with_headers.startswith("<main><ol>") and with_headers.strip().endswith("</ol></main>")
+    assert [row[:3] for row in rows] == [("1", "True", "False"), ("2", "False", "False"), ("3", "False", "True")]
+    assert sorted(row[3] for row in rows) == urls
+
+    without_headers = subprocess.run(["archivebox", "list", "--html"], capture_output=True, env=env).stdout.decode()
+    assert sorted(re.findall(r"<li>([^<]+)</li>", without_headers)) == urls
+
+    empty = subprocess.run(["archivebox", "list", "--html", "--with-headers", "http://nothing.example.com"], capture_output=True, env=env).stdout.decode()
+    assert "<li>no snapshots</li>" in empty
@@ -0,0 +1,270 @@
+import socket
+import sqlite3
+import subprocess
+
+from .fixtures import *
+from .mock_server.sonic_server import start_in_thread
+
+def test_sqlite_fts_search_backend(tmp_path, process, disable_extractors_dict):
+    env = {**disable_extractors_dict, "USE_WGET": "true", "SEARCH_BACKEND_ENGINE": "sqlite_fts"}
+    subprocess.run(["archivebox", "add", "http://127.0.0.1:8080/static/example.com.html", "--depth=0"], capture_output=True, env=env)
+
+    conn = sqlite3.connect("search.sqlite3")
+    num_indexed = conn.execute("SELECT count(*) FROM snapshot_texts").fetchone()[0]
+    conn.close()
+    assert num_indexed == 1
+
+    found = subprocess.run(["archivebox", "list", "--filter-type=search", "illustrative examples"], capture_output=True, env=env)
+    not_found = subprocess.run(["archivebox", "list", "--filter-type=search", "zzznotinthepage"], capture_output=True, env=env)
+    assert "http://127.0.0.1:8080/static/example.com.html" in found.stdout.decode("utf-8")
+    assert "http://127.0.0.1:8080/static/example.com.html" not in not_found.stdout.decode("utf-8")
+
+    # re-indexing the same text is a no-op
+    conn = sqlite3.connect("search.sqlite3")
+    indexed_at = conn.execute("SELECT indexed_at FROM snapshot_texts").fetchone()[0]
+    subprocess.run(["archivebox", "update", "--index-only"], capture_output=True, env=env)
+    assert conn.execute("SELECT indexed_at FROM snapshot_texts").fetchall() == [(indexed_at,)]
+    conn.close()
+
+    subprocess.run(["archivebox", "remove", "--yes", "--delete", "http://127.0.0.1:8080/static/example.com.html"], capture_output=True, env=env)
+    conn = sqlite3.connect("search.sqlite3")
+    num_indexed = conn.execute("SELECT count(*) FROM snapshot_texts").fetchone()[0]
+    conn.close()
+    assert num_indexed == 0
+
+def test_search_text_written_after_extraction(tmp_path, process, disable_extractors_dict):
+    env = {**disable_extractors_dict, "USE_WGET": "true", "USE_INDEXING_BACKEND": "false"}
+    subprocess.run(["archivebox", "add", "http://127.0.0.1:8080/static/example.com.html", "--depth=0"], capture_output=True, env=env)
+
+    search_text_path = list(tmp_path.glob("archive/*/search.txt"))[0]
+    search_text = search_text_path.read_text()
+    assert "This domain is for use in illustrative examples in documents." in search_text
+    assert "<" not in search_text
+    assert "font-family" not in search_text
+
+    # update --index-only regenerates it from the existing outputs
+    search_text_path.unlink()
+    subprocess.run(["archivebox", "update", "--index-only"], capture_output=True, env=env)
+    assert search_text_path.read_text() == search_text
+
+RANKED_SEARCH_SCRIPT = '''
+from django.test import Client
+from django.test.utils import setup_test_environment
+from django.contrib.auth.models import User
+from core.models import Snapshot
+from search.backends import sqlite_fts
+
+for i in range(10):
+    snapshot = Snapshot.objects.create(url="http://example.com/%s" % i, timestamp=str(1000 + i), title="page %s" % i)
+    sqlite_fts.index(str(snapshot.id), ["banana " * i + "filler words " * 50])
+Snapshot.objects.filter(title="page 0").update(title="banana in the title")
+
+User.objects.create_superuser("admin", "admin@example.com", "admin")
+setup_test_environment()    # so that the responses come with their template context
+client = Client()
+client.login(username="admin", password="admin")
+public = client.get("/public/?q=banana", HTTP_HOST="localhost").context["object_list"]
+admin = client.get("/admin/core/snapshot/?q=banana", HTTP_HOST="localhost").context["cl"].result_list
+emit({
+    "first_page": sqlite_fts.search("banana", limit=3),
+    "second_page": sqlite_fts.search("banana", limit=3, offset=3),
+    "ids": {str(snapshot.id): snapshot.title for snapshot in Snapshot.objects.all()},
+    "public": [snapshot.title for snapshot in public],
+    "admin": [snapshot.title for snapshot in admin],
+})
+'''
+
+@pytest.mark.parametrize("json1", [True, False])
+def test_search_results_are_ranked(process, disable_extractors_dict, json1):
+    env = {**disable_extractors_dict, "SEARCH_BACKEND_ENGINE": "sqlite_fts"}
+    # without JSON1 the ranked ids get inlined into the sql instead of passed to json_each()
+    script = "from archivebox.index import sql\nsql._json1_available = %s\n" % json1 + RANKED_SEARCH_SCRIPT
+    output = run_shell_script(script, env=env)
+
+    titles = [output["ids"][snapshot_id] for snapshot_id in output["first_page"] + output["second_page"]]
+    assert titles == ["page 9", "page 8", "page 7", "page 6", "page 5", "page 4"]
+    # best full-text matches first, then the ones only matching on the title
+    expected = ["page %s" % i for i in range(9, 0, -1)] + ["banana in the title"]
+    assert output["public"] == expected
+    assert output["admin"] == expected
+
+RANKED_PAGINATION_SCRIPT = '''
+import re
+from django.test import Client
+from django.test.utils import setup_test_environment
+from django.contrib.auth.models import User
+from core.models import Snapshot
+from search.backends import sqlite_fts
+
+# 12 full-text hits, more than two pages of 5
+for i in range(12):
+    snapshot = Snapshot.objects.create(url="http://example.com/%s" % i, timestamp=str(1000 + i), title="page %s" % i)
+    sqlite_fts.index(str(snapshot.id), ["banana " * (i + 1)])
+
+setup_test_environment()    # so that the responses come with their template context
+client = Client(HTTP_HOST="localhost")
+client.force_login(User.objects.create_superuser("admin", "admin@example.com", "admin"))
+
+public_pages, url = [], "/public/?q=banana"
+while url:
+    response = client.get(url)
+    html = response.content.decode()
+    public_pages.append({
+        "titles": [snapshot.title for snapshot in response.context["page_obj"].object_list],
+        "shows_total": bool(re.search(r"of \\d+ total", html)) or "last &raquo;" in html,
+        "says_unknown": "isn't known" in html,
+    })
+    link = re.search(r'href="([^"]*)">next', html)
+    url = link and link.group(1)
+
+admin_pages, url = [], "/admin/core/snapshot/?q=banana"
+while url:
+    response = client.get(url)
+    cl, html = response.context["cl"], response.content.decode()
+    admin_pages.append({
+        "titles": [snapshot.title for snapshot in cl.result_list],
+        "shows_total": bool(re.search(r"\\d+ (results|snapshots)", html)),
+        "says_unknown": "isn't known" in html,
+    })
+    url = "/admin/core/snapshot/" + cl.get_query_string({"p": cl.page_num + 1}) if cl.page_num + 1 < cl.paginator.num_pages else None
+
+unranked = client.get("/public/?q=page").content.decode()
+emit({
+    "public": public_pages,
+    "admin": admin_pages,
+    "unranked_shows_total": "1-5 of 12 total" in unranked,
+})
+'''
+
+def test_ranked_search_pages_dont_claim_a_total(process, disable_extractors_dict):
+    env = {**disable_extractors_dict, "SEARCH_BACKEND_ENGINE": "sqlite_fts", "SNAPSHOTS_PER_PAGE": "5"}
+    output = run_shell_script(RANKED_PAGINATION_SCRIPT, env=env)
+
+    # every hit exactly once in rank order, with no total or last page claimed from the partial results
+    expected = ["page %s" % i for i in range(11, -1, -1)]
+    for pages in (output["public"], output["admin"]):
+        assert [page["titles"] for page in pages] == [expected[0:5], expected[5:10], expected[10:12]]
+        assert not any(page["shows_total"] for page in pages)
+        assert all(page["says_unknown"] for page in pages)
+    assert output["unranked_shows_total"]
+
+SNIPPETS_SCRIPT = '''
+from django.test import Client
+from django.contrib.auth.models import User
+from core.models import Snapshot
+from search.backends import sqlite_fts
+
+snapshot = Snapshot.objects.create(url="http://example.com/fruit", timestamp="1000", title="fruit")
+sqlite_fts.index(str(snapshot.id), ["some <script>alert(1)</script> text about a banana and other fruit"])
+Snapshot.objects.create(url="http://example.com/banana", timestamp="1001", title="banana in the title")
+
+client = Client(HTTP_HOST="localhost")
+client.force_login(User.objects.create_superuser("admin", "admin@example.com", "admin"))
+emit({
+    "public": client.get("/public/?q=banana").content.decode(),
+    "admin": client.get("/admin/core/snapshot/?q=banana").content.decode(),
+})
+'''
+
+def test_search_results_show_snippets(process, disable_extractors_dict):
+    env = {**disable_extractors_dict, "SEARCH_BACKEND_ENGINE": "sqlite_fts"}
+    output = run_shell_script(SNIPPETS_SCRIPT, env=env)
+
+    for html in (output["public"], output["admin"]):
+        # only for the full-text match, with the indexed text escaped
+        assert html.count('class="search-snippet"') == 1
+        assert "a <mark>banana</mark> and other fruit" in html
+        assert "&lt;script&gt;alert(1)&lt;/script&gt;" in html
+        assert "<script>alert(1)" not in html
+
+def test_sonic_search_backend(tmp_path, process, disable_extractors_dict):
+    sonic = start_in_thread()
+    env = {
+        **disable_extractors_dict,
+        "USE_WGET": "true",
+        "SEARCH_BACKEND_ENGINE": "sonic",
+        "SEARCH_BACKEND_HOST_NAME": "127.0.0.1",
+        "SEARCH_BACKEND_PORT": str(sonic.port),
+    }
+    try:
+        subprocess.run(["archivebox", "add", "--depth=0"], input=b"http://127.0.0.1:8080/static/example.com.html\nhttp://127.0.0.1:8080/static/title_with_html.com.html\n", capture_output=True, env=env)
+        # both snapshots are pushed over the same pooled connection, without splitting any words
+        assert sonic.state.num_connections == 1
+        assert len(sonic.state.objects[("archivebox", "snapshots")]) == 2
+        assert sonic.state.pushed_words["illustrative"] == 1
+        assert sonic.state.commands["PING"] == 1
+
+        found = subprocess.run(["archivebox", "list", "--filter-type=search", "illustrative examples"], capture_output=True, env=env)
+        assert "http://127.0.0.1:8080/static/example.com.html" in found.stdout.decode("utf-8")
+        assert "title_with_html.com.html" not in found.stdout.decode("utf-8")
+
+        subprocess.run(["archivebox", "remove", "--yes", "--delete", "http://127.0.0.1:8080/static/example.com.html"], capture_output=True, env=env)
+        assert len(sonic.state.objects[("archivebox", "snapshots")]) == 1
+        assert sonic.state.num_connections == 3
+    finally:
+        sonic.shutdown()
+        sonic.server_close()
+
+SONIC_RETRY_SCRIPT = '''
+import os, sys
+sys.path.insert(0, os.environ["SONIC_SERVER_DIR"])
+from sonic_server import start_in_thread
+from search.backends import sonic
+
+server = start_in_thread(port=int(os.environ["SEARCH_BACKEND_PORT"]))
+state = server.state
+sonic.index("snapshot-1", ["some text"])
+
+# the pooled connection was closed while idle, it's replaced before anything is sent on it
+server.drop_connections()
+sonic.index("snapshot-2", ["some more text"])
+restarted = [state.num_connections, sorted(state.objects[("archivebox", "snapshots")])]
+
+# sonic going away halfway through a pipeline of PUSHes fails it, instead of PUSHing every chunk again
+pushes_before = state.commands["PUSH"]
+state.drop_at_push = pushes_before + 70
+try:
+    sonic.index("snapshot-3", ["word " * 400000])
+    error = None
+except ConnectionError as err:
+    error = err.__class__.__name__
+mid_pipeline = [error, state.commands["PUSH"] - pushes_before, state.num_connections]
+
+sonic.index("snapshot-4", ["the last text"])
+emit({
+    "restarted": restarted,
+    "mid_pipeline": mid_pipeline,
+    "num_connections": state.num_connections,
+})
+'''
+
+def test_sonic_only_retries_before_sending(process):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = {
+        **os.environ,
+        "SEARCH_BACKEND_ENGINE": "sonic",
+        "SEARCH_BACKEND_HOST_NAME": "127.0.0.1",
+        "SEARCH_BACKEND_PORT": str(port),
+        "SONIC_SERVER_DIR": str(Path(__file__).parent / "mock_server"),
+    }
+    output = run_shell_script(SONIC_RETRY_SCRIPT, env=env)
+
+    assert output["restarted"] == [2, ["snapshot-1", "snapshot-2"]]
+    assert output["mid_pipeline"] == ["ConnectionResetError", 70, 2]
+    assert output["num_connections"] == 3
+
+CHUNK_TEXT_SCRIPT = '''
+from search.backends.sonic import chunk_text
+
+text = 'wörd "quoted" back\\\\slash\\n\\tnext ' * 500 + 'x' * 5000 + ' last'
+emit(list(chunk_text(text, 200)))
+'''
+
+def test_sonic_chunks_split_between_words(process):
+    chunks = run_shell_script(CHUNK_TEXT_SCRIPT)
+
+    assert len(chunks) > 1
+    assert all(len(chunk.encode("utf-8")) + chunk.count('"') + 2 <= 200 for chunk in chunks)
+    assert " ".join(chunks).split() == ('wörd "quoted" back slash next ' * 500 + "last").split()
@@ -0,0 +1,150 @@
+import subprocess
+
+from .fixtures import *
+
+SERVE_SCRIPT = '''
+from django.test import Client
+from core.models import Snapshot
+
+client = Client()
+url = "/archive/%s/index.json" % Snapshot.objects.get().timestamp
+full = client.get(url, HTTP_HOST="localhost")
+etag = full["ETag"]
+ranged = client.get(url, HTTP_HOST="localhost", HTTP_RANGE="bytes=2-5")
+emit({
+    "full": [full.status_code, full["Accept-Ranges"], b"".join(full.streaming_content).decode()],
+    "not_modified": client.get(url, HTTP_HOST="localhost", HTTP_IF_NONE_MATCH=etag).status_code,
+    "ranged": [ranged.status_code, ranged["Content-Range"], b"".join(ranged.streaming_content).decode()],
+    "stale_if_range": client.get(url, HTTP_HOST="localhost", HTTP_RANGE="bytes=2-5", HTTP_IF_RANGE='"old"').status_code,
+    "unsatisfiable": client.get(url, HTTP_HOST="localhost", HTTP_RANGE="bytes=100000000-").status_code,
+})
+'''
+
+def test_archive_files_support_etags_and_ranges(process, disable_extractors_dict):
+    subprocess.run(["archivebox", "add", "--depth=0", "http://127.0.0.1:8080/static/example.com.html"],
+                   capture_output=True, env=disable_extractors_dict)
+    output = run_shell_script(SERVE_SCRIPT)
+
+    status, accept_ranges, body = output["full"]
+    assert (status, accept_ranges) == (200, "bytes")
+    assert output["not_modified"] == 304
+    assert output["ranged"] == [206, f"bytes 2-5/{len(body.encode())}", body[2:6]]
+    assert output["stale_if_range"] == 200
+    assert output["unsatisfiable"] == 416
+
+
+RESOLVE_SCRIPT = '''
+from django.test import Client
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from core.models import Snapshot
+
+client = Client()
+snapshot = Snapshot.objects.get()
+with CaptureQueriesContext(connection) as queries:
+    for _ in range(20):
+        assert client.get("/archive/%s/index.json" % snapshot.timestamp, HTTP_HOST="localhost").status_code == 200
+num_queries = len(queries.captured_queries)
+
+snapshot.delete()
+emit([num_queries, client.get("/archive/%s/index.json" % snapshot.timestamp, HTTP_HOST="localhost").status_code])
+'''
+
+def test_archive_subresources_resolve_the_snapshot_once(process, disable_extractors_dict):
+    subprocess.run(["archivebox", "add", "--depth=0", "http://127.0.0.1:8080/static/example.com.html"],
+                   capture_output=True, env=disable_extractors_dict)
+    num_queries, status_after_delete = run_shell_script(RESOLVE_SCRIPT)
+
+    assert num_queries == 1
+    assert status_after_delete == 404
+
+
+DETAILS_SCRIPT = '''
+from django.test import Client
+from core.models import Snapshot
+
+response = Client().get("/archive/%s/index.html" % Snapshot.objects.get().timestamp, HTTP_HOST="localhost")
+emit([response.status_code, "<title>Example Domain</title>" in response.content.decode()])
+'''
+
+def test_snapshot_index_html_is_rendered_from_the_db(tmp_path, process, disable_extractors_dict):
+    env = {**disable_extractors_dict, "SAVE_SNAPSHOT_HTML_INDEX": "false"}
+    subprocess.run(["archivebox", "add", "--depth=0", "http://127.0.0.1:8080/static/example.com.html"],
+                   capture_output=True, env=env)
+    archived_item_path = list(tmp_path.glob('archive/**/*'))[0]
+    assert (archived_item_path / "index.json").exists()
+    assert not (archived_item_path / "index.html").exists()
+
+    assert run_shell_script(DETAILS_SCRIPT) == [200, True]
+
+
+AMBIGUOUS_PREFIX_SCRIPT = '''
+import uuid
+from core.models import Snapshot
+from core.resolver import resolve_snapshot_slug
+
+Snapshot.objects.create(id=uuid.UUID("abcdef00-0000-0000-0000-000000000001"), url="http://example.com/1", timestamp="1")
+resolved = [resolve_snapshot_slug("abcdef").url, resolve_snapshot_slug("abcdef00-0000-0000-0000-000000000001").url]
+
+# a new snapshot with the same id prefix makes the cached prefix ambiguous, but not the full id
+Snapshot.objects.create(id=uuid.UUID("abcdef00-0000-0000-0000-000000000002"), url="http://example.com/2", timestamp="2")
+try:
+    resolved.append(resolve_snapshot_slug("abcdef").url)
+except Snapshot.MultipleObjectsReturned:
+    resolved.append("ambiguous")
+Snapshot.objects.filter(id=uuid.UUID("abcdef00-0000-0000-0000-000000000001")).update(url="http://example.com/changed")
+resolved.append(resolve_snapshot_slug("abcdef00-0000-0000-0000-000000000001").url)
+emit(resolved)
+'''
+
+def test_new_snapshots_invalidate_cached_id_prefixes(process):
+    assert run_shell_script(AMBIGUOUS_PREFIX_SCRIPT) == [
+        "http://example.com/1",
+        "http://example.com/1",
+        "ambiguous",
+        # still served from the cache, the full id can't have become ambiguous
+        "http://example.com/1",
+    ]
+
+
+RESULT_CHANGES_SCRIPT = '''
+from datetime import timedelta
+from django.test import Client
+from django.utils import timezone
+from django.contrib import admin
+from core.models import Snapshot, ArchiveResult
+
+client = Client()
+snapshot = Snapshot.objects.get()
+def render():
+    updated = Snapshot.objects.get(pk=snapshot.pk).updated.isoformat()
+    return updated, client.get("/archive/%s/index.html" % snapshot.timestamp, HTTP_HOST="localhost").content.decode()
+
+pages = [render()]
+# older than any result the add made, so it shows up as the oldest archive date
+now = timezone.now() - timedelta(days=365)
+result = ArchiveResult.objects.create(snapshot=snapshot, extractor="pdf", cmd=[], pwd=".", output="output.pdf",
+                                      start_ts=now, end_ts=now, status="succeeded")
+pages.append(render())
+result.status = "failed"
+result.save()
+pages.append(render())
+result.delete()
+pages.append(render())
+ArchiveResult.objects.create(snapshot=snapshot, extractor="pdf", cmd=[], pwd=".", output="output.pdf",
+                             start_ts=now, end_ts=now, status="succeeded")
+pages.append(render())
+admin.site._registry[ArchiveResult].delete_queryset(None, ArchiveResult.objects.all())
+pages.append(render())
+emit(pages)
+'''
+
+def test_archive_result_changes_refresh_the_snapshot_details(process, disable_extractors_dict):
+    subprocess.run(["archivebox", "add", "--depth=0", "http://127.0.0.1:8080/static/example.com.html"],
+                   capture_output=True, env=disable_extractors_dict)
+    pages = run_shell_script(RESULT_CHANGES_SCRIPT)
+
+    # every create, edit and delete bumps Snapshot.updated and re-renders the cached page
+    for (updated_before, html_before), (updated_after, html_after) in zip(pages, pages[1:]):
+        assert updated_after > updated_before
+        assert html_after != html_before
@@ -0,0 +1,47 @@
+import time
+import signal
+import socket
+import subprocess
+import urllib.request
+
+from .fixtures import *
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for_url(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=5) as response:
+                return response.status, response.read().decode()
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.25)
+
+
+def test_server_with_workers_serves_and_restarts_gracefully(process):
+    port = get_free_port()
+    server = subprocess.Popen(
+        ["archivebox", "server", "--workers=2", "--threads=2", f"127.0.0.1:{port}"],
+        stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+    )
+    try:
+        assert wait_for_url(f"http://127.0.0.1:{port}/health/") == (200, "OK")
+        assert wait_for_url(f"http://127.0.0.1:{port}/static/admin/css/base.css")[0] == 200
+
+        server.send_signal(signal.SIGHUP)
+        time.sleep(1)
+        assert wait_for_url(f"http://127.0.0.1:{port}/health/") == (200, "OK")
+    finally:
+        server.terminate()
+        output = server.communicate(timeout=30)[0].decode()
+
+    assert server.returncode == 0
+    assert "Using worker: gthread" in output
+    assert "Hang up: Master" in output
+    assert output.count("Booting worker") >= 4
@@ -0,0 +1,90 @@
+# archivebox status
+
+import os
+import subprocess
+import sqlite3
+
+from .fixtures import *
+
+def test_status_counts_folders(tmp_path, process, disable_extractors_dict):
+    os.chdir(tmp_path)
+    subprocess.run(['archivebox', 'add', 'http://127.0.0.1:8080/static/example.com.html'], capture_output=True,
+                     env=disable_extractors_dict)
+    (tmp_path / "archive" / "some_random_folder").mkdir()
+
+    status_process = subprocess.run(['archivebox', 'status'], capture_output=True, env=disable_extractors_dict)
+    output = status_process.stdout.decode("utf-8")
+    assert "> indexed: 1" in output
+    assert "> present: 2" in output
+    assert "> unrecognized: 1" in output
+    assert status_process.returncode == 0
+
+def test_list_status_unrecognized(tmp_path, process, disable_extractors_dict):
+    os.chdir(tmp_path)
+    subprocess.run(['archivebox', 'add', 'http://127.0.0.1:8080/static/example.com.html'], capture_output=True,
+                     env=disable_extractors_dict)
+    (tmp_path / "archive" / "some_random_folder").mkdir()
+
+    list_process = subprocess.run(['archivebox', 'list', '--status=unrecognized'], capture_output=True)
+    output = list_process.stdout.decode("utf-8")
+    assert "some_random_folder" in output
+    assert "example.com" not in output
+
+def test_status_refreshes_changed_folders(tmp_path, process, disable_extractors_dict):
+    os.chdir(tmp_path)
+    subprocess.run(['archivebox', 'add', 'http://127.0.0.1:8080/static/example.com.html'], capture_output=True,
+                     env=disable_extractors_dict)
+    subprocess.run(['archivebox', 'status'], capture_output=True, env=disable_extractors_dict)
+
+    conn = sqlite3.connect("index.sqlite3")
+    c = conn.cursor()
+    cached_urls = c.execute("SELECT url from core_archivefolder").fetchall()
+    conn.close()
+    assert cached_urls == [('http://127.0.0.1:8080/static/example.com.html',)]
+
+    archived_item_path = list((tmp_path / "archive").iterdir())[0]
+    (archived_item_path / "index.json").unlink()
+
+    status_process = subprocess.run(['archivebox', 'status'], capture_output=True, env=disable_extractors_dict)
+    output = status_process.stdout.decode("utf-8")
+    assert "> JSON Link Details: 0 links" in output
+    assert "> corrupted: 1" in output
+
+def test_status_recount_sizes(tmp_path, process, disable_extractors_dict):
+    os.chdir(tmp_path)
+    disable_extractors_dict.update({"SAVE_HEADERS": "true"})
+    subprocess.run(['archivebox', 'add', 'http://127.0.0.1:8080/static/example.com.html'], capture_output=True,
+                     env=disable_extractors_dict)
+
+    conn = sqlite3.connect("index.sqlite3")
+    c = conn.cursor()
+    c.execute("UPDATE core_snapshot SET archive_size = 0")
+    c.execute("UPDATE core_archiveresult SET output_size = NULL")
+    conn.commit()
+
+    status_process = subprocess.run(['archivebox', 'status', '--recount'], capture_output=True, env=disable_extractors_dict)
+    assert "across 1 snapshot directories" in status_process.stdout.decode("utf-8")
+
+    archive_size = c.execute("SELECT archive_size from core_snapshot").fetchone()[0]
+    headers_size = c.execute("SELECT output_size from core_archiveresult WHERE extractor = 'headers'").fetchone()[0]
+    conn.close()
+    archived_item_path = list((tmp_path / "archive").iterdir())[0]
+    assert headers_size == (archived_item_path / "headers.json").stat().st_size
+    assert archive_size > headers_size
+
+def test_status_concurrent_scans(tmp_path, process, disable_extractors_dict):
+    os.chdir(tmp_path)
+    subprocess.run(['archivebox', 'add', '--depth=0'], input=b'http://127.0.0.1:8080/static/example.com.html\nhttp://127.0.0.1:8080/static/iana.org.html\n',
+                   capture_output=True, env=disable_extractors_dict)
+
+    # both scans find the same uncached dirs and cache them at the same time
+    scans = [subprocess.Popen(['archivebox', 'status'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=disable_extractors_dict) for _ in range(3)]
+    for scan in scans:
+        stdout, stderr = scan.communicate()
+        assert scan.returncode == 0, stderr.decode("utf-8")
+        assert "> indexed: 2" in stdout.decode("utf-8")
+
+    conn = sqlite3.connect("index.sqlite3")
+    num_cached = conn.execute("SELECT count(*) from core_archivefolder").fetchone()[0]
+    conn.close()
+    assert num_cached == 2
@@ -0,0 +1,78 @@
+import subprocess
+
+from .fixtures import *
+
+ADD_TASK_SCRIPT = '''
+import time
+from django.test import Client
+from django.contrib.auth.models import User
+from core.models import Snapshot
+
+User.objects.create_superuser("admin", "admin@example.com", "admin")
+client = Client()
+client.login(username="admin", password="admin")
+
+started = time.monotonic()
+response = client.post("/add/", {"url": "http://127.0.0.1:8080/static/example.com.html", "depth": "0", "parser": "auto", "tag": ""}, HTTP_HOST="localhost")
+request_time = time.monotonic() - started
+
+progress_url = response["Location"] + "?format=json"
+progress = client.get(progress_url, HTTP_HOST="localhost").json()
+while not progress["is_finished"] and time.monotonic() - started < 60:
+    time.sleep(0.5)
+    progress = client.get(progress_url, HTTP_HOST="localhost").json()
+
+snapshot_ids = [str(pk) for pk in Snapshot.objects.values_list("pk", flat=True)]
+update = client.post("/admin/core/snapshot/", {"action": "update_titles", "_selected_action": snapshot_ids}, HTTP_HOST="localhost")
+update_progress = client.get(update["Location"] + "?format=json", HTTP_HOST="localhost").json()
+while not update_progress["is_finished"] and time.monotonic() - started < 120:
+    time.sleep(0.5)
+    update_progress = client.get(update["Location"] + "?format=json", HTTP_HOST="localhost").json()
+
+emit({
+    "status_code": response.status_code,
+    "request_time": request_time,
+    "progress": progress,
+    "num_snapshots": len(snapshot_ids),
+    "update_progress": update_progress,
+})
+'''
+
+def test_add_and_admin_actions_run_as_background_tasks(process, disable_extractors_dict):
+    env = {**disable_extractors_dict, "USE_SEARCHING_BACKEND": "false"}
+    output = run_shell_script(ADD_TASK_SCRIPT, env=env)
+
+    assert output["status_code"] == 302
+    assert output["request_time"] < 5
+    assert output["progress"]["status"] == "succeeded"
+    assert "example.com" in output["progress"]["output"]
+    assert output["num_snapshots"] == 1
+
+    update_progress = output["update_progress"]
+    assert update_progress["status"] == "succeeded"
+    assert (update_progress["num_done"], update_progress["num_total"]) == (1, 1)
+
+
+SINGLE_RUNNER_SCRIPT = '''
+import time
+from core.models import Task
+from core.tasks import enqueue_task
+
+tasks = [enqueue_task("add", urls="http://127.0.0.1:8080/static/example.com.html#%s" % i, depth=0) for i in range(4)]
+started = time.monotonic()
+while Task.objects.exclude(status__in=("succeeded", "failed")).exists() and time.monotonic() - started < 120:
+    time.sleep(0.5)
+
+tasks = Task.objects.filter(pk__in=[task.pk for task in tasks]).order_by("started")
+emit([[task.status, task.pid, task.started.isoformat(), task.finished.isoformat()] for task in tasks])
+'''
+
+def test_enqueued_tasks_share_one_runner(process, disable_extractors_dict):
+    env = {**disable_extractors_dict, "USE_SEARCHING_BACKEND": "false"}
+    tasks = run_shell_script(SINGLE_RUNNER_SCRIPT, env=env)
+
+    assert [status for status, *_ in tasks] == ["succeeded"] * 4
+    # a single runner process ran them all, one after the other
+    assert len({pid for _, pid, *_ in tasks}) == 1
+    for (*_, previous_finished), (_, _, started, _) in zip(tasks, tasks[1:]):
+        assert started >= previous_finished
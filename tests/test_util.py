@@ -7,4 +7,24 @@ def test_download_url_downloads_content():
 def test_download_url_gets_encoding_from_body():
     text = util.download_url("http://127.0.0.1:8080/static_no_content_type/shift_jis.html")
     assert "鹿児島のニュース｜MBC南日本放送" in text
-    assert "掲載された全ての記事・画像等の無断転載、二次利用をお断りいたします" in text
\ No newline at end of file
+    assert "掲載された全ての記事・画像等の無断転載、二次利用をお断りいたします" in text
+
+def test_enforce_types_rejects_wrong_arg_types():
+    @util.enforce_types
+    def func(a: str, b: int=0) -> str:
+        return a * b
+
+    assert func('x', b=2) == 'xx'
+    try:
+        func('x', b='2')
+    except TypeError as err:
+        assert 'b: int' in str(err)
+    else:
+        raise AssertionError('enforce_types did not reject b="2"')
+
+def test_regex_literals_only_returns_required_substrings():
+    assert util.regex_literals(r'^https?://(www\.)?example\.com/\d+') == ['http', '://', 'example.com/']
+    assert util.regex_literals(r'http(s)?:\/\/(.+\.)?(example\d\.com)') == ['http', '://', 'example', '.com']
+    assert util.regex_literals(r'(abc)+x') == ['abc']
+    assert util.regex_literals(r'abc|def') == []
+    assert util.regex_literals(r'.*') == []